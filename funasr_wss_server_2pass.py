@@ -6,15 +6,30 @@ FunASR WebSocket Server - 2-Pass 实时流式语音识别服务
 """
 
 import asyncio
+import functools
 import websockets
 import json
 import logging
-import tempfile
-import os
 import base64
+import os
+import sys
+import time
 import traceback
-from funasr import AutoModel
-import numpy as np
+
+# 公共模块位于 websocket-demo/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'websocket-demo'))
+from audio_utils import pcm16_to_float32, result_text
+from audio_buffer import AudioBuffer
+from resampler import StreamingResampler
+from inference_executor import InferenceExecutor
+from batch_scheduler import BatchScheduler
+from ingest_queue import IngestQueue, WS_MAX_MESSAGE_BYTES, WS_MAX_QUEUE
+from partial_stabilizer import PartialStabilizer
+from punctuation import IncrementalPunctuator, PUNC_MODEL, PUNC_MODEL_REVISION
+from worker_pool import WSS_WORKERS, run_workers, tracked, worker_state
+from model_loader import load_models, warmup_audio
+from model_backends import load_model, MODEL_BACKEND, MODEL_QUANTIZE, ASR, ASR_ONLINE, VAD_ONLINE, PUNC_REALTIME
+from readiness import Readiness, READY, FAILED
 
 # 配置日志
 logging.basicConfig(
@@ -24,65 +39,186 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # 全局模型实例
-asr_model = None
+asr_model = None         # 离线模型：VAD 分段结束后对整段重新识别
+asr_online_model = None  # 流式模型：按步长输出低延迟的中间结果
 vad_model = None
-punc_model = None
+punc_model = None        # 实时标点模型：每个会话携带 cache，只处理新分段
+
+# 流式解码配置（与参考代码 asr() 中的分块参数一致）
+STREAMING_CONFIG = {
+    'chunk_size': [0, 10, 5],        # [0, 10, 5] 600ms, [5, 10, 5] 600ms, [8, 8, 4] 480ms
+    'encoder_chunk_look_back': 4,    # 编码器回看的 chunk 数
+    'decoder_chunk_look_back': 1,    # 解码器回看的 chunk 数
+    'sample_rate': 16000,
+}
+
+# 每次送入模型的步长：chunk_size[1] * 60ms = 960 个采样点 * chunk_size[1]
+STRIDE_SAMPLES = STREAMING_CONFIG['chunk_size'][1] * 960
+STRIDE_BYTES = STRIDE_SAMPLES * 2  # 16-bit PCM
+
+# 推理执行器：模型调用都在这里执行，事件循环只做 I/O
+inference = InferenceExecutor()
+
+# 服务就绪状态：单进程时端口先打开，模型在后台加载；标点为可选模型，不阻塞识别
+readiness = Readiness(required=('vad', 'asr_online', 'asr_offline'), optional=('punc',))
+
+# 语音起点之前保留的音频，VAD 报告的起点通常略早于检测到语音的时刻
+PREROLL_BYTES = STREAMING_CONFIG['sample_rate'] * 2  # 1 秒
+
+
+def _model_loader(model, kind, revision="v2.0.4", **kwargs):
+    """按 MODEL_BACKEND（torch / onnx）加载模型"""
+    return lambda: load_model(model, kind=kind, revision=revision, **kwargs)
+
+
+def warmup_vad(model):
+    """按服务中的步长喂两段流式音频"""
+    cache = {}
+    chunk_ms = STRIDE_SAMPLES * 1000 // STREAMING_CONFIG['sample_rate']
+    for is_final in (False, True):
+        model.generate(input=warmup_audio(chunk_ms / 1000), cache=cache,
+                       is_final=is_final, chunk_size=chunk_ms)
+
+
+def warmup_online_asr(model):
+    """按流式配置解码两个步长"""
+    cache = {}
+    for is_final in (False, True):
+        model.generate(
+            input=warmup_audio(STRIDE_SAMPLES / STREAMING_CONFIG['sample_rate']),
+            cache=cache,
+            is_final=is_final,
+            chunk_size=STREAMING_CONFIG['chunk_size'],
+            encoder_chunk_look_back=STREAMING_CONFIG['encoder_chunk_look_back'],
+            decoder_chunk_look_back=STREAMING_CONFIG['decoder_chunk_look_back'],
+        )
+
+
+def warmup_offline_asr(model):
+    """用短、中两种长度的分段做一次批量识别"""
+    model.generate(input=[warmup_audio(1), warmup_audio(5, seed=1)], batch_size=2, hotword='')
+
+
+def warmup_punc(model):
+    model.generate(input="今天天气不错我们出去走走吧", cache={})
+
+
+def _on_model_loaded(name, model):
+    """每个模型加载完成后立即生效，不必等其他模型"""
+    global asr_model, asr_online_model, vad_model, punc_model
+    
+    if name == 'vad':
+        vad_model = model
+    elif name == 'asr_online':
+        asr_online_model = model
+    elif name == 'asr_offline':
+        asr_model = model
+    elif name == 'punc':
+        punc_model = model
+    
+    readiness.mark(name, READY if model is not None else FAILED)
+    if readiness.ready and name in readiness.required:
+        logger.info(f"🟢 识别模型就绪，开始处理会话（启动后 {readiness.status()['load_s']:.2f}s）")
+
 
 def initialize_models():
-    """初始化 FunASR 模型（VAD + ASR + 标点）"""
-    global asr_model, vad_model, punc_model
+    """并行加载 FunASR 模型（VAD + 流式 ASR + 离线 ASR + 标点）并预热"""
+    logger.info("🔄 开始并行加载 FunASR 模型...")
+    specs = [
+        # VAD 模型（语音端点检测）
+        {'name': 'vad', 'load': _model_loader("fsmn-vad", VAD_ONLINE), 'warmup': warmup_vad},
+        # 流式 ASR 模型（第一遍：支持 cache 的分块增量解码）
+        {'name': 'asr_online',
+         'load': _model_loader("paraformer-zh-streaming", ASR_ONLINE, chunk_size=STREAMING_CONFIG['chunk_size']),
+         'warmup': warmup_online_asr},
+        # 离线 ASR 模型（第二遍：分段结束后纠正结果）
+        {'name': 'asr_offline', 'load': _model_loader("paraformer-zh", ASR), 'warmup': warmup_offline_asr},
+        # 实时标点恢复模型（可选，加载完成前分段不加标点）
+        {'name': 'punc', 'load': _model_loader(PUNC_MODEL, PUNC_REALTIME, PUNC_MODEL_REVISION), 'warmup': warmup_punc,
+         'optional': True},
+    ]
     
     try:
-        logger.info("🔄 开始加载 FunASR 模型...")
-        
-        # 1. 加载 VAD 模型（语音端点检测）
-        logger.info("📥 加载 VAD 模型...")
-        vad_model = AutoModel(
-            model="fsmn-vad",
-            model_revision="v2.0.4",
-            device="cpu",
-            disable_update=True,
-        )
-        logger.info("✅ VAD 模型加载完成")
-        
-        # 2. 加载 ASR 模型（语音识别）
-        logger.info("📥 加载 Paraformer ASR 模型...")
-        asr_model = AutoModel(
-            model="paraformer-zh",
-            model_revision="v2.0.4",
-            device="cpu",
-            disable_update=True,
-        )
-        logger.info("✅ ASR 模型加载完成")
-        
-        # 3. 加载标点恢复模型
-        logger.info("📥 加载标点恢复模型...")
-        punc_model = AutoModel(
-            model="ct-punc",
-            model_revision="v2.0.4",
-            device="cpu",
-            disable_update=True,
-        )
-        logger.info("✅ 标点恢复模型加载完成")
-        
-        logger.info("🎉 所有模型加载完成！")
-        return True
-        
+        load_models(specs, on_loaded=_on_model_loaded)
     except Exception as e:
         logger.error(f"❌ 模型加载失败: {e}")
         traceback.print_exc()
+        readiness.set_failed(e)
         return False
+    
+    logger.info("🎉 所有模型加载完成！")
+    return True
+
+
+def recognize_segments(segments):
+    """第二遍：离线模型对多个会话的分段做一次批量识别"""
+    texts = [""] * len(segments)
+    indices = [i for i, pcm in enumerate(segments) if len(pcm) >= 2]
+    
+    if indices:
+        results = asr_model.generate(
+            input=[pcm16_to_float32(segments[i]) for i in indices],
+            batch_size=len(indices),
+            hotword='',
+        )
+        for i, result in zip(indices, results or []):
+            texts[i] = result.get('text', '')
+    return texts
+
+
+# 跨会话合并离线识别请求
+segment_scheduler = BatchScheduler(recognize_segments, inference, name='offline_asr')
 
 
 class StreamingSession:
-    """流式识别会话"""
+    """流式识别会话
+    
+    第一遍：流式模型按步长增量解码，推送 partial_result；
+    第二遍：VAD 判定分段结束后，离线模型 + 标点对整段重新识别，推送 segment_result。
+    """
     
     def __init__(self, websocket, client_id):
         self.websocket = websocket
         self.client_id = client_id
-        self.audio_buffer = []
+        self.audio_buffer = AudioBuffer()  # 尚未送入模型的 PCM（不足一个步长）
+        self.segment_audio = AudioBuffer(capacity=PREROLL_BYTES * 8)  # 当前分段的音频，供离线模型重新识别
+        self.segment_offset = 0            # segment_audio[0] 对应的绝对采样点
+        self.samples_seen = 0              # 已送入 VAD 的采样点总数
+        self.in_speech = False
+        self.asr_cache = {}                # 流式解码器状态，跨分片保留
+        self.vad_cache = {}                # 流式 VAD 状态，跨分片保留
+        self.online_text = ""              # 当前分段的流式文本
+        self.final_text = ""               # 已完成分段的离线识别结果（稳定前缀）
+        self.stabilizer = PartialStabilizer()
+        self.punctuator = IncrementalPunctuator(provider=lambda: punc_model)
+        self.partial_mode = "full"         # full：发送完整文本；delta：只发送增量
+        self.total_strides = 0             # 已处理的步长数
+        self.voiced_strides = 0            # 其中送入流式 ASR 的步长数
         self.is_streaming = False
-        self.sample_rate = 16000
+        self.sample_rate = STREAMING_CONFIG['sample_rate']
+        # 客户端原生采样率 → 16kHz，收包时转换，跨分片保留滤波器状态
+        self.resampler = StreamingResampler(self.sample_rate)
+    
+    def set_input_rate(self, rate):
+        """客户端在 start 消息中声明的采样率（默认 16kHz）"""
+        self.resampler = StreamingResampler(int(rate or self.sample_rate), self.sample_rate)
+    
+    def reset(self):
+        """重置会话的解码状态"""
+        self.audio_buffer.clear()
+        self.segment_audio.clear()
+        self.segment_offset = 0
+        self.samples_seen = 0
+        self.in_speech = False
+        self.asr_cache = {}
+        self.vad_cache = {}
+        self.online_text = ""
+        self.final_text = ""
+        self.stabilizer.reset()
+        self.punctuator.reset()
+        self.total_strides = 0
+        self.voiced_strides = 0
+        self.resampler.reset()
         
     async def send_message(self, msg_type, data=None, text=""):
         """发送消息到客户端"""
@@ -97,103 +233,171 @@ class StreamingSession:
         except Exception as e:
             logger.error(f"发送消息失败: {e}")
     
-    async def process_audio_chunk(self, audio_data):
-        """处理音频分片 - 2-Pass 识别"""
+    def decode_stride(self, pcm_bytes, is_final=False):
+        """用会话 cache 解码一个步长的音频，返回该步长新增的文本"""
+        result = asr_online_model.generate(
+            input=pcm16_to_float32(pcm_bytes),
+            cache=self.asr_cache,
+            is_final=is_final,
+            chunk_size=STREAMING_CONFIG['chunk_size'],
+            encoder_chunk_look_back=STREAMING_CONFIG['encoder_chunk_look_back'],
+            decoder_chunk_look_back=STREAMING_CONFIG['decoder_chunk_look_back'],
+        )
+        return result_text(result)
+    
+    def detect_segments(self, pcm_bytes, is_final=False):
+        """流式 VAD，返回本步长内的 (起点ms, 终点ms) 事件列表，-1 表示未出现"""
+        if vad_model is None:
+            return []
+        
+        chunk_ms = len(pcm_bytes) // 2 * 1000 // self.sample_rate
+        result = vad_model.generate(
+            input=pcm16_to_float32(pcm_bytes),
+            cache=self.vad_cache,
+            is_final=is_final,
+            chunk_size=chunk_ms,
+        )
+        if result and len(result) > 0:
+            return result[0].get('value', [])
+        return []
+    
+    def current_text(self):
+        """已完成分段的最终文本 + 当前分段的流式文本"""
+        return self.final_text + self.online_text
+    
+    async def send_partial(self):
+        """文本变化时才发送中间结果；delta 模式只发送新提交的部分与尾部"""
+        delta = self.stabilizer.update(self.current_text(), stable_prefix=self.final_text)
+        if delta is None:
+            return
+        
+        if self.partial_mode == "delta":
+            await self.send_message("partial_delta", text=delta['tail'], data={
+                "offset": delta['offset'],
+                "committed": delta['committed'],
+                "tail": delta['tail'],
+            })
+        else:
+            await self.send_message("partial_result", text=delta['text'])
+        logger.info(f"🎤 实时识别: {self.online_text}")
+    
+    async def close_segment(self, end_sample):
+        """分段结束：离线重新识别该分段并重置流式状态"""
+        cut = max(0, (end_sample - self.segment_offset) * 2)
+        segment = self.segment_audio.peek(cut).tobytes()
+        self.segment_audio.consume(cut)
+        self.segment_offset = max(self.segment_offset, end_sample)
+        
+        text = await segment_scheduler.submit(segment)
+        if text:
+            # 只对新分段加标点，前文上下文保存在会话的标点 cache 中
+            text = await inference.run_stateful(self.punctuator.punctuate, text)
+            self.final_text += text
+            await self.send_message("segment_result", text=text)
+            logger.info(f"📝 分段识别: {text}")
+        
+        # 下一个分段重新开始流式解码
+        self.asr_cache = {}
+        self.online_text = ""
+    
+    async def process_stride(self, stride, is_final=False, skip_online=False):
+        """处理一个步长：VAD 分段，只有语音帧才送入流式模型
+        
+        skip_online 为 True 时（会话积压）跳过流式解码，分段终稿不受影响。
+        """
+        self.segment_audio.write(stride)
+        segments = await inference.run_stateful(self.detect_segments, stride, is_final=is_final)
+        self.samples_seen += len(stride) // 2
+        self.total_strides += 1
+        
+        speech_started = False
+        for beg_ms, end_ms in segments:
+            if beg_ms != -1:
+                self.in_speech = True
+                speech_started = True
+                start_sample = beg_ms * self.sample_rate // 1000
+                cut = max(0, (start_sample - self.segment_offset) * 2)
+                self.segment_audio.consume(cut)
+                self.segment_offset = max(self.segment_offset, start_sample)
+                await self.send_message("speech_start", data={"time_ms": beg_ms})
+            if end_ms != -1:
+                self.in_speech = False
+                speech_started = False
+                await self.send_message("speech_end", data={"time_ms": end_ms})
+                await self.close_segment(end_ms * self.sample_rate // 1000)
+        
+        text = ""
+        # 停止时的冲刷步长由离线模型覆盖，无需再做流式解码
+        if (self.in_speech or vad_model is None) and skip_online:
+            # 跳过的音频不再连续，流式解码从下一步长重新开始
+            self.asr_cache = {}
+        elif (self.in_speech or vad_model is None) and not is_final:
+            # 刚检测到起点时，把起点之后已缓存的音频一并送入流式模型
+            voiced = self.segment_audio.view() if speech_started else stride
+            self.voiced_strides += 1
+            text = await inference.run_stateful(self.decode_stride, voiced)
+            if text:
+                self.online_text += text
+        
+        # 静音期间只保留一小段预卷音频
+        if vad_model and not self.in_speech and len(self.segment_audio) > PREROLL_BYTES:
+            cut = len(self.segment_audio) - PREROLL_BYTES
+            self.segment_audio.consume(cut)
+            self.segment_offset += cut // 2
+        
+        return bool(text)
+    
+    async def process_audio_chunk(self, audio_data, drop_partials=False):
+        """处理音频分片 - 仅处理新到达的步长，不重复解码历史音频"""
         try:
-            # 添加到缓冲区
-            self.audio_buffer.append(audio_data)
+            self.audio_buffer.write(self.resampler.process_pcm16(audio_data))
             
-            # Pass 1: VAD 检测（检查是否有语音）
-            if vad_model:
-                # VAD 检测需要完整的音频片段，这里简化处理
-                combined_audio = b''.join(self.audio_buffer)
-                
-                # 如果缓冲区足够大，进行识别
-                if len(combined_audio) > 8000:  # 约 0.5 秒的音频
-                    # 保存临时音频文件
-                    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                        tmp_path = tmp_file.name
-                        tmp_file.write(combined_audio)
-                    
-                    try:
-                        # Pass 2: ASR 识别
-                        result = asr_model.generate(
-                            input=tmp_path,
-                            batch_size_s=300,
-                            hotword='',
-                        )
-                        
-                        if result and len(result) > 0:
-                            text = result[0]['text']
-                            
-                            # Pass 3: 标点恢复
-                            if punc_model and text:
-                                punc_result = punc_model.generate(input=text)
-                                if punc_result and len(punc_result) > 0:
-                                    text = punc_result[0]['text']
-                            
-                            # 发送识别结果（实时结果）
-                            if text.strip():
-                                await self.send_message("partial_result", text=text)
-                                logger.info(f"🎤 实时识别: {text}")
-                    
-                    finally:
-                        # 清理临时文件
-                        if os.path.exists(tmp_path):
-                            os.unlink(tmp_path)
+            updated = False
+            while len(self.audio_buffer) >= STRIDE_BYTES:
+                stride = self.audio_buffer.read(STRIDE_BYTES)
+                updated = await self.process_stride(stride, skip_online=drop_partials) or updated
+            
+            # 发送识别结果（实时结果）
+            if updated and self.online_text.strip():
+                await self.send_partial()
         
         except Exception as e:
             logger.error(f"处理音频分片失败: {e}")
             traceback.print_exc()
     
     async def finalize_recognition(self):
-        """完成识别 - 返回最终结果"""
+        """完成识别 - 冲刷剩余音频，结束最后一个分段并返回最终结果"""
         try:
-            if not self.audio_buffer:
-                await self.send_message("final_result", text="")
-                return
+            # 重采样器中剩余的样本，以及不足一个步长的音频，以 is_final=True 送入，冲刷 VAD 与解码器
+            self.audio_buffer.write(self.resampler.process_pcm16(b'', final=True))
+            remaining = self.audio_buffer.read(len(self.audio_buffer) // 2 * 2)
+            self.audio_buffer.clear()
+            await self.process_stride(remaining, is_final=True)
             
-            # 合并所有音频
-            combined_audio = b''.join(self.audio_buffer)
+            # 客户端停止时仍未闭合的分段
+            if self.in_speech or (vad_model is None and len(self.segment_audio)):
+                self.in_speech = False
+                await self.close_segment(self.samples_seen)
             
-            # 保存临时文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-                tmp_file.write(combined_audio)
+            text = self.final_text
             
-            try:
-                # 完整识别
-                result = asr_model.generate(
-                    input=tmp_path,
-                    batch_size_s=300,
-                    hotword='',
+            if self.total_strides:
+                logger.info(
+                    f"📊 客户端 {self.client_id} 语音步长 {self.voiced_strides}/{self.total_strides}，"
+                    f"静音跳过 {self.total_strides - self.voiced_strides} 次 ASR"
                 )
-                
-                if result and len(result) > 0:
-                    text = result[0]['text']
-                    
-                    # 标点恢复
-                    if punc_model and text:
-                        punc_result = punc_model.generate(input=text)
-                        if punc_result and len(punc_result) > 0:
-                            text = punc_result[0]['text']
-                    
-                    # 发送最终结果
-                    await self.send_message("final_result", text=text)
-                    logger.info(f"✅ 最终识别: {text}")
-                else:
-                    await self.send_message("final_result", text="")
             
-            finally:
-                # 清理
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
-                self.audio_buffer.clear()
+            # 发送最终结果
+            await self.send_message("final_result", text=text)
+            if text:
+                logger.info(f"✅ 最终识别: {text}")
         
         except Exception as e:
             logger.error(f"完成识别失败: {e}")
             traceback.print_exc()
             await self.send_message("error", text=f"识别失败: {str(e)}")
+        finally:
+            self.reset()
 
 
 async def handle_client(websocket, path):
@@ -203,15 +407,38 @@ async def handle_client(websocket, path):
     
     session = StreamingSession(websocket, client_id)
     
+    # 模型尚未就绪：先告知客户端，等待一段时间，仍未就绪则礼貌地拒绝
+    if not readiness.ready:
+        await session.send_message("status", data=readiness.status(), text="模型加载中，请稍候")
+        if not await readiness.wait():
+            logger.warning(f"⏳ 客户端 {client_id} 等待模型就绪超时，拒绝连接")
+            await session.send_message("error", data=readiness.status(), text="服务尚未就绪，请稍后重试")
+            await websocket.close(code=1013, reason="models loading")
+            return
+    
+    async def flow_control(action, stats):
+        await session.send_message("flow_control", data=dict(stats, action=action))
+        logger.warning(f"🚦 客户端 {client_id} {action}: 积压 {stats['queued_bytes']} 字节")
+    
+    # 读协程只负责收包，本协程按顺序处理；积压过多时读协程暂停
+    ingest = IngestQueue(notify=flow_control)
+    reader = asyncio.create_task(ingest.feed_from(websocket))
+    
     try:
         await session.send_message("connected", text="连接成功")
         
-        async for message in websocket:
+        while True:
+            message = await ingest.get()
+            if message is None:
+                break
+            
             try:
                 # 处理二进制音频数据
-                if isinstance(message, bytes):
+                if not isinstance(message, str):
                     if session.is_streaming:
-                        await session.process_audio_chunk(message)
+                        await session.process_audio_chunk(
+                            message, drop_partials=ingest.should_drop_partials()
+                        )
                     continue
                 
                 # 处理 JSON 控制消息
@@ -221,9 +448,11 @@ async def handle_client(websocket, path):
                 if msg_type == "start":
                     # 开始流式识别
                     session.is_streaming = True
-                    session.audio_buffer.clear()
+                    session.set_input_rate(data.get("sample_rate") or data.get("sampleRate"))
+                    session.reset()
+                    session.partial_mode = data.get("partial_mode", "full")
                     await session.send_message("started", text="开始识别")
-                    logger.info(f"🎤 客户端 {client_id} 开始流式识别")
+                    logger.info(f"🎤 客户端 {client_id} 开始流式识别（{session.resampler.in_rate}Hz）")
                 
                 elif msg_type == "stop":
                     # 停止识别并返回最终结果
@@ -235,6 +464,15 @@ async def handle_client(websocket, path):
                     # 心跳检测
                     await session.send_message("pong")
                 
+                elif msg_type == "stats":
+                    # 批处理统计（批大小 / 排队等待直方图）与本会话的收包队列深度
+                    await session.send_message("stats", data={
+                        "batching": segment_scheduler.stats(),
+                        "ingest": ingest.stats(),
+                        "worker": worker_state,
+                        "readiness": readiness.status(),
+                    })
+                
                 else:
                     logger.warning(f"未知消息类型: {msg_type}")
             
@@ -250,13 +488,34 @@ async def handle_client(websocket, path):
         logger.error(f"客户端 {client_id} 处理失败: {e}")
         traceback.print_exc()
     finally:
-        logger.info(f"🔌 客户端 {client_id} 断开连接")
+        reader.cancel()
+        logger.info(f"🔌 客户端 {client_id} 断开连接，收包队列峰值 {ingest.peak_bytes} 字节")
+
+
+async def serve(host, port, reuse_port=False):
+    """在当前进程中运行 WebSocket 服务"""
+    async with websockets.serve(tracked(handle_client), host, port,
+                                max_size=WS_MAX_MESSAGE_BYTES, max_queue=WS_MAX_QUEUE,
+                                reuse_port=reuse_port):
+        logger.info(f"✅ 服务器启动成功！（启动后 {(time.time() - readiness.started) * 1000:.0f}ms 开始接受连接）")
+        
+        if not readiness.ready:
+            # 端口已打开，模型在后台加载；加载期间到达的会话等待就绪
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(None, initialize_models):
+                logger.error("❌ 模型初始化失败，服务器停止")
+                return
+        
+        await asyncio.Future()  # 保持运行
 
 
-async def main():
-    """启动 WebSocket 服务器"""
-    # 初始化模型
-    if not initialize_models():
+def main():
+    """启动 WebSocket 服务器
+
+    单进程时立即绑定端口，模型在后台加载；WSS_WORKERS > 1 时先在父进程加载模型，
+    fork 出的 worker 共享已加载的模型。
+    """
+    if WSS_WORKERS > 1 and not initialize_models():
         logger.error("❌ 模型初始化失败，服务器无法启动")
         return
     
@@ -266,16 +525,20 @@ async def main():
     
     logger.info(f"🚀 FunASR WebSocket Server 启动中...")
     logger.info(f"📡 监听地址: ws://{host}:{port}")
-    logger.info(f"🎯 2-Pass 流程: VAD → ASR → Punctuation")
+    logger.info(f"🎯 2-Pass 流程: 流式 ASR（实时） + VAD 分段 → 离线 ASR → Punctuation（分段终稿）")
+    logger.info(f"🧵 推理执行器: {inference.describe()}")
+    logger.info(f"🧠 推理后端: {MODEL_BACKEND}" + ("（int8 量化）" if MODEL_QUANTIZE else ""))
+    logger.info(f"📦 离线识别批处理: 每批最多 {segment_scheduler.max_batch_size} 条，"
+                f"最长等待 {segment_scheduler.max_wait * 1000:.0f}ms")
+    logger.info(f"⏱️  流式步长: {STRIDE_SAMPLES * 1000 // STREAMING_CONFIG['sample_rate']}ms")
+    logger.info(f"👷 Worker 进程数: {WSS_WORKERS}")
     
-    async with websockets.serve(handle_client, host, port, max_size=10*1024*1024):
-        logger.info("✅ 服务器启动成功！")
-        await asyncio.Future()  # 保持运行
+    run_workers(functools.partial(serve, host, port))
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         logger.info("⏹️  服务器已停止")
     except Exception as e:
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 Paraformer 语音识别服务 (部署在 F 盘)
-使用 ModelScope 的 Paraformer-large ONNX 在线流式模型
+使用 ModelScope 的 Paraformer-zh 离线模型（PyTorch 推理；ONNX 后端见 websocket-demo/model_backends.py）
 """
 
 from funasr import AutoModel
@@ -13,7 +13,7 @@ def initialize_model():
     """初始化 Paraformer 模型"""
     print("=" * 70)
     print("正在加载 Paraformer Large ASR 模型...")
-    print("模型: paraformer-zh (ONNX 优化版本)")
+    print("模型: paraformer-zh (PyTorch)")
     print("=" * 70)
     
     try:
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话级 PCM 音频缓冲区
+
+预分配 bytearray，写入只拷贝新到达的字节，读取返回 memoryview（零拷贝）。
+写指针到达末尾时把未读数据搬回开头，空间不足时按倍数扩容，
+单字节的摊还开销为 O(1)，不会随着语音变长而出现 bytes 拼接的平方级拷贝。
+"""
+
+
+class AudioBuffer:
+    """先进先出的 PCM 字节缓冲区
+
+    既可作为收包缓冲（write / read 定长帧），也可作为当前语音段的存储
+    （write 追加，view 取整段连续视图，consume 丢弃开头）。
+    返回的 memoryview 在下一次 write 之前有效。
+    """
+
+    def __init__(self, capacity=64 * 1024):
+        self._buf = bytearray(capacity)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def write(self, data):
+        """追加字节（bytes / bytearray / memoryview）"""
+        n = len(data)
+        if self._end + n > len(self._buf):
+            self._make_room(n)
+        self._buf[self._end:self._end + n] = data
+        self._end += n
+
+    def _make_room(self, n):
+        size = len(self)
+        if size + n <= len(self._buf) // 2:
+            # 未读数据较少：搬到开头即可
+            self._buf[0:size] = self._buf[self._start:self._end]
+        else:
+            # 扩容，保证下一次搬移前至少有一半空闲
+            capacity = len(self._buf) * 2
+            while capacity < (size + n) * 2:
+                capacity *= 2
+            new_buf = bytearray(capacity)
+            new_buf[0:size] = self._buf[self._start:self._end]
+            self._buf = new_buf
+        self._start = 0
+        self._end = size
+
+    def peek(self, n=None):
+        """返回开头 n 个字节的视图（不消费），n 为空时返回全部"""
+        if n is None or n > len(self):
+            n = len(self)
+        return memoryview(self._buf)[self._start:self._start + n]
+
+    def view(self):
+        """当前全部内容的连续视图"""
+        return self.peek()
+
+    def consume(self, n):
+        """丢弃开头 n 个字节"""
+        self._start += min(max(n, 0), len(self))
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def read(self, n):
+        """取出开头 n 个字节，返回视图"""
+        frame = self.peek(n)
+        self.consume(len(frame))
+        return frame
+
+    def keep_tail(self, n):
+        """只保留末尾 n 个字节"""
+        self.consume(len(self) - n)
+
+    def tobytes(self):
+        return self.view().tobytes()
+
+    def clear(self):
+        self._start = self._end = 0
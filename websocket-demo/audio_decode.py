@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内音频解码
+
+上传的 WebM/Opus、OGG、MP3、M4A、WAV 直接在内存中解码为 16kHz 单声道 float32，
+不写临时文件，也不为每个请求启动一次 ffmpeg。先按文件头确定格式（audio_sniff），
+无法识别的输入直接拒绝；WAV / 裸 PCM 由标准库解析，其余格式按顺序尝试：
+
+    pyav       PyAV（libav 绑定），支持所有常见容器与编码，解码时直接重采样到 16kHz 单声道
+    soundfile  libsndfile，支持 WAV / OGG / FLAC，libsndfile >= 1.1 也支持 MP3
+    torchaudio torchaudio.load 的内存解码
+    ffmpeg     以上都失败时交给 ffmpeg 转码进程池，经 stdin / stdout 管道交换数据
+
+pyav / soundfile 是可选依赖，未安装时跳过。
+
+环境变量：
+    AUDIO_DECODERS          按顺序尝试的解码器（默认 pyav,soundfile,torchaudio,ffmpeg）
+    FFMPEG_PATH             ffmpeg 可执行文件（默认在 PATH 与 Scoop 中查找）
+    FFMPEG_TIMEOUT_S        单次 ffmpeg 转码的超时秒数（默认 30）
+    FFMPEG_POOL_SIZE        同时运行的 ffmpeg 转码上限（默认 4）
+    FFMPEG_POOL_SPARES      预先启动、等待输入的 ffmpeg 进程数（默认 1）
+    FFMPEG_IDLE_S           空闲多少秒后回收备用进程（默认 300，0 表示不回收）
+    FFMPEG_QUEUE_TIMEOUT_S  等待转码名额的最长秒数（默认 10）
+"""
+
+import collections
+import io
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from audio_sniff import (
+    sniff, normalize_hint, find_ebml_header, find_cluster, client_init_segment, WebmInitCache,
+    WEBM, WEBM_FRAGMENT, PCM
+)
+from audio_utils import pcm16_to_float32, wav_bytes_to_float32
+from model_registry import LatencyStats
+from resampler import resample
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DECODERS = [d.strip() for d in os.getenv("AUDIO_DECODERS", "pyav,soundfile,torchaudio,ffmpeg").split(',') if d.strip()]
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "")
+FFMPEG_TIMEOUT_S = float(os.getenv("FFMPEG_TIMEOUT_S", "30"))
+FFMPEG_POOL_SIZE = int(os.getenv("FFMPEG_POOL_SIZE", "4"))
+FFMPEG_POOL_SPARES = int(os.getenv("FFMPEG_POOL_SPARES", "1"))
+FFMPEG_IDLE_S = float(os.getenv("FFMPEG_IDLE_S", "300"))
+FFMPEG_QUEUE_TIMEOUT_S = float(os.getenv("FFMPEG_QUEUE_TIMEOUT_S", "10"))
+
+SAMPLE_RATE = 16000
+
+
+class AudioDecodeError(ValueError):
+    """所有解码器都无法解码该音频"""
+
+
+def to_mono_16k(audio, sample_rate):
+    """多声道取平均，多相滤波重采样到 16kHz"""
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return resample(audio, sample_rate, SAMPLE_RATE)
+
+
+def _decode_pyav(data, fmt):
+    import av
+
+    chunks = []
+    with av.open(io.BytesIO(data), mode='r') as container:
+        stream = next((s for s in container.streams if s.type == 'audio'), None)
+        if stream is None:
+            raise AudioDecodeError("no audio stream")
+        resampler = av.AudioResampler(format='flt', layout='mono', rate=SAMPLE_RATE)
+        try:
+            for frame in container.decode(stream):
+                for out in resampler.resample(frame):
+                    chunks.append(out.to_ndarray().reshape(-1))
+        except av.error.FFmpegError as e:
+            # 录音分片常在末尾被截断：保留已经解码出的部分
+            if not chunks:
+                raise
+            logger.debug(f"PyAV stopped early, keeping {sum(map(len, chunks))} samples: {e}")
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    return np.concatenate(chunks).astype(np.float32) if chunks else np.zeros(0, dtype=np.float32)
+
+
+def _decode_soundfile(data, fmt):
+    import soundfile
+
+    audio, sample_rate = soundfile.read(io.BytesIO(data), dtype='float32', always_2d=False)
+    return to_mono_16k(audio, sample_rate)
+
+
+def _decode_torchaudio(data, fmt):
+    import torchaudio
+
+    waveform, sample_rate = torchaudio.load(io.BytesIO(data), format=fmt or None)
+    return to_mono_16k(waveform.mean(dim=0).numpy(), sample_rate)
+
+
+def find_ffmpeg():
+    """ffmpeg 可执行文件路径，找不到时返回 None"""
+    if FFMPEG_PATH:
+        return FFMPEG_PATH if os.path.exists(FFMPEG_PATH) else shutil.which(FFMPEG_PATH)
+    found = shutil.which('ffmpeg')
+    if found:
+        return found
+    scoop_ffmpeg = os.path.expanduser("~/scoop/shims/ffmpeg.exe")
+    return scoop_ffmpeg if os.path.exists(scoop_ffmpeg) else None
+
+
+# 所有转码池，fork 后在子进程中逐个重置
+_pools = weakref.WeakSet()
+
+
+class FfmpegPool:
+    """
+    ffmpeg 转码进程池：stdin 写入原始字节，stdout 读出 16kHz 单声道 float32
+
+    ffmpeg 每个进程只处理一路输入，池中保持 spares 个已启动、等待输入的进程，
+    请求到来时直接取用，启动开销不落在请求路径上，用掉后在后台补足。
+    同时运行的转码不超过 max_size，排队超过 queue_timeout 秒直接失败；
+    单个任务超过 timeout 秒被杀掉；空闲超过 idle_s 秒后回收所有备用进程。
+    """
+
+    def __init__(self, path=None, max_size=FFMPEG_POOL_SIZE, spares=FFMPEG_POOL_SPARES,
+                 idle_s=FFMPEG_IDLE_S, timeout=FFMPEG_TIMEOUT_S, queue_timeout=FFMPEG_QUEUE_TIMEOUT_S):
+        self.path = path or find_ffmpeg()
+        self.max_size = max(1, max_size)
+        self.spares = min(spares, self.max_size)
+        self.idle_s = idle_s
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.busy = 0
+        self.spawned = 0
+        self.reaped = 0
+        self.latency = LatencyStats()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._spare = collections.deque()
+        self._last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._warming = False
+        self._reaper = None
+        _pools.add(self)
+
+    def _after_fork(self):
+        """
+        fork 出的子进程：父进程的备用 ffmpeg 不是子进程的子进程（无法 wait），管道也与父进程共用，
+        回收线程在子进程中不存在。丢弃这些状态（只关闭子进程这一侧的管道），之后按需重新预热。
+        """
+        for process in self._spare:
+            for pipe in (process.stdin, process.stdout, process.stderr):
+                if pipe is not None:
+                    pipe.close()
+            process.returncode = -1  # 不再 wait / kill 父进程的进程
+        self._spare = collections.deque()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        self._warming = False
+        self._reaper = None
+        self.busy = self.spawned = self.reaped = 0
+        self.latency = LatencyStats()
+
+    @property
+    def available(self):
+        return self.path is not None
+
+    def _spawn(self):
+        process = subprocess.Popen(
+            [self.path, '-hide_banner', '-loglevel', 'error',
+             '-i', 'pipe:0', '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 'f32le', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        with self._lock:
+            self.spawned += 1
+        return process
+
+    def warm(self):
+        """补足备用进程（启动时预热；请求结束后由 _refill 在后台调用）"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        self._fill()
+
+    def _refill(self):
+        """后台补足备用进程；已有补充线程在运行时什么也不做，保证同一时刻只有一个"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self._fill, name='ffmpeg-spawn', daemon=True).start()
+
+    def _fill(self):
+        # 调用方已置 _warming
+        try:
+            while True:
+                with self._lock:
+                    if len(self._spare) >= self.spares or len(self._spare) + self.busy >= self.max_size:
+                        break
+                try:
+                    process = self._spawn()
+                except OSError as e:
+                    logger.warning(f"Could not pre-spawn ffmpeg: {e}")
+                    break
+                with self._lock:
+                    self._spare.append(process)
+        finally:
+            with self._lock:
+                self._warming = False
+        self._start_reaper()
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None or self.idle_s <= 0:
+                return
+            self._reaper = threading.Thread(target=self._reap_idle, name='ffmpeg-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(max(1.0, min(self.idle_s / 2, 30.0)))
+            with self._lock:
+                if self.busy or time.monotonic() - self._last_used < self.idle_s:
+                    continue
+                idle, self._spare = list(self._spare), collections.deque()
+                self.reaped += len(idle)
+            for process in idle:
+                process.kill()
+                process.wait()
+            if idle:
+                logger.info(f"Reaped {len(idle)} idle ffmpeg workers")
+
+    def _take(self):
+        with self._lock:
+            self.busy += 1
+            self._last_used = time.monotonic()
+            while self._spare:
+                process = self._spare.popleft()
+                if process.poll() is None:
+                    return process
+        return self._spawn()
+
+    def decode(self, data):
+        if not self.available:
+            raise AudioDecodeError("ffmpeg not found")
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.latency.rejected += 1
+            raise AudioDecodeError(f"ffmpeg pool busy ({self.max_size} conversions running)")
+        wait_s = time.perf_counter() - start
+
+        ok = False
+        try:
+            process = self._take()
+            try:
+                out, err = process.communicate(data, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise AudioDecodeError(f"ffmpeg timed out after {self.timeout:.0f}s")
+            if process.returncode != 0:
+                raise AudioDecodeError(
+                    f"ffmpeg exit code {process.returncode}: {err.decode('utf-8', 'replace').strip()}"
+                )
+            ok = True
+            return np.frombuffer(out, dtype='<f4').astype(np.float32)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.busy -= 1
+                self._last_used = time.monotonic()
+                self.latency.record(time.perf_counter() - start - wait_s, wait_s)
+                if not ok:
+                    self.latency.errors += 1
+            # 名额已释放，busy 已更新，这里补足不会超过 max_size
+            self._refill()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.latency.summary(),
+                max_size=self.max_size,
+                busy=self.busy,
+                spare=len(self._spare),
+                spawned=self.spawned,
+                reaped=self.reaped,
+            )
+
+    def close(self):
+        with self._lock:
+            spare, self._spare = list(self._spare), collections.deque()
+        for process in spare:
+            process.kill()
+            process.wait()
+
+
+_ffmpeg = None
+_ffmpeg_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _ffmpeg_lock
+    _ffmpeg_lock = threading.Lock()
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+# 预加载后 fork 多进程（API_WORKERS > 1）时，父进程里已经预热的转码池不能直接沿用
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def ffmpeg_pool():
+    global _ffmpeg
+    with _ffmpeg_lock:
+        if _ffmpeg is None:
+            _ffmpeg = FfmpegPool()
+        return _ffmpeg
+
+
+def ffmpeg_stats():
+    """转码池的延迟与进程统计，尚未使用过 ffmpeg 时返回 None"""
+    return _ffmpeg.stats() if _ffmpeg is not None else None
+
+
+def _decode_ffmpeg(data, fmt):
+    return ffmpeg_pool().decode(data)
+
+
+_DECODERS = {
+    'pyav': _decode_pyav,
+    'soundfile': _decode_soundfile,
+    'torchaudio': _decode_torchaudio,
+    'ffmpeg': _decode_ffmpeg,
+}
+
+# 各解码器能处理的格式，None 表示不限
+DECODER_FORMATS = {
+    'soundfile': {'wav', 'ogg', 'flac', 'mp3'},
+}
+
+webm_init = WebmInitCache()
+
+
+def available_decoders():
+    """本机可用的解码器（按尝试顺序）"""
+    available = ['wav']
+    for name in AUDIO_DECODERS:
+        if name == 'ffmpeg':
+            if find_ffmpeg():
+                available.append(name)
+            continue
+        module = {'pyav': 'av'}.get(name, name)
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def identify(data, fmt=None, stream_id=None, init=None):
+    """
+    按文件头一次确定解码路径，返回 (data, 格式)
+
+    - 文件头可识别：以文件头为准，fmt 只是提示
+    - 提示为 pcm：除非是 WAV，按 16-bit 裸 PCM 处理（采样率由调用方给出）
+    - WebM 前面带有少量多余字节：从 EBML 头处截断
+    - 缺少初始化段的 WebM 分片：拼上同一 stream_id 之前保存的初始化段，本进程没有保存过时
+      用客户端随请求带上的 init，都没有则拒绝
+    - 其余情况直接拒绝，不交给任何解码器
+
+    Raises:
+        AudioDecodeError: 无法识别或无法修复
+    """
+    hint = normalize_hint(fmt)
+    detected = sniff(data)
+
+    if hint == PCM and detected != 'wav':
+        # 裸 PCM 的样本值可能恰好像某个魔数（如 MPEG 同步字），只有完整的 RIFF/WAVE 头优先于提示
+        return data, PCM
+    if detected is None and hint in (WEBM, None):
+        position = find_ebml_header(data)
+        if position > 0:
+            logger.info(f"Skipped {position} bytes before the WebM header")
+            data, detected = data[position:], WEBM
+        elif hint == WEBM:
+            # MediaRecorder 分片可能从 Cluster 中间开始：跳到下一个 Cluster
+            position = find_cluster(data)
+            if position >= 0:
+                data, detected = data[position:], WEBM_FRAGMENT
+
+    if detected == WEBM and stream_id:
+        webm_init.remember(stream_id, data)
+    elif detected == WEBM_FRAGMENT:
+        segment = webm_init.get(stream_id) if stream_id else None
+        if segment is None:
+            # 多进程部署时第一片可能由另一个 worker 处理过，只能用客户端带上的初始化段
+            segment = client_init_segment(init)
+            if segment is not None and stream_id:
+                webm_init.put(stream_id, segment)
+        if segment is None:
+            raise AudioDecodeError(
+                "WebM fragment without header: send the first MediaRecorder chunk"
+                + (" of this streamId, or include it as 'init'" if stream_id else " or the whole recording")
+            )
+        data, detected = segment + data, WEBM
+
+    if detected is None:
+        raise AudioDecodeError(
+            f"Unrecognised audio container (hint {hint or 'none'}, first bytes {bytes(data[:8]).hex() or 'empty'})"
+        )
+    return data, detected
+
+
+def decode_audio(data, fmt=None, stream_id=None, is_last=False, sample_rate=None, init=None):
+    """
+    把上传的音频字节解码为 16kHz 单声道 float32 数组
+
+    Args:
+        data: 音频字节
+        fmt: 容器格式提示（wav / pcm / webm / ogg / mp3 / m4a ...，可带前导点），
+            文件头能识别时以文件头为准
+        stream_id: 流式分片所属的流，用于拼接 WebM 初始化段
+        is_last: 该流的最后一片，解码后释放保存的初始化段
+        sample_rate: 裸 PCM 的采样率（默认 16kHz），其他格式以文件内的采样率为准
+        init: 客户端带上的 WebM 初始化段（或该流的第一片），本进程没有保存该流的初始化段时使用
+
+    Raises:
+        AudioDecodeError: 无法识别、无法修复或所有解码器都失败
+    """
+    try:
+        data, fmt = identify(data, fmt, stream_id, init)
+    finally:
+        if is_last and stream_id:
+            webm_init.forget(stream_id)
+
+    if fmt == PCM:
+        return resample(pcm16_to_float32(data), sample_rate or SAMPLE_RATE, SAMPLE_RATE)
+    if fmt == 'wav':
+        try:
+            return to_mono_16k(*wav_bytes_to_float32(data))
+        except Exception as e:
+            logger.debug(f"In-memory WAV decode failed, trying the decoders: {e}")
+
+    errors = []
+    for name in AUDIO_DECODERS:
+        decoder = _DECODERS.get(name)
+        formats = DECODER_FORMATS.get(name)
+        if decoder is None or (formats is not None and fmt not in formats):
+            continue
+        try:
+            return decoder(data, fmt)
+        except ImportError:
+            continue
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+    raise AudioDecodeError(f"Unable to decode {fmt} ({len(data)} bytes): " + "; ".join(errors or ['no decoder available']))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按文件头识别音频容器
+
+只看开头的几个字节（查表），一次决定解码路径；识别不了的输入直接拒绝，
+不再交给解码器和 ffmpeg 逐个试错。Content-Type / format 字段只作为提示，
+以文件头为准。
+
+MediaRecorder 的 WebM 分片只有第一片带 EBML 头与 Tracks（初始化段），
+之后的分片从 Cluster 开始，单独无法解码。WebmInitCache 按 streamId 保存
+第一片的初始化段，后续分片拼上它再解码。缓存只在本进程内有效：
+多进程部署（API_WORKERS > 1）时后续分片可能落到别的 worker，
+由客户端随分片带上初始化段（client_init_segment）。
+
+环境变量：
+    WEBM_INIT_CACHE_SIZE  最多保存多少个流的初始化段（默认 1024）
+    WEBM_INIT_TTL_S       初始化段在最后一次使用后保留的秒数（默认 600）
+"""
+
+import collections
+import os
+import threading
+import time
+
+WEBM_INIT_CACHE_SIZE = int(os.getenv("WEBM_INIT_CACHE_SIZE", "1024"))
+WEBM_INIT_TTL_S = float(os.getenv("WEBM_INIT_TTL_S", "600"))
+
+# 只在开头这么多字节内查找 EBML 头 / Cluster，保证 O(头部) 的开销
+HEADER_SCAN_BYTES = 4096
+
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+CLUSTER_ID = b'\x1f\x43\xb6\x75'
+
+WEBM = 'webm'
+WEBM_FRAGMENT = 'webm-fragment'  # 从 Cluster 开始、缺少初始化段的 WebM 分片
+PCM = 'pcm'
+
+# (格式, 偏移, 魔数, 掩码)：data[偏移:偏移+len(魔数)] & 掩码 == 魔数；按顺序匹配，先到先得
+MAGIC_TABLE = [
+    ('wav', 0, b'RIFF', None),
+    (WEBM, 0, EBML_MAGIC, None),
+    (WEBM_FRAGMENT, 0, CLUSTER_ID, None),
+    ('ogg', 0, b'OggS', None),
+    ('flac', 0, b'fLaC', None),
+    ('mp3', 0, b'ID3', None),
+    ('m4a', 4, b'ftyp', None),
+    ('amr', 0, b'#!AMR', None),
+    ('aac', 0, b'\xff\xf0', b'\xff\xf6'),  # ADTS：12 位同步字 + layer 00
+    ('mp3', 0, b'\xff\xe0', b'\xff\xe0'),  # MPEG 音频帧：11 位同步字
+]
+
+# RIFF 还要求第 8 字节起是 WAVE
+_SECONDARY = {'wav': (8, b'WAVE')}
+
+# Content-Type（去掉参数）→ 格式提示
+CONTENT_TYPES = {
+    'audio/wav': 'wav',
+    'audio/wave': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/vnd.wave': 'wav',
+    'audio/webm': WEBM,
+    'video/webm': WEBM,
+    'audio/ogg': 'ogg',
+    'audio/opus': 'ogg',
+    'audio/flac': 'flac',
+    'audio/x-flac': 'flac',
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/mp4': 'm4a',
+    'audio/x-m4a': 'm4a',
+    'audio/m4a': 'm4a',
+    'audio/aac': 'aac',
+    'audio/amr': 'amr',
+    'audio/l16': PCM,
+    'audio/pcm': PCM,
+    'audio/raw': PCM,
+}
+
+PCM_FORMATS = ('pcm', 'raw', 's16le', 'l16')
+
+
+def _matches(data, offset, magic, mask):
+    window = data[offset:offset + len(magic)]
+    if len(window) < len(magic):
+        return False
+    if mask is None:
+        return window == magic
+    return all((b & m) == v for b, m, v in zip(window, mask, magic))
+
+
+def sniff(data):
+    """按 MAGIC_TABLE 识别容器格式，识别不了返回 None"""
+    for fmt, offset, magic, mask in MAGIC_TABLE:
+        if _matches(data, offset, magic, mask):
+            secondary = _SECONDARY.get(fmt)
+            if secondary and not _matches(data, secondary[0], secondary[1], None):
+                continue
+            return fmt
+    return None
+
+
+def content_type_format(content_type):
+    """'audio/webm;codecs=opus' → 'webm'；未知类型返回 None"""
+    if not content_type:
+        return None
+    return CONTENT_TYPES.get(content_type.split(';', 1)[0].strip().lower())
+
+
+def content_type_rate(content_type):
+    """'audio/L16;rate=48000' → 48000；没有 rate 参数返回 None"""
+    for param in (content_type or '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'rate' and value.strip().isdigit():
+            return int(value.strip())
+    return None
+
+
+def normalize_hint(fmt):
+    """format 字段 / 扩展名提示 → 小写、无前导点，PCM 的各种写法统一为 'pcm'"""
+    fmt = (fmt or '').lower().lstrip('.')
+    return PCM if fmt in PCM_FORMATS else (fmt or None)
+
+
+def find_ebml_header(data):
+    """EBML 头在开头 HEADER_SCAN_BYTES 内的位置（MediaRecorder 偶尔在前面带几个字节），没有返回 -1"""
+    return data.find(EBML_MAGIC, 0, HEADER_SCAN_BYTES)
+
+
+def find_cluster(data, start=0):
+    """第一个 Cluster 的位置，只在 start 之后 HEADER_SCAN_BYTES 内查找，没有返回 -1"""
+    return data.find(CLUSTER_ID, start, start + HEADER_SCAN_BYTES)
+
+
+def webm_init_segment(data):
+    """完整 WebM 开头到第一个 Cluster 之前的字节（EBML 头 + Segment 头 + Tracks），找不到返回 None"""
+    # 初始化段通常只有几百字节，但 SeekHead / CodecPrivate 可能较长，这里放宽到 16 倍扫描窗口
+    position = data.find(CLUSTER_ID, 0, HEADER_SCAN_BYTES * 16)
+    return data[:position] if position > 0 else None
+
+
+def client_init_segment(data):
+    """客户端随分片带上的初始化段：可以是完整的第一片，也可以只是初始化段本身；不是 WebM 返回 None"""
+    if not data or not data.startswith(EBML_MAGIC):
+        return None
+    return webm_init_segment(data) or data
+
+
+class WebmInitCache:
+    """按 streamId 保存 WebM 初始化段（LRU + 过期）"""
+
+    def __init__(self, max_size=WEBM_INIT_CACHE_SIZE, ttl=WEBM_INIT_TTL_S):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._segments = collections.OrderedDict()  # stream_id -> (init, last_used)
+        self._lock = threading.Lock()
+
+    def remember(self, stream_id, data):
+        """保存完整 WebM 开头的初始化段"""
+        init = webm_init_segment(data)
+        if init is None:
+            return False
+        self.put(stream_id, init)
+        return True
+
+    def put(self, stream_id, init):
+        with self._lock:
+            self._segments[stream_id] = (init, time.monotonic())
+            self._segments.move_to_end(stream_id)
+            while len(self._segments) > self.max_size:
+                self._segments.popitem(last=False)
+
+    def get(self, stream_id):
+        with self._lock:
+            entry = self._segments.get(stream_id)
+            if entry is None:
+                return None
+            init, last_used = entry
+            if time.monotonic() - last_used > self.ttl:
+                del self._segments[stream_id]
+                return None
+            self._segments[stream_id] = (init, time.monotonic())
+            self._segments.move_to_end(stream_id)
+            return init
+
+    def forget(self, stream_id):
+        with self._lock:
+            self._segments.pop(stream_id, None)
+
+    def __len__(self):
+        return len(self._segments)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音频 → 模型输入的公共转换工具
+
+所有服务直接把 NumPy 数组交给 model.generate()，不再落盘临时文件。
+"""
+
+import io
+import logging
+import wave
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 16000
+
+
+def pcm16_to_float32(pcm):
+    """16-bit PCM（bytes / bytearray / memoryview）转换为 [-1, 1) 的 float32 数组"""
+    usable = len(pcm) // 2 * 2  # 丢弃不完整的末尾字节
+    samples = np.frombuffer(pcm, dtype=np.int16, count=usable // 2)
+    return samples.astype(np.float32) / 32768.0
+
+
+def wav_bytes_to_float32(data):
+    """在内存中解析 WAV，返回 (float32 单声道数组, 采样率)"""
+    with wave.open(io.BytesIO(data), 'rb') as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width != 2:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width * 8} bit")
+
+    audio = pcm16_to_float32(frames)
+    if channels > 1:
+        audio = audio[:len(audio) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return audio, sample_rate
+
+
+def result_text(result):
+    """取出 model.generate() 结果中的文本"""
+    if result and len(result) > 0:
+        return result[0].get('text', '')
+    return ""
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨会话动态批处理调度器
+
+各会话提交的离线识别请求先在这里排队，凑满 max_batch_size 条或等待
+max_wait_ms 毫秒后合并为一次批量前向，结果再按提交顺序分发回各自会话。
+
+环境变量：
+    BATCH_MAX_SIZE     单批最多的请求数
+    BATCH_MAX_WAIT_MS  第一条请求入队后最多等待的毫秒数
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+
+# 排队等待时间直方图的桶上界（毫秒）
+WAIT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+
+class BatchScheduler:
+    """把单条请求合并成批量推理
+
+    batch_fn 接收请求列表，返回等长的结果列表；它在 executor 中执行，
+    process 模式下必须是模块级函数。
+    """
+
+    def __init__(self, batch_fn, executor, max_batch_size=BATCH_MAX_SIZE,
+                 max_wait_ms=BATCH_MAX_WAIT_MS, name='asr'):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = []
+        self._wakeup = None
+        self._task = None
+        self.batch_size_hist = {}
+        self.wait_hist = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.batches = 0
+        self.requests = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def idle(self):
+        """没有排队中的请求（已发出的批次不受 close() 影响）"""
+        return not self._queue
+
+    def close(self):
+        """停止凑批循环；只应在 idle 时调用"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def submit(self, item):
+        """提交一条请求，等待并返回它自己的结果"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch_loop())
+
+        future = loop.create_future()
+        self._queue.append((item, future, time.monotonic()))
+        self._wakeup.set()
+        return await future
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._queue:
+                # 凑批：数量达到上限或最早一条等够 max_wait 即发出
+                deadline = self._queue[0][2] + self.max_wait
+                while len(self._queue) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    self._wakeup.clear()
+
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                self._record(batch)
+                asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    def _record(self, batch):
+        now = time.monotonic()
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_size_hist[len(batch)] = self.batch_size_hist.get(len(batch), 0) + 1
+        for _, _, enqueued in batch:
+            wait_ms = (now - enqueued) * 1000
+            self.wait_hist[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    async def _run_batch(self, batch):
+        items = [item for item, _, _ in batch]
+        try:
+            results = await self.executor.run(self.batch_fn, items)
+        except Exception as e:
+            logger.error(f"Batch {self.name} inference failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """批大小与排队等待时间直方图"""
+        wait_labels = [f"<={b}ms" for b in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            'name': self.name,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'requests': self.requests,
+            'avg_batch_size': round(self.requests / self.batches, 2) if self.batches else 0,
+            'queued': len(self._queue),
+            'batch_size_histogram': dict(sorted(self.batch_size_hist.items())),
+            'wait_ms_histogram': dict(zip(wait_labels, self.wait_hist)),
+        }
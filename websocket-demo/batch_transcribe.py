@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量识别（/transcribe-batch）
+
+夜间任务一次提交成百上千条短音频（语音信箱等），逐条请求时 HTTP、排队与
+model.generate() 的固定开销占了大头。一个批量请求中的多条音频：
+
+1. 在线程池中并发解码为 16kHz 单声道（audio_decode.decode_audio），
+   解码在占用模型之前完成
+2. 按时长排序后顺序装批：长度相近的音频分在同一批，每批补零后的时长
+   （条数 × 批内最长时长）不超过 TRANSCRIBE_BATCH_SIZE_S
+3. 每批调用一次 model.generate(input=[...], batch_size=条数)
+4. 按输入顺序返回每条的结果；单条解码或识别失败只影响这一条
+
+环境变量（与 batch_scheduler 的 BATCH_MAX_SIZE 等互不影响）：
+    TRANSCRIBE_BATCH_SIZE_S          每批补零后的音频时长上限，秒（默认 300）
+    TRANSCRIBE_BATCH_MAX_SIZE        每批最多条数（默认 64）
+    TRANSCRIBE_BATCH_MAX_CLIPS       单个请求最多条数（默认 1000）
+    TRANSCRIBE_BATCH_DECODE_WORKERS  解码线程数（默认 4）
+"""
+
+import base64
+import binascii
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_decode import decode_audio, AudioDecodeError, SAMPLE_RATE
+from audio_sniff import content_type_format, content_type_rate
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_BATCH_SIZE_S = float(os.getenv("TRANSCRIBE_BATCH_SIZE_S", "300"))
+TRANSCRIBE_BATCH_MAX_SIZE = int(os.getenv("TRANSCRIBE_BATCH_MAX_SIZE", "64"))
+TRANSCRIBE_BATCH_MAX_CLIPS = int(os.getenv("TRANSCRIBE_BATCH_MAX_CLIPS", "1000"))
+TRANSCRIBE_BATCH_DECODE_WORKERS = int(os.getenv("TRANSCRIBE_BATCH_DECODE_WORKERS", "4"))
+
+# 与 /transcribe 相同：太短的上传直接返回空文本
+MIN_AUDIO_BYTES = 100
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def _get_decode_pool():
+    # 延迟到首次调用时创建，预加载后 fork 的每个 worker 各有自己的线程
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_BATCH_DECODE_WORKERS, thread_name_prefix='batch-decode')
+        return _decode_pool
+
+
+def check_clip_count(count):
+    """没有音频或超过 TRANSCRIBE_BATCH_MAX_CLIPS 时抛出 ValueError"""
+    if not count:
+        raise ValueError('No clips received')
+    if count > TRANSCRIBE_BATCH_MAX_CLIPS:
+        raise ValueError(f'Too many clips: {count} (max {TRANSCRIBE_BATCH_MAX_CLIPS})')
+
+
+def clips_from_json(data):
+    """
+    JSON 请求体 → 待解码的音频列表
+
+        {"clips": [{"id": "vm-1", "audio": "base64...", "format": "wav", "sampleRate": 8000}, ...]}
+
+    clips 中的元素也可以直接是 base64 字符串；id 缺省为下标。
+
+    Raises:
+        ValueError: 请求体格式错误、没有音频或超过 TRANSCRIBE_BATCH_MAX_CLIPS
+    """
+    items = data.get('clips') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise ValueError('Expected JSON {"clips": [...]}')
+    check_clip_count(len(items))
+
+    clips = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'audio': item}
+        if not isinstance(item, dict):
+            raise ValueError(f'Clip {index} must be an object or a base64 string')
+        clips.append({
+            'id': item.get('id', index),
+            'audio': item.get('audio', ''),  # base64，解码线程里再转成字节
+            'format': item.get('format') or data.get('format'),
+            'sample_rate': item.get('sampleRate') or data.get('sampleRate'),
+        })
+    return clips
+
+
+def clip_from_upload(index, filename, content_type, body):
+    """multipart 中的一个文件 → 待解码的音频；格式提示取 Content-Type，其次扩展名"""
+    return {
+        'id': filename or index,
+        'data': body,
+        'format': content_type_format(content_type) or (os.path.splitext(filename or '')[1] or None),
+        'sample_rate': content_type_rate(content_type),
+    }
+
+
+def _decode_clip(clip):
+    """解码一条：返回 {'id', 'audio'} 或 {'id', 'error', 'detail'}"""
+    decoded = {'id': clip['id']}
+    try:
+        data = clip.get('data')
+        if data is None:
+            data = base64.b64decode(clip.get('audio') or '', validate=True)
+        if len(data) < MIN_AUDIO_BYTES:
+            decoded['audio'] = None  # 空文本
+            return decoded
+        decoded['audio'] = decode_audio(data, clip.get('format'), sample_rate=clip.get('sample_rate'))
+    except (binascii.Error, ValueError) as e:
+        # AudioDecodeError 也是 ValueError
+        error = 'Unable to decode audio' if isinstance(e, AudioDecodeError) else 'Invalid base64 audio'
+        decoded.update(error=error, detail=str(e))
+    except Exception as e:
+        logger.warning(f"Batch clip {clip['id']}: unexpected decode error: {e}")
+        decoded.update(error='Unable to decode audio', detail=str(e))
+    return decoded
+
+
+def decode_clips(clips):
+    """并发解码，结果与输入顺序一致（阻塞）"""
+    return list(_get_decode_pool().map(_decode_clip, clips))
+
+
+def plan_batches(durations, batch_size_s=TRANSCRIBE_BATCH_SIZE_S, max_size=TRANSCRIBE_BATCH_MAX_SIZE):
+    """
+    按时长升序装批，返回下标列表的列表
+
+    升序装入时新加入的总是批内最长的一条，补零后的时长即 条数 × 它的时长；
+    超过 batch_size_s 或 max_size 就开始新的一批（比预算还长的单条自成一批）。
+    """
+    batches, current = [], []
+    for index in sorted(range(len(durations)), key=durations.__getitem__):
+        if current and (len(current) >= max_size or (len(current) + 1) * durations[index] > batch_size_s):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _generate(model, audios):
+    result = model.generate(input=audios, fs=SAMPLE_RATE, batch_size=len(audios))
+    if not result or len(result) != len(audios):
+        raise RuntimeError(f"Expected {len(audios)} results, got {len(result or [])}")
+    return [item.get('text', '') for item in result]
+
+
+def _run_batch(model, audios):
+    """一批一次 generate；整批失败时逐条重试，找出是哪一条出错。返回 (文本或 None, 错误或 None) 列表"""
+    try:
+        return [(text, None) for text in _generate(model, audios)]
+    except Exception as e:
+        if len(audios) == 1:
+            logger.error(f"Batch inference failed: {e}")
+            traceback.print_exc()
+            return [(None, str(e))]
+        logger.warning(f"Batch of {len(audios)} failed ({e}), retrying one by one")
+    return [outcome for audio in audios for outcome in _run_batch(model, [audio])]
+
+
+def transcribe_decoded(model, decoded, batch_size_s=TRANSCRIBE_BATCH_SIZE_S):
+    """
+    对已解码的音频分批识别（阻塞，调用方持有模型）
+
+    Returns:
+        (按输入顺序的逐条结果, 统计信息)
+    """
+    started = time.perf_counter()
+    results = [None] * len(decoded)
+    pending = []  # 需要识别的下标
+    for index, item in enumerate(decoded):
+        if 'error' in item:
+            results[index] = {'id': item['id'], 'success': False, 'error': item['error'], 'detail': item['detail']}
+        elif item['audio'] is None or not len(item['audio']):
+            results[index] = {'id': item['id'], 'success': True, 'text': '', 'duration': 0.0}
+        else:
+            pending.append(index)
+
+    durations = [len(decoded[index]['audio']) / SAMPLE_RATE for index in pending]
+    batches = plan_batches(durations, batch_size_s)
+    for batch in batches:
+        indices = [pending[position] for position in batch]
+        outcomes = _run_batch(model, [decoded[index]['audio'] for index in indices])
+        for index, position, (text, error) in zip(indices, batch, outcomes):
+            result = {'id': decoded[index]['id'], 'duration': round(durations[position], 3)}
+            if error is None:
+                result.update(success=True, text=text)
+            else:
+                result.update(success=False, error='Recognition failed', detail=error)
+            results[index] = result
+
+    stats = {
+        'count': len(results),
+        'failed': sum(1 for result in results if not result['success']),
+        'batches': len(batches),
+        'audio_s': round(sum(durations), 3),
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+    logger.info(
+        f"Batch: {stats['count']} clips, {stats['audio_s']:.1f}s of audio in {stats['batches']} batches, "
+        f"{stats['failed']} failed, {stats['elapsed_s']:.2f}s"
+    )
+    return results, stats
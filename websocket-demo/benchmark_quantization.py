@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fp32 / int8 识别精度与速度对比
+
+在本地测试集上分别用 fp32 和 int8 模型识别，输出 CER 与 RTF 对比表（Markdown）。
+
+测试集目录格式（二选一）：
+    1. 每个音频旁放同名 .txt 参考文本：a.wav + a.txt
+    2. Kaldi 风格的 text 文件：每行 "<音频文件名不含扩展名> <参考文本>"
+
+用法：
+    python benchmark_quantization.py --test-set ./testset
+    python benchmark_quantization.py --test-set ./testset --model paraformer-zh --backends torch onnx \\
+        --output report.md
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+from audio_utils import wav_bytes_to_float32
+from model_backends import load_model
+
+AUDIO_EXTENSIONS = ('.wav',)
+
+# 计算 CER 时忽略标点与空白
+_IGNORED = re.compile(r"[\s　-〿＀-￯,.!?;:'\"()\[\]-]+")
+
+
+def normalize(text):
+    return _IGNORED.sub('', text or '').lower()
+
+
+def edit_distance(ref, hyp):
+    """字级编辑距离"""
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h))
+        previous = current
+    return previous[-1]
+
+
+def load_test_set(directory):
+    """返回 [(音频路径, 参考文本)]"""
+    kaldi_text = os.path.join(directory, 'text')
+    references = {}
+    if os.path.exists(kaldi_text):
+        with open(kaldi_text, encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split(maxsplit=1)
+                if parts:
+                    references[parts[0]] = parts[1] if len(parts) > 1 else ''
+
+    items = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*'), recursive=True)):
+        stem, ext = os.path.splitext(path)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        key = os.path.basename(stem)
+        if os.path.exists(stem + '.txt'):
+            with open(stem + '.txt', encoding='utf-8') as f:
+                items.append((path, f.read().strip()))
+        elif key in references:
+            items.append((path, references[key]))
+    return items
+
+
+def evaluate(model, items):
+    """识别整个测试集，返回 CER、RTF 与样本数"""
+    errors = chars = 0
+    decode_s = audio_s = 0.0
+    for path, reference in items:
+        with open(path, 'rb') as f:
+            audio, sample_rate = wav_bytes_to_float32(f.read())
+        start = time.perf_counter()
+        result = model.generate(input=audio, fs=sample_rate)
+        decode_s += time.perf_counter() - start
+        audio_s += len(audio) / sample_rate
+
+        hypothesis = result[0].get('text', '') if result else ''
+        ref, hyp = normalize(reference), normalize(hypothesis)
+        errors += edit_distance(ref, hyp)
+        chars += len(ref)
+    return {
+        'cer': errors / max(chars, 1),
+        'rtf': decode_s / max(audio_s, 1e-9),
+        'audio_s': audio_s,
+        'utterances': len(items),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CER / RTF of fp32 and int8 models")
+    parser.add_argument('--test-set', required=True, help="测试集目录")
+    parser.add_argument('--model', default='paraformer-zh', help="模型简称、ModelScope ID 或本地目录")
+    parser.add_argument('--revision', default='v2.0.4')
+    parser.add_argument('--backends', nargs='+', default=['torch'], choices=['torch', 'onnx'])
+    parser.add_argument('--output', help="报告输出路径（默认打印到标准输出）")
+    args = parser.parse_args()
+
+    items = load_test_set(args.test_set)
+    if not items:
+        print(f"No labelled .wav files found in {args.test_set}")
+        sys.exit(1)
+
+    rows = []
+    for backend in args.backends:
+        for quantize in (False, True):
+            label = f"{backend} {'int8' if quantize else 'fp32'}"
+            print(f"Evaluating {label} on {len(items)} utterances...")
+            start = time.perf_counter()
+            model = load_model(args.model, backend=backend, quantize=quantize, revision=args.revision)
+            load_s = time.perf_counter() - start
+            evaluate(model, items[:1])  # 预热，不计入结果
+            rows.append((label, load_s, evaluate(model, items)))
+            del model
+
+    baseline = rows[0][2]
+    lines = [
+        f"# Quantization report: {args.model}",
+        "",
+        f"Test set: `{args.test_set}`, {baseline['utterances']} utterances, "
+        f"{baseline['audio_s']:.1f}s of audio",
+        "",
+        "| Variant | Load (s) | CER | ΔCER | RTF | Speed-up |",
+        "|---------|---------:|----:|-----:|----:|---------:|",
+    ]
+    for label, load_s, result in rows:
+        lines.append(
+            f"| {label} | {load_s:.1f} | {result['cer'] * 100:.2f}% | "
+            f"{(result['cer'] - baseline['cer']) * 100:+.2f}% | {result['rtf']:.4f} | "
+            f"{baseline['rtf'] / max(result['rtf'], 1e-9):.2f}x |"
+        )
+    report = "\n".join(lines) + "\n"
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Report written to {args.output}")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
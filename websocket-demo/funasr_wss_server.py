@@ -9,16 +9,25 @@ FunASR WebSocket Server - 2-Pass 实时流式语音识别
 """
 
 import asyncio
+import functools
 import websockets
 import json
 import logging
 import io
-import tempfile
-import os
 from pathlib import Path
-from funasr import AutoModel
 from funasr.utils.postprocess_utils import rich_transcription_postprocess
 
+from audio_utils import pcm16_to_float32, result_text
+from audio_buffer import AudioBuffer
+from resampler import StreamingResampler
+from ingest_queue import IngestQueue, WS_MAX_MESSAGE_BYTES, WS_MAX_QUEUE
+from partial_stabilizer import PartialStabilizer
+from punctuation import IncrementalPunctuator, PUNC_MODEL, PUNC_MODEL_REVISION
+from model_loader import load_models, warmup_audio
+from model_backends import load_model, ASR_ONLINE, PUNC_REALTIME
+from worker_pool import WSS_WORKERS, run_workers, tracked, worker_state
+from inference_executor import InferenceExecutor
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -30,36 +39,83 @@ logger = logging.getLogger(__name__)
 asr_model = None
 punc_model = None
 
+# 推理执行器：模型调用都在这里执行，事件循环只做 I/O
+inference = InferenceExecutor()
+
+# 流式解码配置（与 funasr_wss_server_2pass.py 相同）
+STREAMING_CONFIG = {
+    'chunk_size': [0, 10, 5],        # [0, 10, 5] 600ms
+    'encoder_chunk_look_back': 4,
+    'decoder_chunk_look_back': 1,
+}
+
+# 每次送入模型的步长：chunk_size[1] * 60ms
+STRIDE_SAMPLES = STREAMING_CONFIG['chunk_size'][1] * 960
+STRIDE_BYTES = STRIDE_SAMPLES * 2  # 16-bit PCM
+
+# 结束时没有剩余音频，用一帧（60ms）静音冲刷解码器
+FLUSH_BYTES = 960 * 2
+
+
+def warmup_asr(model):
+    """按流式配置解码两个步长"""
+    cache = {}
+    for is_final in (False, True):
+        model.generate(
+            input=warmup_audio(STRIDE_SAMPLES / 16000),
+            cache=cache,
+            is_final=is_final,
+            **STREAMING_CONFIG,
+        )
+
+
+def warmup_punc(model):
+    model.generate(input="今天天气不错我们出去走走吧", cache={})
+
 
 def initialize_models():
-    """初始化 FunASR 模型"""
+    """并行加载并预热 FunASR 模型"""
     global asr_model, punc_model
     
-    logger.info("正在加载 Paraformer 流式模型...")
-    try:
+    logger.info("正在并行加载 Paraformer 流式模型与标点模型...")
+    specs = [
         # 使用 Paraformer-zh 流式模型
-        asr_model = AutoModel(
-            model="paraformer-zh-streaming",
-            model_revision="v2.0.4",
-            device="cpu",  # 如果有 GPU，改为 "cuda"
-        )
-        logger.info(" Paraformer 流式模型加载成功")
-        
-        # 加载标点模型（可选）
-        try:
-            punc_model = AutoModel(
-                model="ct-punc",
-                model_revision="v2.0.4", 
-                device="cpu"
-            )
-            logger.info(" 标点模型加载成功")
-        except Exception as e:
-            logger.warning(f"️ 标点模型加载失败（可选功能）: {e}")
-            punc_model = None
-            
+        {
+            'name': 'paraformer-zh-streaming',
+            'load': lambda: load_model(
+                "paraformer-zh-streaming",
+                kind=ASR_ONLINE,
+                revision="v2.0.4",
+                chunk_size=STREAMING_CONFIG['chunk_size'],
+            ),
+            'warmup': warmup_asr,
+        },
+        # 实时标点模型（可选，每个音频流携带自己的 cache）
+        {
+            'name': 'punc',
+            'load': lambda: load_model(
+                PUNC_MODEL,
+                kind=PUNC_REALTIME,
+                revision=PUNC_MODEL_REVISION,
+            ),
+            'warmup': warmup_punc,
+            'optional': True,
+        },
+    ]
+    
+    try:
+        models, _ = load_models(specs)
     except Exception as e:
         logger.error(f" 模型加载失败: {e}")
         raise
+    
+    asr_model = models['paraformer-zh-streaming']
+    punc_model = models['punc']
+    logger.info(" Paraformer 流式模型加载成功")
+    if punc_model is None:
+        logger.warning("️ 标点模型加载失败（可选功能），不加标点")
+    else:
+        logger.info(" 标点模型加载成功")
 
 
 class AudioStreamHandler:
@@ -67,15 +123,24 @@ class AudioStreamHandler:
     
     def __init__(self, websocket):
         self.websocket = websocket
-        self.audio_buffer = bytearray()
+        self.audio_buffer = AudioBuffer()  # 尚未送入模型的 PCM（不足一个步长）
+        self.asr_cache = {}                # 流式解码器状态，跨分片保留
+        self.online_text = ""              # 本次音频流到目前为止的识别文本，只增不减
         self.stream_id = None
         self.sample_rate = 16000
+        self.resampler = StreamingResampler(16000)
         self.is_streaming = False
+        self.ingest = IngestQueue(notify=self.send_flow_control)
+        self.stabilizer = PartialStabilizer()
+        self.punctuator = IncrementalPunctuator(punc_model)
+        self.punctuated_text = ""          # 已提交前缀加标点后的文本
+        self.punctuated_len = 0            # online_text 中已加标点的字符数
+        self.partial_mode = 'full'  # full：发送完整文本；delta：只发送增量
         
     async def handle_message(self, message):
         """处理客户端消息"""
         try:
-            if isinstance(message, bytes):
+            if not isinstance(message, str):
                 # 二进制音频数据
                 await self.handle_audio_chunk(message)
             else:
@@ -89,6 +154,12 @@ class AudioStreamHandler:
                     await self.handle_end(data)
                 elif msg_type == 'ping':
                     await self.send_message({'type': 'pong'})
+                elif msg_type == 'stats':
+                    await self.send_message({
+                        'type': 'stats',
+                        'ingest': self.ingest.stats(),
+                        'worker': worker_state
+                    })
                 else:
                     logger.warning(f"未知消息类型: {msg_type}")
                     
@@ -99,11 +170,20 @@ class AudioStreamHandler:
     async def handle_start(self, data):
         """处理开始消息"""
         self.stream_id = data.get('streamId', 'unknown')
-        self.sample_rate = data.get('sampleRate', 16000)
+        self.sample_rate = int(data.get('sampleRate', 16000))
+        # 客户端按原生采样率发送时在收包处转换为 16kHz，缓冲区与模型只看到 16kHz
+        self.resampler = StreamingResampler(self.sample_rate)
+        self.partial_mode = data.get('partialMode', 'full')
+        self.stabilizer.reset()
+        self.punctuator.reset()
+        self.punctuated_text = ""
+        self.punctuated_len = 0
         self.audio_buffer.clear()
+        self.asr_cache = {}
+        self.online_text = ""
         self.is_streaming = True
         
-        logger.info(f"️ 开始音频流: {self.stream_id}")
+        logger.info(f"️ 开始音频流: {self.stream_id} ({self.sample_rate}Hz)")
         await self.send_message({
             'type': 'started',
             'streamId': self.stream_id
@@ -115,54 +195,40 @@ class AudioStreamHandler:
             logger.warning("收到音频数据但流未启动")
             return
             
-        self.audio_buffer.extend(audio_data)
+        self.audio_buffer.write(self.resampler.process_pcm16(audio_data))
         
-        # 每收集到一定量的数据就进行一次识别（实时流式）
-        if len(self.audio_buffer) >= 32000:  # 约 1 秒的数据 (16000*2字节)
-            await self.process_audio_chunk()
+        # 每凑满一个步长就用会话 cache 解码新到达的音频（实时流式）
+        # 积压过多时暂缓解码，音频留在缓冲区，之后一次送入，文本不会丢失
+        if len(self.audio_buffer) >= STRIDE_BYTES:
+            if not self.ingest.should_drop_partials():
+                await self.process_audio_chunk()
+    
+    def decode(self, pcm, is_final=False):
+        """用会话 cache 解码新到达的 PCM，返回新增的文本（在推理执行器中运行）"""
+        result = asr_model.generate(
+            input=pcm16_to_float32(pcm),
+            cache=self.asr_cache,
+            is_final=is_final,
+            **STREAMING_CONFIG,
+        )
+        return result_text(result)
     
     async def process_audio_chunk(self):
-        """处理音频块并返回中间结果"""
-        if not self.audio_buffer or not asr_model:
+        """解码缓冲区中完整的步长，文本累加到 online_text 后发送中间结果"""
+        if not asr_model:
+            return
+        
+        strides = len(self.audio_buffer) // STRIDE_BYTES * STRIDE_BYTES
+        if not strides:
             return
             
         try:
-            # 将音频数据保存为临时文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-                
-                # 写入 WAV 头
-                import wave
-                with wave.open(tmp_path, 'wb') as wav_file:
-                    wav_file.setnchannels(1)
-                    wav_file.setsampwidth(2)
-                    wav_file.setframerate(self.sample_rate)
-                    wav_file.writeframes(bytes(self.audio_buffer))
-            
-            # 使用 FunASR 进行流式识别
-            result = asr_model.generate(
-                input=tmp_path,
-                batch_size=1,
-                is_final=False  # 中间结果
-            )
-            
-            # 清理临时文件
-            os.unlink(tmp_path)
-            
-            if result and len(result) > 0:
-                text = result[0].get('text', '')
-                if text:
-                    # 发送中间识别结果
-                    await self.send_message({
-                        'type': 'partial',
-                        'streamId': self.stream_id,
-                        'text': text,
-                        'isFinal': False
-                    })
-                    logger.info(f" 中间结果: {text}")
-            
-            # 保留部分数据用于上下文连续性
-            self.audio_buffer = self.audio_buffer[-16000:]  # 保留 0.5 秒
+            pcm = self.audio_buffer.read(strides).tobytes()
+            text = await inference.run_stateful(self.decode, pcm)
+            if text:
+                # 中间结果是到目前为止的完整假设，前缀不会被后续步长改写
+                self.online_text += text
+                await self.send_partial(self.online_text)
             
         except Exception as e:
             logger.error(f"处理音频块错误: {e}", exc_info=True)
@@ -174,69 +240,35 @@ class AudioStreamHandler:
             
         logger.info(f" 结束音频流: {self.stream_id}")
         self.is_streaming = False
+        self.audio_buffer.write(self.resampler.process_pcm16(b'', final=True))
         
         try:
-            if len(self.audio_buffer) > 0 and asr_model:
-                # 最终识别
-                with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                    tmp_path = tmp_file.name
-                    
-                    import wave
-                    with wave.open(tmp_path, 'wb') as wav_file:
-                        wav_file.setnchannels(1)
-                        wav_file.setsampwidth(2)
-                        wav_file.setframerate(self.sample_rate)
-                        wav_file.writeframes(bytes(self.audio_buffer))
-                
-                # 最终识别
-                result = asr_model.generate(
-                    input=tmp_path,
-                    batch_size=1,
-                    is_final=True  # 最终结果
-                )
-                
-                os.unlink(tmp_path)
-                
-                if result and len(result) > 0:
-                    text = result[0].get('text', '')
-                    
-                    # 如果有标点模型，添加标点
-                    if punc_model and text:
-                        try:
-                            punc_result = punc_model.generate(input=text)
-                            if punc_result and len(punc_result) > 0:
-                                text = punc_result[0].get('text', text)
-                        except Exception as e:
-                            logger.warning(f"标点处理失败: {e}")
-                    
-                    # 发送最终结果
-                    await self.send_message({
-                        'type': 'result',
-                        'streamId': self.stream_id,
-                        'text': text,
-                        'isFinal': True
-                    })
-                    logger.info(f" 最终结果: {text}")
-                else:
-                    await self.send_message({
-                        'type': 'result',
-                        'streamId': self.stream_id,
-                        'text': '',
-                        'isFinal': True
-                    })
-            else:
-                await self.send_message({
-                    'type': 'result',
-                    'streamId': self.stream_id,
-                    'text': '',
-                    'isFinal': True
-                })
+            if asr_model and (len(self.audio_buffer) > 0 or self.asr_cache):
+                # 剩余音频（包括积压时暂缓解码的步长）以 is_final=True 送入，冲刷解码器
+                pcm = self.audio_buffer.tobytes() or bytes(FLUSH_BYTES)
+                self.audio_buffer.clear()
+                self.online_text += await inference.run_stateful(self.decode, pcm, True)
+            
+            # 已提交的前缀在中间结果阶段已加过标点，这里只处理剩余的尾部
+            await self.punctuate_upto(len(self.online_text))
+            text = self.punctuated_text
+            
+            # 发送最终结果
+            await self.send_message({
+                'type': 'result',
+                'streamId': self.stream_id,
+                'text': text,
+                'isFinal': True
+            })
+            if text:
+                logger.info(f" 最终结果: {text}")
                 
         except Exception as e:
             logger.error(f"最终识别错误: {e}", exc_info=True)
             await self.send_error(str(e))
         finally:
             self.audio_buffer.clear()
+            self.asr_cache = {}
     
     async def send_message(self, data):
         """发送 JSON 消息"""
@@ -245,6 +277,51 @@ class AudioStreamHandler:
         except Exception as e:
             logger.error(f"发送消息错误: {e}")
     
+    async def punctuate_upto(self, end):
+        """为 online_text[punctuated_len:end] 加标点，前文上下文由会话的标点 cache 提供"""
+        piece = self.online_text[self.punctuated_len:end]
+        if not piece:
+            return
+        self.punctuated_len = end
+        if punc_model:
+            try:
+                piece = await inference.run_stateful(self.punctuator.punctuate, piece)
+            except Exception as e:
+                logger.warning(f"标点处理失败: {e}")
+        self.punctuated_text += piece
+    
+    async def send_partial(self, text):
+        """发送中间识别结果，文本未变化时不发送；新提交的文字随即加标点"""
+        delta = self.stabilizer.update(text)
+        if delta is None:
+            return
+        
+        if self.partial_mode == 'delta':
+            await self.send_message({
+                'type': 'partial_delta',
+                'streamId': self.stream_id,
+                'offset': delta['offset'],
+                'committed': delta['committed'],
+                'tail': delta['tail'],
+                'isFinal': False
+            })
+        else:
+            await self.send_message({
+                'type': 'partial',
+                'streamId': self.stream_id,
+                'text': text,
+                'isFinal': False
+            })
+        logger.info(f" 中间结果: {text}")
+        
+        # online_text 只增不减，已提交的前缀不会再变
+        await self.punctuate_upto(len(self.stabilizer.committed))
+    
+    async def send_flow_control(self, action, stats):
+        """积压超过高水位 / 回落时通知客户端"""
+        await self.send_message(dict(stats, type='flow_control', action=action, streamId=self.stream_id))
+        logger.warning(f"流控 {action}: 积压 {stats['queued_bytes']} 字节")
+    
     async def send_error(self, error_msg):
         """发送错误消息"""
         await self.send_message({
@@ -261,8 +338,14 @@ async def handle_client(websocket, path):
     
     handler = AudioStreamHandler(websocket)
     
+    # 读协程只负责收包，本协程按顺序处理；积压过多时读协程暂停
+    reader = asyncio.create_task(handler.ingest.feed_from(websocket))
+    
     try:
-        async for message in websocket:
+        while True:
+            message = await handler.ingest.get()
+            if message is None:
+                break
             await handler.handle_message(message)
             
     except websockets.exceptions.ConnectionClosed:
@@ -270,10 +353,20 @@ async def handle_client(websocket, path):
     except Exception as e:
         logger.error(f"处理客户端错误: {e}", exc_info=True)
     finally:
+        reader.cancel()
         logger.info(f" 清理连接: {client_address}")
 
 
-async def main():
+async def serve(host, port, reuse_port=False):
+    """在当前进程中运行 WebSocket 服务"""
+    async with websockets.serve(tracked(handle_client), host, port, ping_interval=20, ping_timeout=10,
+                                max_size=WS_MAX_MESSAGE_BYTES, max_queue=WS_MAX_QUEUE,
+                                reuse_port=reuse_port):
+        logger.info(" 服务器运行中，按 Ctrl+C 停止")
+        await asyncio.Future()  # 运行直到被中断
+
+
+def main():
     """主函数"""
     # 初始化模型
     initialize_models()
@@ -286,16 +379,16 @@ async def main():
     logger.info(f" 监听地址: ws://{host}:{port}")
     logger.info(f" 模型: Paraformer-zh-streaming v2.0.4")
     logger.info(f" 支持 2-Pass 实时流式识别")
+    logger.info(f" 推理执行器: {inference.describe()}")
+    logger.info(f" Worker 进程数: {WSS_WORKERS}")
     logger.info(f"=" * 60)
     
-    async with websockets.serve(handle_client, host, port, ping_interval=20, ping_timeout=10):
-        logger.info(" 服务器运行中，按 Ctrl+C 停止")
-        await asyncio.Future()  # 运行直到被中断
+    run_workers(functools.partial(serve, host, port))
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         logger.info("\n 服务器已停止")
     except Exception as e:
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理守护进程的协议与客户端
+
+各前端（HTTP API、WebSocket 服务）设置 MODEL_BACKEND=remote 后不再加载模型，
+而是通过本机 Unix 域套接字（不支持时用回环 TCP）把解码 / 标点请求发给
+inference_daemon.py，整机只保留一份模型，离线识别也能跨前端合并成批。
+
+帧格式（大端，前缀 uint32 为帧长度，不含自身）：
+    请求：uint32 request_id | uint8 op | uint8 flags | uint32 sample_rate
+          | uint16 model_len | uint16 key_len | uint16 options_len
+          | model | key | options（JSON，generate 的其余参数）| body
+    响应：uint32 request_id | uint8 status | body（UTF-8 JSON：结果或错误信息）
+
+body 默认为 float32 PCM；flags 中 FLAG_TEXT 表示 UTF-8 文本（标点），
+FLAG_PATH 表示本机音频文件路径。key 是流式会话在守护进程中的 cache 标识，
+为空表示无状态调用；OP_CLOSE_SESSION 让守护进程立即释放该会话的 cache。
+同一连接上可以连续发送多个请求，响应按 request_id 匹配。
+
+环境变量：
+    INFERENCE_DAEMON          守护进程地址：unix:/path 或 tcp:host:port
+    INFERENCE_DAEMON_TIMEOUT  单次请求超时秒数（默认 60）
+"""
+
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import uuid
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAEMON_ADDRESS = (
+    "unix:/tmp/funasr_inference.sock" if hasattr(socket, 'AF_UNIX') else "tcp:127.0.0.1:10097"
+)
+INFERENCE_DAEMON = os.getenv("INFERENCE_DAEMON", DEFAULT_DAEMON_ADDRESS)
+INFERENCE_DAEMON_TIMEOUT = float(os.getenv("INFERENCE_DAEMON_TIMEOUT", "60"))
+
+LENGTH = struct.Struct('!I')
+REQUEST = struct.Struct('!IBBIHHH')
+RESPONSE = struct.Struct('!IB')
+
+# op
+OP_GENERATE = 1
+OP_CLOSE_SESSION = 2
+OP_STATS = 3
+
+# flags
+FLAG_FINAL = 0x01
+FLAG_TEXT = 0x02
+FLAG_PATH = 0x04
+
+# status
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# generate() 的这些参数由协议头表达或由守护进程决定，不放进 options
+_RESERVED_KWARGS = {'input', 'cache', 'is_final', 'fs', 'batch_size'}
+
+
+def parse_address(address):
+    """'unix:/path' / 'tcp:host:port' / 裸路径 → (family, 地址)"""
+    if address.startswith('tcp:'):
+        host, _, port = address[4:].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    if address.startswith('unix:'):
+        address = address[5:]
+    return socket.AF_UNIX, address
+
+
+def encode_request(request_id, op, model='', key='', body=b'', flags=0, sample_rate=0, options=None):
+    model_bytes = model.encode('utf-8')
+    key_bytes = key.encode('utf-8')
+    options_bytes = json.dumps(options).encode('utf-8') if options else b''
+    header = REQUEST.pack(request_id, op, flags, sample_rate,
+                          len(model_bytes), len(key_bytes), len(options_bytes))
+    payload = b''.join((header, model_bytes, key_bytes, options_bytes, body))
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode_request(payload):
+    request_id, op, flags, sample_rate, model_len, key_len, options_len = REQUEST.unpack_from(payload)
+    offset = REQUEST.size
+    model = payload[offset:offset + model_len].decode('utf-8')
+    offset += model_len
+    key = payload[offset:offset + key_len].decode('utf-8')
+    offset += key_len
+    options = json.loads(payload[offset:offset + options_len]) if options_len else {}
+    offset += options_len
+    return {
+        'request_id': request_id,
+        'op': op,
+        'flags': flags,
+        'sample_rate': sample_rate,
+        'model': model,
+        'key': key,
+        'options': options,
+        'body': payload[offset:],
+    }
+
+
+def _json_default(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def encode_response(request_id, status, result):
+    body = json.dumps(result, ensure_ascii=False, default=_json_default).encode('utf-8')
+    payload = RESPONSE.pack(request_id, status) + body
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode_response(payload):
+    request_id, status = RESPONSE.unpack_from(payload)
+    return request_id, status, json.loads(payload[RESPONSE.size:])
+
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("inference daemon closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class RemoteInferenceError(RuntimeError):
+    """守护进程执行请求失败"""
+
+
+class InferenceClient:
+    """守护进程客户端
+
+    推理调用发生在执行器的多个线程里，每个线程使用自己的连接，
+    线程之间互不阻塞；连接出错时丢弃，下一次调用重新连接。
+    """
+
+    def __init__(self, address=INFERENCE_DAEMON, timeout=INFERENCE_DAEMON_TIMEOUT):
+        self.address = address
+        self.family, self.sockaddr = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._closing = []
+        self._closing_lock = threading.Lock()
+        self._closing_wakeup = threading.Event()
+        self._closer = None
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.sockaddr)
+            except OSError:
+                sock.close()
+                raise
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, requests):
+        """
+        发送一组请求（同一连接上连续发送），按顺序返回各自的结果
+
+        Args:
+            requests: [dict(op=..., model=..., key=..., body=..., flags=..., sample_rate=..., options=...)]
+        """
+        ids = [next(self._ids) & 0xFFFFFFFF for _ in requests]
+        frames = b''.join(encode_request(request_id, **request) for request_id, request in zip(ids, requests))
+        try:
+            sock = self._connection()
+            sock.sendall(frames)
+            responses = {}
+            while len(responses) < len(ids):
+                (length,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+                request_id, status, result = decode_response(_recv_exact(sock, length))
+                responses[request_id] = (status, result)
+        except (OSError, ConnectionError):
+            self._drop_connection()
+            raise
+
+        results = []
+        for request_id in ids:
+            status, result = responses[request_id]
+            if status != STATUS_OK:
+                raise RemoteInferenceError(result)
+            results.append(result)
+        return results
+
+    def stats(self):
+        return self.call([{'op': OP_STATS}])[0]
+
+    def close_session(self, model, key):
+        self.call([{'op': OP_CLOSE_SESSION, 'model': model, 'key': key}])
+
+    def release_session(self, model, key):
+        """
+        会话结束：由后台线程通知守护进程释放 cache，立即返回
+
+        可能在任意线程的垃圾回收中被调用（见 _RemoteSession），
+        因此不在调用方线程、也不在它的连接上收发。
+        """
+        with self._closing_lock:
+            self._closing.append((model, key))
+            if self._closer is None:
+                self._closer = threading.Thread(target=self._close_sessions, name='remote-session-close', daemon=True)
+                self._closer.start()
+        self._closing_wakeup.set()
+
+    def _close_sessions(self):
+        while True:
+            self._closing_wakeup.wait()
+            self._closing_wakeup.clear()
+            with self._closing_lock:
+                closing, self._closing = self._closing, []
+            if not closing:
+                continue
+            try:
+                self.call([{'op': OP_CLOSE_SESSION, 'model': model, 'key': key} for model, key in closing])
+            except (OSError, ConnectionError, RemoteInferenceError) as e:
+                # 守护进程仍会按 DAEMON_SESSION_TTL 回收
+                logger.debug(f"Could not close {len(closing)} remote sessions: {e}")
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = InferenceClient()
+        return _default_client
+
+
+class _RemoteSession:
+    """放在调用方 cache 字典里的会话标识，cache 被清空或丢弃时通知守护进程释放会话"""
+
+    __slots__ = ('key', '__weakref__')
+
+    def __init__(self, client, model):
+        self.key = uuid.uuid4().hex
+        finalizer = weakref.finalize(self, client.release_session, model, self.key)
+        finalizer.atexit = False
+
+
+class RemoteModel:
+    """守护进程中某个模型的本地代理，generate() 与 AutoModel 兼容
+
+    流式调用时在调用方的 cache 字典里记一个会话标识，守护进程按它保存真正的 cache；
+    调用方把 cache 重置为 {}（或清空、或随连接一起丢弃）即结束旧会话，
+    守护进程随即释放它，不必等到超时。
+    """
+
+    def __init__(self, model, kind, client=None):
+        self.model = model
+        self.kind = kind
+        self.client = client or default_client()
+        served = self.client.stats().get('models', {})
+        if model not in served:
+            raise RemoteInferenceError(
+                f"inference daemon at {self.client.address} does not serve {model} "
+                f"(serving: {', '.join(served) or 'nothing'})"
+            )
+
+    def _request(self, item, key, is_final, fs, options):
+        flags = FLAG_FINAL if is_final else 0
+        if isinstance(item, str):
+            flags |= FLAG_TEXT if self.kind.startswith('punc') else FLAG_PATH
+            body = item.encode('utf-8')
+        else:
+            body = np.asarray(item, dtype=np.float32).tobytes()
+        return {
+            'op': OP_GENERATE,
+            'model': self.model,
+            'key': key,
+            'body': body,
+            'flags': flags,
+            'sample_rate': int(fs or 16000),
+            'options': options,
+        }
+
+    def generate(self, input, cache=None, is_final=False, fs=16000, **kwargs):
+        key = ''
+        if cache is not None:
+            session = cache.get('remote_session')
+            if session is None:
+                session = cache['remote_session'] = _RemoteSession(self.client, self.model)
+            key = session.key
+        options = {k: v for k, v in kwargs.items() if k not in _RESERVED_KWARGS}
+        items = input if isinstance(input, list) else [input]
+        responses = self.client.call([self._request(item, key, is_final, fs, options) for item in items])
+        return [result for response in responses for result in response]
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本机推理守护进程
+
+整机只加载一份模型，HTTP API 与各 WebSocket 服务以 MODEL_BACKEND=remote 作为
+瘦客户端连接到这里（协议见 inference_client.py）。
+
+- 无状态的离线识别按 (模型, 采样率, generate 参数) 进入各自的 BatchScheduler，
+  参数相同的请求（可以来自不同前端）才合并成批
+- 带会话标识的流式请求（流式 ASR / VAD / 实时标点）在守护进程中保存 cache，
+  同一会话的请求按到达顺序串行执行；客户端结束会话时立即释放，
+  没有通知的会话空闲超过 DAEMON_SESSION_TTL 后回收
+
+环境变量：
+    INFERENCE_DAEMON     监听地址：unix:/path 或 tcp:host:port（与客户端相同）
+    DAEMON_MODELS        逗号分隔的 模型=类型[@版本]，类型见 model_backends
+    DAEMON_BACKEND       守护进程自身加载模型的后端 torch / onnx（默认 torch）
+    DAEMON_SESSION_TTL   流式会话空闲多少秒后回收（默认 300）
+
+用法：
+    python inference_daemon.py
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import time
+
+import numpy as np
+
+from batch_scheduler import BatchScheduler
+from inference_client import (
+    INFERENCE_DAEMON, LENGTH, OP_GENERATE, OP_CLOSE_SESSION, OP_STATS,
+    FLAG_FINAL, FLAG_TEXT, FLAG_PATH, STATUS_OK, STATUS_ERROR,
+    decode_request, encode_response, parse_address,
+)
+from inference_executor import InferenceExecutor
+from model_backends import load_model, ASR
+from model_loader import load_models
+from punctuation import PUNC_MODEL, PUNC_MODEL_REVISION
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DAEMON_MODELS = os.getenv(
+    "DAEMON_MODELS",
+    "paraformer-zh=asr,paraformer-zh-streaming=asr_online,fsmn-vad=vad_online,"
+    f"{PUNC_MODEL}=punc_realtime@{PUNC_MODEL_REVISION}",
+)
+DAEMON_BACKEND = os.getenv("DAEMON_BACKEND", "torch")
+DAEMON_SESSION_TTL = float(os.getenv("DAEMON_SESSION_TTL", "300"))
+
+# 已加载的模型：模块级，便于 process 模式的执行器通过 fork 继承
+models = {}
+model_kinds = {}
+
+
+def parse_model_specs(value):
+    """'名称=类型[@版本],...' → [(名称, 类型, 版本)]"""
+    specs = []
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        name, _, kind = entry.rpartition('=')
+        kind, _, revision = kind.partition('@')
+        specs.append((name, kind, revision or 'v2.0.4'))
+    return specs
+
+
+def generate_batch(name, fs, options, inputs):
+    """离线识别的批量前向（在推理执行器中运行）；同一批的采样率与参数相同"""
+    results = models[name].generate(input=inputs, fs=fs, batch_size=len(inputs), **options)
+    return [[result] for result in results]
+
+
+def batch_key(name, fs, options):
+    """只有 (模型, 采样率, generate 参数) 都相同的请求才能合并成批"""
+    return name, fs, json.dumps(options, sort_keys=True, ensure_ascii=False)
+
+
+class Session:
+    """守护进程中一个流式会话的 cache"""
+
+    def __init__(self):
+        self.cache = {}
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class InferenceDaemon:
+    def __init__(self, inference=None):
+        self.inference = inference or InferenceExecutor()
+        self.schedulers = {}  # batch_key -> BatchScheduler，按需创建
+        self.sessions = {}
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.sessions_closed = 0
+        self.started = time.time()
+
+    def _session(self, model, key):
+        session = self.sessions.get((model, key))
+        if session is None:
+            session = self.sessions[(model, key)] = Session()
+        session.last_used = time.monotonic()
+        return session
+
+    def _scheduler(self, name, fs, options):
+        key = batch_key(name, fs, options)
+        scheduler = self.schedulers.get(key)
+        if scheduler is None:
+            label = name if (fs, options) == (16000, {}) else f"{name} fs={fs} {key[2]}"
+            scheduler = self.schedulers[key] = BatchScheduler(
+                functools.partial(generate_batch, name, fs, options), self.inference, name=label
+            )
+        scheduler.last_used = time.monotonic()
+        return scheduler
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(DAEMON_SESSION_TTL, 60))
+            cutoff = time.monotonic() - DAEMON_SESSION_TTL
+            expired = [k for k, s in self.sessions.items() if s.last_used < cutoff and not s.lock.locked()]
+            for k in expired:
+                del self.sessions[k]
+            if expired:
+                logger.info(f"Expired {len(expired)} idle sessions, {len(self.sessions)} active")
+
+            # 每组不同的参数都有一个调度器，空闲的一并回收
+            idle = [k for k, b in self.schedulers.items() if b.last_used < cutoff and b.idle]
+            for k in idle:
+                self.schedulers.pop(k).close()
+
+    async def generate(self, request):
+        name = request['model']
+        model = models.get(name)
+        if model is None:
+            raise KeyError(f"model not served: {name}")
+
+        flags, body = request['flags'], request['body']
+        if flags & (FLAG_TEXT | FLAG_PATH):
+            data = body.decode('utf-8')
+        else:
+            data = np.frombuffer(body, dtype=np.float32)
+        fs, options = request['sample_rate'] or 16000, request['options']
+
+        if request['key']:
+            session = self._session(name, request['key'])
+            async with session.lock:
+                return await self.inference.run_stateful(
+                    model.generate, input=data, cache=session.cache,
+                    is_final=bool(flags & FLAG_FINAL), fs=fs, **options
+                )
+        if model_kinds.get(name) == ASR:
+            return await self._scheduler(name, fs, options).submit(data)
+        return await self.inference.run_stateful(
+            model.generate, input=data, is_final=bool(flags & FLAG_FINAL), fs=fs, **options
+        )
+
+    def stats(self):
+        return {
+            'models': dict(model_kinds),
+            'backend': DAEMON_BACKEND,
+            'uptime_s': round(time.time() - self.started, 1),
+            'connections': self.connections,
+            'requests': self.requests,
+            'errors': self.errors,
+            'sessions': len(self.sessions),
+            'sessions_closed': self.sessions_closed,
+            'inference_pending': self.inference.pending,
+            'batching': [scheduler.stats() for scheduler in self.schedulers.values()],
+        }
+
+    async def handle_request(self, request, writer, write_lock):
+        self.requests += 1
+        try:
+            op = request['op']
+            if op == OP_GENERATE:
+                status, result = STATUS_OK, await self.generate(request)
+            elif op == OP_CLOSE_SESSION:
+                if self.sessions.pop((request['model'], request['key']), None) is not None:
+                    self.sessions_closed += 1
+                status, result = STATUS_OK, None
+            elif op == OP_STATS:
+                status, result = STATUS_OK, self.stats()
+            else:
+                status, result = STATUS_ERROR, f"unknown op {op}"
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Request {request['request_id']} ({request['model']}) failed: {e}")
+            status, result = STATUS_ERROR, str(e)
+
+        async with write_lock:
+            writer.write(encode_response(request['request_id'], status, result))
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """一个前端连接：请求可以连续到达，各自并发处理，响应按完成顺序写回"""
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                try:
+                    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                    payload = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                task = asyncio.create_task(self.handle_request(decode_request(payload), writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            for task in pending:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+
+
+def load_daemon_models():
+    specs = []
+    for name, kind, revision in parse_model_specs(DAEMON_MODELS):
+        model_kinds[name] = kind
+        specs.append({
+            'name': name,
+            'load': functools.partial(load_model, name, kind=kind, backend=DAEMON_BACKEND, revision=revision),
+        })
+    loaded, _ = load_models(specs)
+    models.update(loaded)
+
+
+async def serve(address=INFERENCE_DAEMON):
+    daemon = InferenceDaemon()
+    family, sockaddr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)  # 上次退出残留的套接字文件
+        server = await asyncio.start_unix_server(daemon.handle_connection, path=sockaddr)
+    else:
+        server = await asyncio.start_server(daemon.handle_connection, *sockaddr)
+
+    logger.info(f"Inference daemon listening on {address}, serving: "
+                f"{', '.join(f'{n} ({k})' for n, k in model_kinds.items())}")
+    expiry = asyncio.create_task(daemon.expire_sessions())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry.cancel()
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+
+
+def main():
+    if DAEMON_BACKEND == 'remote':
+        raise SystemExit("DAEMON_BACKEND cannot be 'remote'")
+    logger.info(f"Loading models with backend {DAEMON_BACKEND}...")
+    load_daemon_models()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Inference daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型推理执行器
+
+把阻塞的 model.generate() 调度到线程池 / 进程池，事件循环只负责 I/O。
+排队中的推理数有上限，超过上限的调用方在协程里等待，形成背压。
+
+环境变量：
+    INFERENCE_EXECUTOR     thread（默认）或 process
+    INFERENCE_WORKERS      工作线程 / 进程数
+    INFERENCE_MAX_PENDING  同时排队 + 执行中的推理上限
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "32"))
+
+
+class InferenceExecutor:
+    """有界推理执行器
+
+    run() 用于无状态调用（离线识别、标点），在 process 模式下进入进程池，
+    fn 必须是模块级函数，子进程通过 fork 继承已加载的模型。
+    run_stateful() 用于携带会话 cache 的流式调用，cache 需要原地更新，
+    因此总是在线程池中执行。
+    同一会话内按 await 顺序依次调用，结果顺序与提交顺序一致。
+    """
+
+    def __init__(self, kind=INFERENCE_EXECUTOR, max_workers=INFERENCE_WORKERS,
+                 max_pending=INFERENCE_MAX_PENDING):
+        if kind == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning("Process executor needs fork(), falling back to threads")
+            kind = 'thread'
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._slots = None
+        self._thread_pool = None
+        self._process_pool = None
+
+    def _get_thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='inference',
+            )
+        return self._thread_pool
+
+    def _get_process_pool(self):
+        # 延迟到首次调用时创建，保证 fork 发生在模型加载之后
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('fork'),
+            )
+        return self._process_pool
+
+    async def _submit(self, pool, fn, args, kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            self.pending += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """执行无状态推理"""
+        if self.kind == 'process':
+            pool = self._get_process_pool()
+        else:
+            pool = self._get_thread_pool()
+        return await self._submit(pool, fn, args, kwargs)
+
+    async def run_stateful(self, fn, *args, **kwargs):
+        """执行会原地修改会话 cache 的推理"""
+        return await self._submit(self._get_thread_pool(), fn, args, kwargs)
+
+    @property
+    def saturated(self):
+        """排队 + 执行中的推理已达上限，新的调用会等待；HTTP 前端据此直接拒绝"""
+        return self.pending >= self.max_pending
+
+    def describe(self):
+        return f"{self.kind} x{self.max_workers}, max pending {self.max_pending}"
+
+    def shutdown(self):
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话级有界收包队列
+
+读协程只负责把 WebSocket 消息放进队列，处理协程按顺序取出。队列按字节
+计量，满了以后读协程停止从套接字读取，压力经 TCP 传回客户端，
+单个慢会话不会把整个进程的内存撑爆。
+
+积压超过高水位时按策略处理：
+    coalesce  相邻的音频消息合并为一条，一次处理多个步长
+    drop      丢弃过期的中间结果解码，只保证最终结果
+    signal    通知客户端 slow_down，回落到低水位后通知 resume
+
+环境变量：
+    INGEST_MAX_BYTES   每个会话排队音频的字节上限
+    INGEST_POLICY      coalesce（默认）/ drop / signal
+    WS_MAX_MESSAGE_BYTES  单条 WebSocket 消息的大小上限
+    WS_MAX_QUEUE          websockets 库内部缓存的消息条数
+"""
+
+import asyncio
+import collections
+import logging
+import os
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(1024 * 1024)))  # 16kHz 16-bit 约 32 秒
+INGEST_POLICY = os.getenv("INGEST_POLICY", "coalesce")
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", str(1024 * 1024)))
+WS_MAX_QUEUE = int(os.getenv("WS_MAX_QUEUE", "4"))
+
+HIGH_WATERMARK = 0.5
+LOW_WATERMARK = 0.25
+
+
+class IngestQueue:
+    """按到达顺序缓存一个会话的消息
+
+    音频消息（bytes）计入字节上限；控制消息（str）总是立即入队，
+    保证 stop / ping 不会被音频挤掉。
+    notify 是可选的协程回调 notify(action, stats)，signal 策略下调用。
+    """
+
+    def __init__(self, max_bytes=INGEST_MAX_BYTES, policy=INGEST_POLICY, notify=None):
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.notify = notify
+        self.queued_bytes = 0
+        self.closed = False
+        self.slowed_down = False
+        self.blocked_puts = 0
+        self.coalesced = 0
+        self.dropped_partials = 0
+        self.peak_bytes = 0
+        self._items = collections.deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def lagging(self):
+        return self.queued_bytes >= self.max_bytes * HIGH_WATERMARK
+
+    async def put(self, message):
+        if isinstance(message, str):
+            self._items.append(message)
+            self._not_empty.set()
+            return
+
+        # 队列已满：停止读取，直到处理协程腾出空间
+        while self.queued_bytes and self.queued_bytes + len(message) > self.max_bytes:
+            if self._not_full.is_set():
+                self.blocked_puts += 1
+                logger.debug(f"Ingest queue full ({self.queued_bytes} bytes), pausing reads")
+            self._not_full.clear()
+            await self._not_full.wait()
+
+        if (self.policy == 'coalesce' and self._items
+                and isinstance(self._items[-1], bytearray)):
+            self._items[-1].extend(message)
+            self.coalesced += 1
+        else:
+            self._items.append(bytearray(message))
+        self.queued_bytes += len(message)
+        self.peak_bytes = max(self.peak_bytes, self.queued_bytes)
+        self._not_empty.set()
+
+        if self.policy == 'signal' and self.lagging and not self.slowed_down:
+            self.slowed_down = True
+            await self._notify('slow_down')
+
+    async def get(self):
+        """取出下一条消息；队列关闭且取空后返回 None"""
+        while not self._items:
+            if self.closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        item = self._items.popleft()
+        if not isinstance(item, str):
+            self.queued_bytes -= len(item)
+            self._not_full.set()
+            if self.slowed_down and self.queued_bytes <= self.max_bytes * LOW_WATERMARK:
+                self.slowed_down = False
+                await self._notify('resume')
+        return item
+
+    def should_drop_partials(self):
+        """drop 策略下积压过多时，跳过本次中间结果解码"""
+        if self.policy == 'drop' and self.lagging:
+            self.dropped_partials += 1
+            return True
+        return False
+
+    async def _notify(self, action):
+        if self.notify is None:
+            return
+        try:
+            await self.notify(action, self.stats())
+        except Exception as e:
+            logger.error(f"Flow-control notify failed: {e}")
+
+    async def feed_from(self, websocket):
+        """读协程：把 websocket 的消息放入队列，连接关闭时关闭队列"""
+        try:
+            async for message in websocket:
+                await self.put(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        self._not_empty.set()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'depth': len(self._items),
+            'queued_bytes': self.queued_bytes,
+            'max_bytes': self.max_bytes,
+            'peak_bytes': self.peak_bytes,
+            'blocked_puts': self.blocked_puts,
+            'coalesced': self.coalesced,
+            'dropped_partials': self.dropped_partials,
+        }
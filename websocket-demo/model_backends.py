@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可选的推理后端
+
+torch  FunASR AutoModel（默认），quantize=True 时对 Linear / LSTM 层做 PyTorch
+       int8 动态量化，量化后的网络缓存在磁盘上，之后启动直接加载
+onnx   funasr_onnx + ONNX Runtime，首次加载时由 funasr_onnx 自动导出 ONNX，
+       quantize=True 时使用 int8 动态量化模型（model_quant.onnx）
+remote 不在本进程加载，请求转发给本机推理守护进程（inference_daemon.py）
+
+两种后端对外都提供 generate(input=..., cache=..., ...)，返回与 AutoModel 相同的
+[{'text': ...}] / [{'value': ...}] 结构，调用方不需要区分后端。
+流式模型（VAD / 流式 ASR / 实时标点）的状态保存在调用方传入的 cache 字典中，
+会话重置 cache 的方式保持不变。
+
+环境变量：
+    MODEL_BACKEND   默认后端 torch / onnx / remote（默认 torch）
+    MODEL_QUANTIZE  是否使用 int8 量化模型，1 开启（默认 0）
+    ONNX_THREADS    每个 ONNX Runtime 会话的 intra-op 线程数（默认 4）
+    QUANT_CACHE_DIR torch 量化模型的缓存目录（默认 ~/.cache/funasr_quant）
+"""
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from resampler import resample
+
+logger = logging.getLogger(__name__)
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+MODEL_QUANTIZE = os.getenv("MODEL_QUANTIZE", "0") == "1"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "4"))
+QUANT_CACHE_DIR = os.getenv("QUANT_CACHE_DIR", os.path.expanduser("~/.cache/funasr_quant"))
+
+SAMPLE_RATE = 16000
+
+# 模型类型：决定 onnx 后端使用哪个 funasr_onnx 类
+ASR = 'asr'
+ASR_ONLINE = 'asr_online'
+VAD = 'vad'
+VAD_ONLINE = 'vad_online'
+PUNC = 'punc'
+PUNC_REALTIME = 'punc_realtime'
+
+
+def resolve_model_id(model):
+    """把 FunASR 的简称（paraformer-zh / fsmn-vad ...）解析为 ModelScope 模型 ID"""
+    if os.path.exists(model):
+        return model
+    try:
+        from funasr.download.name_maps_from_hub import name_maps_ms
+        return name_maps_ms.get(model, model)
+    except ImportError:
+        return model
+
+
+def _as_16k(audio, fs):
+    """onnx 模型只接受 16kHz float32 数组（前端通常已经按 16kHz 送入，这里只兜底）"""
+    return resample(np.asarray(audio, dtype=np.float32), fs, SAMPLE_RATE)
+
+
+def _preds_text(result):
+    """funasr_onnx 不同版本的 preds 可能是文本或 (文本, tokens)"""
+    preds = result.get('preds', result.get('text', '')) if isinstance(result, dict) else result
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0] if preds else ''
+    return preds or ''
+
+
+class OnnxModel:
+    """funasr_onnx 模型的 AutoModel 风格包装"""
+
+    def __init__(self, kind, model_dir, quantize=False, **kwargs):
+        import funasr_onnx
+
+        self.kind = kind
+        self.quantize = quantize
+        common = {'quantize': quantize, 'intra_op_num_threads': ONNX_THREADS}
+        if kind == ASR:
+            self.model = funasr_onnx.Paraformer(model_dir, batch_size=1, **common)
+        elif kind == ASR_ONLINE:
+            self.model = funasr_onnx.ParaformerOnline(
+                model_dir, batch_size=1, chunk_size=kwargs.get('chunk_size', [5, 10, 5]), **common
+            )
+        elif kind == VAD:
+            self.model = funasr_onnx.Fsmn_vad(model_dir, **common)
+        elif kind == VAD_ONLINE:
+            self.model = funasr_onnx.Fsmn_vad_online(model_dir, **common)
+        elif kind == PUNC:
+            self.model = funasr_onnx.CT_Transformer(model_dir, **common)
+        elif kind == PUNC_REALTIME:
+            self.model = funasr_onnx.CT_Transformer_VadRealtime(model_dir, **common)
+        else:
+            raise ValueError(f"Unknown model kind: {kind}")
+
+    def generate(self, input, cache=None, is_final=False, fs=SAMPLE_RATE, **kwargs):
+        if self.kind == ASR:
+            return self._asr(input, fs)
+        if self.kind == ASR_ONLINE:
+            state = cache.setdefault('onnx', {'cache': {}}) if cache is not None else {'cache': {}}
+            state['is_final'] = is_final
+            results = self.model(_as_16k(input, fs), param_dict=state)
+            return [{'text': ''.join(_preds_text(r) for r in results or [])}]
+        if self.kind == VAD:
+            segments = self.model(_as_16k(input, fs))
+            return [{'value': segments[0] if segments else []}]
+        if self.kind == VAD_ONLINE:
+            state = cache.setdefault('onnx', {'in_cache': []}) if cache is not None else {'in_cache': []}
+            state['is_final'] = is_final
+            segments = self.model(_as_16k(input, fs), param_dict=state)
+            return [{'value': segments[0] if segments else []}]
+        if self.kind == PUNC:
+            return [{'text': self.model(input)[0]}]
+        # PUNC_REALTIME
+        state = cache.setdefault('onnx', {'cache': []}) if cache is not None else {'cache': []}
+        return [{'text': self.model(input, param_dict=state)[0]}]
+
+    def _asr(self, input, fs):
+        # funasr_onnx 只对文件路径列表做批量读取，数组列表逐条识别
+        items = input if isinstance(input, list) else [input]
+        results = []
+        for item in items:
+            if not isinstance(item, str):
+                item = _as_16k(item, fs)
+            output = self.model(item)
+            results.append({'text': _preds_text(output[0]) if output else ''})
+        return results
+
+
+def _quant_cache_path(model, revision):
+    import torch
+    key = f"{model}@{revision or ''}@torch-{torch.__version__}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    name = os.path.basename(os.path.normpath(model)) or 'model'
+    return os.path.join(QUANT_CACHE_DIR, f"{name}-{digest}.int8.pt")
+
+
+def quantize_torch_model(auto_model, model, revision=None):
+    """
+    对 AutoModel 的网络做 int8 动态量化（Linear / LSTM），结果缓存到磁盘
+
+    AutoModel 仍然正常加载（分词器、前端等配置来自模型目录），只替换其中的网络；
+    命中缓存时跳过量化步骤。
+    """
+    import torch
+
+    path = _quant_cache_path(model, revision)
+    if os.path.exists(path):
+        try:
+            auto_model.model = torch.load(path, map_location='cpu', weights_only=False)
+            auto_model.model.eval()
+            logger.info(f"Loaded int8 {model} from cache: {path}")
+            return auto_model
+        except Exception as e:
+            logger.warning(f"Quantized cache {path} unusable, re-quantizing: {e}")
+
+    auto_model.model = torch.quantization.quantize_dynamic(
+        auto_model.model.eval(), {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+    )
+    try:
+        os.makedirs(QUANT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(auto_model.model, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Quantized {model} to int8, cached at {path}")
+    except Exception as e:
+        logger.warning(f"Could not cache quantized {model}: {e}")
+    return auto_model
+
+
+def share_model_memory(model):
+    """
+    fork 前冻结 torch 模型：推理模式、关闭梯度，权重移入共享内存
+
+    之后 fork 出的 worker 直接映射同一份权重，不会因写时复制产生私有副本。
+    onnx / remote 模型没有 torch 网络，直接跳过。
+    """
+    try:
+        import torch
+    except ImportError:
+        return False
+
+    shared = False
+    for attr in ('model', 'vad_model', 'punc_model', 'spk_model'):
+        network = getattr(model, attr, None)
+        if not isinstance(network, torch.nn.Module):
+            continue
+        network.eval()
+        for param in network.parameters():
+            param.requires_grad_(False)
+        try:
+            network.share_memory()
+        except RuntimeError as e:
+            # 部分量化模块的打包权重不支持共享内存，仍可依赖写时复制
+            logger.warning(f"share_memory() failed for {attr}: {e}")
+        shared = True
+    return shared
+
+
+def load_model(model, kind=ASR, backend=None, quantize=None, revision=None, **kwargs):
+    """
+    按后端加载模型
+
+    Args:
+        model: 模型简称、ModelScope ID 或本地目录
+        kind: 模型类型（asr / asr_online / vad / vad_online / punc / punc_realtime），torch 后端不使用
+        backend: torch / onnx / remote，为空时取 MODEL_BACKEND
+        quantize: 是否使用 int8 量化模型（torch 为动态量化，onnx 为 model_quant.onnx），
+            为空时取 MODEL_QUANTIZE
+        revision: torch 后端的 model_revision
+        **kwargs: 其余参数传给 AutoModel（torch）或 funasr_onnx（如流式 chunk_size）
+    """
+    backend = backend or MODEL_BACKEND
+    quantize = MODEL_QUANTIZE if quantize is None else quantize
+
+    if backend == 'remote':
+        # 量化、后端等由守护进程自己的配置决定
+        from inference_client import RemoteModel
+        logger.info(f"Using {model} from the inference daemon")
+        return RemoteModel(model, kind)
+    if backend == 'onnx':
+        model_dir = resolve_model_id(model)
+        logger.info(f"Loading {model} as ONNX ({kind}, quantize={quantize})")
+        return OnnxModel(kind, model_dir, quantize=quantize, **kwargs)
+    if backend != 'torch':
+        raise ValueError(f"Unknown model backend: {backend}")
+
+    from funasr import AutoModel
+    options = {'device': 'cpu', 'disable_update': True}
+    if revision:
+        options['model_revision'] = revision
+    options.update(kwargs)
+    options.pop('chunk_size', None)
+    auto_model = AutoModel(model=model, **options)
+    if quantize:
+        quantize_torch_model(auto_model, model, revision)
+    return auto_model
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带内存预算的模型注册表
+
+按名称加载模型并记录常驻大小；请求通过 acquire() 持有模型（引用计数），
+总大小超过预算时按最近最少使用（LRU）顺序卸载空闲模型。
+正在处理请求的模型与 pinned 的模型不会被卸载。
+每个模型有独立的并发上限与延迟统计，多个模型可以同时对外服务、互不阻塞。
+异步前端用 reserve() 在事件循环中不等待地占用名额，占不到时在事件循环中
+轮询排队（不占用线程），最多等待 queue_timeout 秒。
+
+环境变量：
+    MODEL_MEMORY_BUDGET_MB  已加载模型的总大小上限（MB），0 表示不限制（默认 0）
+    MODEL_MAX_CONCURRENCY   每个模型默认的同时推理数（默认 2）
+    MODEL_QUEUE_TIMEOUT_S   等待模型空闲的最长秒数，超时抛出 ModelBusy（默认 30）
+"""
+
+import collections
+import contextlib
+import gc
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "2"))
+MODEL_QUEUE_TIMEOUT_S = float(os.getenv("MODEL_QUEUE_TIMEOUT_S", "30"))
+
+# 延迟统计保留的最近样本数
+LATENCY_WINDOW = 1000
+
+
+class ModelNotLoaded(Exception):
+    """acquire(load=False) 时模型不在内存中"""
+
+
+class ModelBusy(Exception):
+    """模型的并发名额在超时时间内没有空出"""
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def estimate_model_size_mb(model):
+    """torch 模型按参数与 buffer 的字节数估算，无法估算时返回 None"""
+    try:
+        import torch
+    except ImportError:
+        return None
+
+    total = 0
+    for attr in ('model', 'vad_model', 'punc_model', 'spk_model'):
+        network = getattr(model, attr, None)
+        if isinstance(network, torch.nn.Module):
+            for tensor in list(network.parameters()) + list(network.buffers()):
+                total += tensor.numel() * tensor.element_size()
+    return total / (1024 * 1024) if total else None
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+
+class LatencyStats:
+    """一个模型最近 LATENCY_WINDOW 次请求的排队与推理耗时"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self._service = collections.deque(maxlen=window)
+        self._wait = collections.deque(maxlen=window)
+
+    def record(self, service_s, wait_s):
+        self.requests += 1
+        self._service.append(service_s)
+        self._wait.append(wait_s)
+
+    def summary(self):
+        service = sorted(self._service)
+        wait = sorted(self._wait)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'p50_ms': _percentile(service, 0.5),
+            'p95_ms': _percentile(service, 0.95),
+            'p99_ms': _percentile(service, 0.99),
+            'wait_p95_ms': _percentile(wait, 0.95),
+        }
+
+
+class Reservation:
+    """
+    reserve() 不等待地占到的并发名额
+
+    要么由 acquire(reservation=...) 接管（请求结束时随之归还），要么由 cancel() 归还，
+    两者只会发生其一；请求在进入线程池之前被放弃时，调用方总是可以调用 cancel()。
+    """
+
+    def __init__(self, slots):
+        self._slots = slots
+        self._lock = threading.Lock()
+        self._state = None
+
+    def claim(self):
+        with self._lock:
+            if self._state is not None:
+                return False
+            self._state = 'claimed'
+            return True
+
+    def cancel(self):
+        with self._lock:
+            if self._state is not None:
+                return
+            self._state = 'cancelled'
+        self._slots.release()
+
+
+class _Entry:
+    def __init__(self, model, size_mb, load_s):
+        self.model = model
+        self.size_mb = size_mb
+        self.load_s = load_s
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.refs = 0
+        self.uses = 0
+
+
+class ModelRegistry:
+    """按名称管理已加载的模型
+
+    loader(name) 加载并返回模型，在调用线程中执行；同一模型的并发加载只执行一次。
+    concurrency(name) 返回该模型的并发上限，为空时使用 MODEL_MAX_CONCURRENCY。
+    """
+
+    def __init__(self, loader, budget_mb=MODEL_MEMORY_BUDGET_MB, pinned=(), concurrency=None,
+                 queue_timeout=MODEL_QUEUE_TIMEOUT_S):
+        self.loader = loader
+        self.budget_mb = budget_mb
+        self.pinned = set(pinned)
+        self.concurrency = concurrency or (lambda name: MODEL_MAX_CONCURRENCY)
+        self.queue_timeout = queue_timeout
+        self._entries = collections.OrderedDict()  # 按最近使用排序，末尾最新
+        self._loading = {}
+        self._known_sizes = {}
+        self._evictions = {}
+        self._slots = {}
+        self._latency = collections.defaultdict(LatencyStats)
+        self._lock = threading.Condition()
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def items(self):
+        with self._lock:
+            return [(name, entry.model) for name, entry in self._entries.items()]
+
+    def get(self, name):
+        """返回已加载的模型，不触发加载"""
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry.model if entry else None
+
+    def pin(self, name):
+        with self._lock:
+            self.pinned.add(name)
+
+    def unpin(self, name):
+        with self._lock:
+            self.pinned.discard(name)
+
+    def load(self, name):
+        """加载模型（已加载时直接返回），必要时先卸载空闲模型腾出预算"""
+        with self._lock:
+            while name in self._loading:
+                self._lock.wait()
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                return entry.model
+            # 以前加载过的模型大小已知，加载前先腾出空间
+            self._evict_for(self._known_sizes.get(name, 0), keep=name)
+            self._loading[name] = True
+
+        try:
+            rss_before = _rss_mb()
+            start = time.perf_counter()
+            model = self.loader(name)
+            load_s = time.perf_counter() - start
+            size_mb = estimate_model_size_mb(model)
+            if size_mb is None:
+                rss_after = _rss_mb()
+                if rss_before is not None and rss_after is not None:
+                    size_mb = max(rss_after - rss_before, 0.0)
+        finally:
+            with self._lock:
+                del self._loading[name]
+                self._lock.notify_all()
+
+        with self._lock:
+            self._entries[name] = _Entry(model, size_mb or 0.0, load_s)
+            self._known_sizes[name] = size_mb or 0.0
+            logger.info(f"Model '{name}' resident: {size_mb or 0:.0f}MB, loaded in {load_s:.1f}s "
+                        f"(total {self._resident_mb():.0f}MB / budget {self._budget_text()})")
+            self._evict_for(0, keep=name)
+        return model
+
+    def _slots_for(self, name):
+        with self._lock:
+            slots = self._slots.get(name)
+            if slots is None:
+                slots = self._slots[name] = threading.BoundedSemaphore(max(1, self.concurrency(name)))
+            return slots
+
+    def reserve(self, name, count_rejected=True):
+        """
+        不等待地占用一个并发名额（可在事件循环中调用），没有空闲名额时返回 None 并计入拒绝数
+
+        返回的 Reservation 交给 acquire(reservation=...) 使用。
+        在事件循环中轮询排队的调用方传 count_rejected=False，只有最终放弃时才计入拒绝数。
+        """
+        slots = self._slots_for(name)
+        if slots.acquire(blocking=False):
+            return Reservation(slots)
+        if not count_rejected:
+            return None
+        with self._lock:
+            self._latency[name].rejected += 1
+        return None
+
+    @contextlib.contextmanager
+    def acquire(self, name, timeout=None, reservation=None, load=True):
+        """
+        持有模型处理一个请求；未加载时先加载，持有期间不会被卸载
+
+        先等待该模型的并发名额，timeout（默认 queue_timeout）秒内没有空出则抛出 ModelBusy；
+        传入 reservation 时直接使用已占到的名额（已被 cancel 则抛出 ModelBusy）。
+        load=False 时不在这里加载，模型不在内存中则抛出 ModelNotLoaded，调用线程不会阻塞。
+        退出时记录排队与推理耗时；with 块内抛出的异常计为错误。
+        """
+        slots = self._slots_for(name)
+        start = time.perf_counter()
+        if reservation is not None:
+            if not reservation.claim():
+                raise ModelBusy(name)
+        elif not slots.acquire(timeout=self.queue_timeout if timeout is None else timeout):
+            with self._lock:
+                self._latency[name].rejected += 1
+            raise ModelBusy(name)
+
+        try:
+            while True:
+                with self._lock:
+                    entry = self._entries.get(name)
+                    if entry is not None:
+                        entry.refs += 1
+                        entry.uses += 1
+                        entry.last_used = time.time()
+                        self._entries.move_to_end(name)
+                        break
+                if not load:
+                    raise ModelNotLoaded(name)
+                self.load(name)
+        except BaseException:
+            slots.release()
+            raise
+
+        wait_s = time.perf_counter() - start
+        try:
+            yield entry.model
+        except BaseException:
+            with self._lock:
+                self._latency[name].errors += 1
+            raise
+        finally:
+            service_s = time.perf_counter() - start - wait_s
+            slots.release()
+            with self._lock:
+                self._latency[name].record(service_s, wait_s)
+                entry.refs -= 1
+                entry.last_used = time.time()
+                if entry.refs == 0:
+                    self._evict_for(0)
+
+    def record_error(self, name):
+        """请求以错误结束但没有抛出异常时（如返回 500）调用"""
+        with self._lock:
+            self._latency[name].errors += 1
+
+    def evict(self, name):
+        """卸载空闲模型，返回是否卸载成功"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.refs > 0:
+                return False
+            self._remove(name, reason='manual')
+        return True
+
+    def trim(self):
+        """按预算卸载空闲模型（如当前模型切换、pin 变化之后）"""
+        with self._lock:
+            self._evict_for(0)
+
+    def _resident_mb(self):
+        return sum(entry.size_mb for entry in self._entries.values())
+
+    def _budget_text(self):
+        return f"{self.budget_mb:.0f}MB" if self.budget_mb > 0 else "unlimited"
+
+    def _evict_for(self, incoming_mb, keep=None):
+        """按 LRU 卸载空闲模型，直到 常驻 + incoming 不超过预算（调用方持有锁）"""
+        if self.budget_mb <= 0:
+            return
+        for name in list(self._entries):
+            if self._resident_mb() + incoming_mb <= self.budget_mb:
+                return
+            entry = self._entries[name]
+            if name == keep or name in self.pinned or entry.refs > 0:
+                continue
+            self._remove(name, reason='lru')
+        if self._resident_mb() + incoming_mb > self.budget_mb:
+            logger.warning(f"Model memory {self._resident_mb() + incoming_mb:.0f}MB exceeds budget "
+                           f"{self.budget_mb:.0f}MB; remaining models are in use or pinned")
+
+    def _remove(self, name, reason):
+        entry = self._entries.pop(name)
+        record = self._evictions.setdefault(name, {'count': 0})
+        record.update(count=record['count'] + 1, last_evicted=time.time(), reason=reason)
+        logger.info(f"Evicted model '{name}' ({entry.size_mb:.0f}MB, {reason}), "
+                    f"resident now {self._resident_mb():.0f}MB")
+        del entry
+        gc.collect()
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'budget_mb': self.budget_mb if self.budget_mb > 0 else None,
+                'resident_mb': round(self._resident_mb(), 1),
+                'loaded': {
+                    name: {
+                        'size_mb': round(entry.size_mb, 1),
+                        'in_flight': entry.refs,
+                        'requests': entry.uses,
+                        'load_s': round(entry.load_s, 2),
+                        'idle_s': round(now - entry.last_used, 1),
+                        'pinned': name in self.pinned,
+                    }
+                    for name, entry in self._entries.items()
+                },
+                'loading': list(self._loading),
+                'latency': {name: stats.summary() for name, stats in self._latency.items()},
+                'concurrency': {name: self.concurrency(name) for name in self._slots},
+                'evicted': {
+                    name: {
+                        'count': record['count'],
+                        'reason': record['reason'],
+                        'evicted_s_ago': round(now - record['last_evicted'], 1),
+                    }
+                    for name, record in self._evictions.items() if name not in self._entries
+                },
+            }
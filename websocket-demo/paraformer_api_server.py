@@ -7,14 +7,26 @@ Paraformer  HTTP API
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from funasr import AutoModel
-import tempfile
+import base64
+import functools
 import os
 import sys
 import traceback
 import logging
-import subprocess
 import shutil
+import socket
+import threading
+
+from audio_utils import result_text
+from audio_sniff import content_type_format, content_type_rate
+from audio_decode import (
+    decode_audio, available_decoders, find_ffmpeg, ffmpeg_pool, ffmpeg_stats, AudioDecodeError, AUDIO_DECODERS
+)
+from readiness import Readiness, READY, FAILED, READY_RETRY_AFTER
+from model_backends import load_model, share_model_memory, MODEL_BACKEND, MODEL_QUANTIZE
+from worker_pool import supervise, supports_fork, memory_usage, worker_state
+from model_registry import ModelRegistry, ModelBusy, ModelNotLoaded, MODEL_MAX_CONCURRENCY
+from batch_transcribe import clips_from_json, clip_from_upload, check_clip_count, decode_clips, transcribe_decoded
 
 app = Flask(__name__)
 CORS(app)
@@ -27,256 +39,363 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Global variables
-models = {}  # Store multiple models
 current_model_name = 'paraformer-zh'  # Default model
 ffmpeg_available = False
 
+# Readiness: the HTTP port opens immediately, the default model loads in the background
+readiness = Readiness(required=(current_model_name,))
+
+# Preload-then-fork: with API_WORKERS > 1 the parent loads API_PRELOAD_MODELS once,
+# then forks workers that share the weights copy-on-write
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+API_PRELOAD_MODELS = [m for m in os.getenv("API_PRELOAD_MODELS", current_model_name).split(',') if m]
+
 # Available models configuration
+# backend: 'torch' (FunASR AutoModel) or 'onnx' (ONNX Runtime)
+# quantize: int8 model (torch: dynamic quantization of Linear/LSTM, cached on disk; onnx: model_quant.onnx)
+# max_concurrency: simultaneous inferences on this model (default MODEL_MAX_CONCURRENCY)
+# experimental: accuracy/speed not yet validated against fp32 (no committed benchmark_quantization.py report)
 AVAILABLE_MODELS = {
     'paraformer-zh': {
         'name': 'Paraformer-zh (Default)',
         'model_id': 'paraformer-zh',
         'revision': 'v2.0.4',
-        'description': 'Standard Chinese ASR model'
+        'description': 'Standard Chinese ASR model',
+        'backend': MODEL_BACKEND,
+        'quantize': MODEL_QUANTIZE
     },
     'paraformer-large': {
         'name': 'Paraformer-zh Large',
         'model_id': 'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch',
         'revision': 'master',
         'description': 'Large Chinese ASR model with better accuracy',
-        'local_path': '../models/iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'
+        'local_path': '../models/iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch',
+        'backend': MODEL_BACKEND,
+        'quantize': MODEL_QUANTIZE,
+        'max_concurrency': 1
+    },
+    'paraformer-zh-int8': {
+        'name': 'Paraformer-zh (PyTorch int8)',
+        'model_id': 'paraformer-zh',
+        'revision': 'v2.0.4',
+        'description': 'Standard Chinese ASR model with dynamic int8 quantization',
+        'backend': 'torch',
+        'quantize': True,
+        'experimental': True
+    },
+    'paraformer-zh-onnx': {
+        'name': 'Paraformer-zh (ONNX int8)',
+        'model_id': 'paraformer-zh',
+        'revision': 'v2.0.4',
+        'description': 'Standard Chinese ASR model on ONNX Runtime, int8 quantized for CPU',
+        'backend': 'onnx',
+        'quantize': True,
+        'experimental': True
     }
 }
 
 def check_ffmpeg():
-    """ ffmpeg """
+    """Detect the in-process decoders and the ffmpeg pipe fallback"""
     global ffmpeg_available
-    try:
-        result = subprocess.run(['ffmpeg', '-version'], 
-                              capture_output=True, 
-                              text=True, 
-                              timeout=5)
-        if result.returncode == 0:
-            ffmpeg_available = True
-            logger.info(" ffmpeg ")
-            return True
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        pass
-    
-    #  Scoop 
-    scoop_ffmpeg = os.path.expanduser("~/scoop/shims/ffmpeg.exe")
-    if os.path.exists(scoop_ffmpeg):
-        try:
-            result = subprocess.run([scoop_ffmpeg, '-version'],
-                                  capture_output=True,
-                                  text=True,
-                                  timeout=5)
-            if result.returncode == 0:
-                ffmpeg_available = True
-                logger.info(f" ffmpeg  (Scoop): {scoop_ffmpeg}")
-                return True
-        except:
-            pass
-    
-    logger.warning("  ffmpeg ")
-    ffmpeg_available = False
-    return False
-
-def convert_audio_to_wav(input_path, output_path, sample_rate=16000):
-    """Use ffmpeg to convert audio to WAV format with specified sample rate"""
-    try:
-        # Check input file
-        if not os.path.exists(input_path):
-            logger.error(f"Input file not found: {input_path}")
-            return False
-        
-        input_size = os.path.getsize(input_path)
-        if input_size < 100:
-            logger.error(f"Input file too small: {input_size} bytes")
-            return False
-        
-        logger.info(f"Input file: {input_path} ({input_size} bytes)")
-        
-        ffmpeg_cmd = 'ffmpeg'
-        scoop_ffmpeg = os.path.expanduser("~/scoop/shims/ffmpeg.exe")
-        if os.path.exists(scoop_ffmpeg):
-            ffmpeg_cmd = scoop_ffmpeg
-        
-        cmd = [
-            ffmpeg_cmd,
-            '-loglevel', 'warning',
-            '-i', input_path,
-            '-ar', str(sample_rate),  # Sample rate: 8000 or 16000
-            '-ac', '1',               # Mono
-            '-acodec', 'pcm_s16le',   # PCM 16-bit
-            '-f', 'wav',
-            '-avoid_negative_ts', 'make_zero',
-            '-y',
-            output_path
-        ]
-        
-        logger.info(f"Converting to {sample_rate}Hz WAV...")
-        
-        result = subprocess.run(cmd, 
-                              capture_output=True, 
-                              text=True, 
-                              timeout=30)
-        
-        if result.returncode == 0:
-            if os.path.exists(output_path):
-                output_size = os.path.getsize(output_path)
-                logger.info(f"Conversion success: {output_path} ({output_size} bytes, {sample_rate}Hz)")
-                return True
-            else:
-                logger.error(f"Output file not created: {output_path}")
-                return False
+    ffmpeg_available = find_ffmpeg() is not None
+    logger.info(f"Audio decoders: {', '.join(available_decoders())}")
+    if ffmpeg_available and 'ffmpeg' in AUDIO_DECODERS:
+        ffmpeg_pool().warm()  # spare transcoders ready before the first fallback request
+    elif not ffmpeg_available:
+        logger.warning("ffmpeg not found; formats the in-process decoders cannot read will be rejected")
+    return ffmpeg_available
+
+def load_configured_model(model_name):
+    """Load a model from AVAILABLE_MODELS (called by the registry, raises on failure)"""
+    logger.info("="*70)
+    logger.info(f"Initializing model: {model_name}...")
+    logger.info("="*70)
+    
+    model_config = AVAILABLE_MODELS.get(model_name)
+    if not model_config:
+        raise KeyError(f"Unknown model: {model_name}")
+    
+    backend = model_config.get('backend', MODEL_BACKEND)
+    quantize = model_config.get('quantize', MODEL_QUANTIZE)
+    logger.info(f"Backend: {backend}" + (" (int8 quantized)" if quantize else ""))
+    if model_config.get('experimental'):
+        logger.warning(f"Model '{model_name}' is experimental: CER/RTF not yet validated against fp32")
+    
+    # Check if local model exists
+    local_path = model_config.get('local_path')
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    if local_path:
+        full_local_path = os.path.join(script_dir, local_path)
+        if os.path.exists(full_local_path):
+            logger.info(f"Loading local model from: {full_local_path}")
+            loaded_model = load_model(
+                full_local_path,
+                backend=backend,
+                quantize=quantize,
+            )
         else:
-            logger.error(f"FFmpeg conversion failed (exit code {result.returncode})")
-            if result.stderr:
-                logger.error(f"stderr: {result.stderr}")
-            return False
-    except subprocess.TimeoutExpired:
-        logger.error(f"FFmpeg timeout (>30s)")
-        return False
-    except Exception as e:
-        logger.error(f"Conversion error: {e}")
-        traceback.print_exc()
-        return False
+            logger.info(f"Local model not found, downloading from ModelScope...")
+            loaded_model = load_model(
+                model_config['model_id'],
+                backend=backend,
+                quantize=quantize,
+                revision=model_config.get('revision', 'master'),
+            )
+    else:
+        # Load from ModelScope
+        loaded_model = load_model(
+            model_config['model_id'],
+            backend=backend,
+            quantize=quantize,
+            revision=model_config.get('revision', 'v2.0.4'),
+        )
+    
+    logger.info(f"Model '{model_name}' loaded successfully!")
+    return loaded_model
+
+# Loaded models: resident size tracking, in-flight refcounts and LRU eviction under MODEL_MEMORY_BUDGET_MB,
+# plus per-model concurrency limits and latency stats
+registry = ModelRegistry(
+    load_configured_model,
+    concurrency=lambda name: AVAILABLE_MODELS.get(name, {}).get('max_concurrency', MODEL_MAX_CONCURRENCY),
+)
 
 def initialize_model(model_name='paraformer-zh'):
-    """Initialize Paraformer model"""
-    global models, current_model_name
+    """Load a model through the registry and make it the current model"""
+    global current_model_name
     
-    if model_name in models:
+    if model_name in registry:
         logger.info(f"Model '{model_name}' already loaded")
-        current_model_name = model_name
-        return True
-    
-    logger.info("="*70)
-    logger.info(f"Initializing model: {model_name}...")
-    logger.info("="*70)
     
     # Check ffmpeg
     check_ffmpeg()
     
     try:
-        model_config = AVAILABLE_MODELS.get(model_name)
-        if not model_config:
-            logger.error(f"Unknown model: {model_name}")
-            return False
-        
-        # Check if local model exists
-        local_path = model_config.get('local_path')
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        if local_path:
-            full_local_path = os.path.join(script_dir, local_path)
-            if os.path.exists(full_local_path):
-                logger.info(f"Loading local model from: {full_local_path}")
-                loaded_model = AutoModel(
-                    model=full_local_path,
-                    device="cpu",
-                    disable_update=True,
-                )
-            else:
-                logger.info(f"Local model not found, downloading from ModelScope...")
-                loaded_model = AutoModel(
-                    model=model_config['model_id'],
-                    model_revision=model_config.get('revision', 'master'),
-                    device="cpu",
-                    disable_update=True,
-                )
-        else:
-            # Load from ModelScope
-            loaded_model = AutoModel(
-                model=model_config['model_id'],
-                model_revision=model_config.get('revision', 'v2.0.4'),
-                device="cpu",
-                disable_update=True,
-            )
-        
-        models[model_name] = loaded_model
-        current_model_name = model_name
-        logger.info(f"Model '{model_name}' loaded successfully!")
-        return True
+        registry.load(model_name)
     except Exception as e:
         logger.error(f"Model loading failed: {e}")
         traceback.print_exc()
         return False
+    
+    # The current model is never evicted; the previous one becomes evictable
+    registry.unpin(current_model_name)
+    registry.pin(model_name)
+    current_model_name = model_name
+    registry.trim()
+    return True
 
 def get_current_model():
     """Get current active model"""
-    return models.get(current_model_name)
-    logger.info("="*70)
+    return registry.get(current_model_name)
+
+def requested_model_name():
+    """Model for this request: ?model=, X-Model header or JSON "model", else the default model"""
+    model_name = request.args.get('model') or request.headers.get('X-Model')
+    if not model_name and request.is_json:
+        model_name = (request.get_json(silent=True) or {}).get('model')
+    elif not model_name and request.mimetype == 'multipart/form-data':
+        model_name = request.form.get('model')
+    return model_name or current_model_name
+
+def json_response(payload, status=200, headers=None):
+    """Flask response from a (payload, status, headers) result of the framework-independent handlers"""
+    response = jsonify(payload)
+    response.status_code = status
+    response.headers.update(headers or {})
+    return response
+
+def check_model(model_name):
+    """Reject unknown models and the default model while it loads: (payload, status, headers) or None"""
+    if model_name not in AVAILABLE_MODELS:
+        return {
+            'success': False,
+            'error': f'Unknown model: {model_name}',
+            'available': list(AVAILABLE_MODELS.keys())
+        }, 400, {}
+    if model_name == current_model_name and not readiness.ready:
+        return not_ready_payload()
+    return None
+
+def call_with_model(model_name, handler, reservation=None):
+    """
+    Run handler(model) -> (payload, status) on the requested model, holding it so it cannot be
+    evicted mid-request. Blocking; shared by the Flask and ASGI frontends.
     
-    #  ffmpeg
-    check_ffmpeg()
+    With a reservation (registry.reserve(), taken by the ASGI frontend on the event loop) this
+    never waits: the model slot is already held, and a model that is not resident returns 503
+    and loads in the background instead of loading on this thread.
+    """
+    rejected = check_model(model_name)
+    if rejected:
+        return rejected
+    
+    if reservation is None:
+        try:
+            registry.load(model_name)  # no-op once loaded
+        except Exception as e:
+            logger.error(f"Model '{model_name}' unavailable: {e}")
+            return {
+                'success': False,
+                'error': 'Model not initialized'
+            }, 503, {}
     
     try:
-        #  Paraformer 
-        model = AutoModel(
-            model="paraformer-zh",
-            model_revision="v2.0.4",
-            device="cpu",  #  CPU GPU  "cuda"
-            disable_update=True,  # 
-        )
-        logger.info(" ")
-        logger.info(f" : {os.path.expanduser('~/.cache/modelscope')}")
-        return True
-    except Exception as e:
-        logger.error(f" : {e}")
-        traceback.print_exc()
-        return False
+        with registry.acquire(model_name, reservation=reservation, load=reservation is None) as model:
+            payload, status = handler(model)
+    except ModelBusy:
+        return {
+            'success': False,
+            'error': f'Model {model_name} is busy, retry later'
+        }, 429, {'Retry-After': '1'}
+    except ModelNotLoaded:
+        # Evicted between admission and here
+        load_model_in_background(model_name)
+        return model_loading_payload(model_name)
+    
+    if status >= 500:
+        registry.record_error(model_name)
+    return payload, status, {'X-Model': model_name}
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
+def with_model(handler):
+    """Flask wrapper around call_with_model for the requested model"""
+    return json_response(*call_with_model(requested_model_name(), handler))
+
+def load_default_model_in_background():
+    """Load the default model in a background thread while the server already accepts requests"""
+    def load():
+        ok = initialize_model(current_model_name)
+        readiness.mark(current_model_name, READY if ok else FAILED)
+        if ok:
+            logger.info(f"Ready to serve, {readiness.status()['load_s']:.2f}s after start")
+    
+    thread = threading.Thread(target=load, name='model-load', daemon=True)
+    thread.start()
+    return thread
+
+_background_loads = set()
+_background_loads_lock = threading.Lock()
+
+def load_model_in_background(model_name):
+    """Load a non-default model off the request path; no-op while it is already loading"""
+    with _background_loads_lock:
+        if model_name in _background_loads:
+            return
+        _background_loads.add(model_name)
+    
+    def load():
+        try:
+            registry.load(model_name)
+        except Exception as e:
+            logger.error(f"Background load of '{model_name}' failed: {e}")
+        finally:
+            with _background_loads_lock:
+                _background_loads.discard(model_name)
+    
+    threading.Thread(target=load, name=f'model-load-{model_name}', daemon=True).start()
+
+def model_loading_payload(model_name):
+    """503 with Retry-After while a requested model loads in the background"""
+    return {
+        'success': False,
+        'status': 'loading',
+        'error': f'Model {model_name} is loading, retry later'
+    }, 503, {'Retry-After': str(READY_RETRY_AFTER)}
+
+def not_ready_payload():
+    """503 with Retry-After while the model is still loading (or failed to load)"""
+    status = readiness.status()
+    headers = {} if status['state'] == FAILED else {'Retry-After': str(status['retry_after'])}
+    return {
+        'success': False,
+        'status': status['state'],
+        'error': 'Model failed to load' if status['state'] == FAILED else 'Model is loading, retry later',
+        'readiness': status
+    }, 503, headers
+
+def not_ready_response():
+    return json_response(*not_ready_payload())
+
+def health_payload():
+    """GET /health: (payload, status, headers)"""
+    if not readiness.ready:
+        return not_ready_payload()
     model = get_current_model()
     if model is None:
-        return jsonify({
+        return {
             'status': 'error',
             'message': 'Model not initialized'
-        }), 503
-    return jsonify({
+        }, 503, {}
+    return {
         'status': 'ok',
         'model': current_model_name,
         'available_models': list(AVAILABLE_MODELS.keys()),
-        'ffmpeg': 'available' if ffmpeg_available else 'not_found'
-    })
+        'ffmpeg': 'available' if ffmpeg_available else 'not_found',
+        'decoders': available_decoders(),
+        'ffmpeg_pool': ffmpeg_stats(),
+        'readiness': readiness.status(),
+        'worker': dict(worker_state, memory=memory_usage())
+    }, 200, {}
 
-@app.route('/models', methods=['GET'])
-def list_models():
-    """List available models"""
-    return jsonify({
+def models_payload():
+    """GET /models: (payload, status, headers)"""
+    return {
         'current': current_model_name,
-        'loaded': list(models.keys()),
-        'available': {k: v['name'] for k, v in AVAILABLE_MODELS.items()}
-    })
+        'loaded': registry.names(),
+        'registry': registry.stats(),
+        'available': {k: v['name'] for k, v in AVAILABLE_MODELS.items()},
+        'backends': {k: {'backend': v.get('backend', MODEL_BACKEND), 'quantize': v.get('quantize', MODEL_QUANTIZE),
+                         'experimental': v.get('experimental', False)}
+                     for k, v in AVAILABLE_MODELS.items()}
+    }, 200, {}
 
-@app.route('/switch_model', methods=['POST'])
-def switch_model():
-    """Switch to a different model"""
-    data = request.get_json()
-    model_name = data.get('model', 'paraformer-zh')
+def switch_model_payload(data):
+    """POST /switch_model: (payload, status, headers); blocks while the model loads"""
+    model_name = (data or {}).get('model', 'paraformer-zh')
     
     if model_name not in AVAILABLE_MODELS:
-        return jsonify({
+        return {
             'success': False,
             'error': f'Unknown model: {model_name}',
             'available': list(AVAILABLE_MODELS.keys())
-        }), 400
+        }, 400, {}
     
     if initialize_model(model_name):
-        return jsonify({
+        return {
             'success': True,
             'model': model_name,
-            'message': f'Switched to {model_name}'
-        })
+            'message': f'Switched to {model_name}',
+            'scope': 'default'  # requests that name a model (?model=, X-Model, "model") are unaffected
+        }, 200, {}
     else:
-        return jsonify({
+        return {
             'success': False,
             'error': 'Failed to load model'
-        }), 500
+        }, 500, {}
+
+@app.before_request
+def count_request():
+    worker_state['connections'] += 1
+    worker_state['connections_total'] += 1
+
+@app.teardown_request
+def release_request(exc=None):
+    worker_state['connections'] -= 1
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return json_response(*health_payload())
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """List available models"""
+    return json_response(*models_payload())
+
+@app.route('/switch_model', methods=['POST'])
+def switch_model():
+    """Switch the default model (requests can also pick a model per request)"""
+    return json_response(*switch_model_payload(request.get_json()))
 
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
@@ -287,7 +406,8 @@ def transcribe():
     
     
     - Content-Type: audio/* ()
-    - Content-Type: application/json (JSON: { "audio": "base64_data", "format": "webm" })
+    - Content-Type: application/json (JSON: { "audio": "base64_data", "format": "webm", "model": "paraformer-zh" })
+    - Optional ?model= / X-Model header selects the model for this request
     
     
     {
@@ -296,277 +416,146 @@ def transcribe():
         "language": "zh"
     }
     """
-    model = get_current_model()
-    if model is None:
-        return jsonify({
-            'success': False,
-            'error': 'Model not initialized'
-        }), 503
-    
+    return with_model(transcribe_with_model)
+
+def transcribe_with_model(model):
+    """Handle /transcribe with a model held by the registry"""
+    json_data = request.get_json(silent=True) if request.is_json else None
+    return transcribe_request(model, request.content_type, request.get_data(), json_data)
+
+def transcribe_request(model, content_type, body, json_data=None):
+    """
+    Framework-independent /transcribe core: raw audio body or JSON with base64 audio.
+    Returns (payload, status); blocking, runs on the request thread or the inference pool.
+    """
     try:
         audio_data = None
-        file_ext = ".wav"
         
-        # 
-        if request.content_type and 'audio' in request.content_type:
-            # 
-            audio_data = request.data
-            
-            #  Content-Type 
-            if 'webm' in request.content_type:
-                file_ext = ".webm"
-            elif 'ogg' in request.content_type:
-                file_ext = ".ogg"
-            elif 'mp4' in request.content_type or 'm4a' in request.content_type:
-                file_ext = ".m4a"
-            elif 'mpeg' in request.content_type or 'mp3' in request.content_type:
-                file_ext = ".mp3"
-                
-        elif request.is_json:
-            # JSON base64 
-            data = request.get_json()
-            import base64
-            audio_data = base64.b64decode(data.get('audio', ''))
-            file_ext = "." + data.get('format', 'wav')
+        # Raw audio body or JSON with base64 audio; the container is decided by the file header
+        if content_type and 'audio' in content_type:
+            audio_data = body
+            fmt_hint = content_type_format(content_type)
+            pcm_rate = content_type_rate(content_type)
+        elif json_data is not None:
+            audio_data = base64.b64decode(json_data.get('audio', ''))
+            fmt_hint = json_data.get('format')
+            pcm_rate = json_data.get('sampleRate')
         else:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'Unsupported content type'
-            }), 400
+            }, 400
         
         if not audio_data:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'No audio data received'
-            }), 400
+            }, 400
         
         # 
         if len(audio_data) < 100:
             logger.warning(f" : {len(audio_data)} ")
-            return jsonify({
+            return {
                 'success': True,
                 'text': '',
                 'language': 'zh',
                 'confidence': 0.0,
                 'message': ''
-            })
-        
-        logger.info(f" : {len(audio_data)} , : {file_ext}")
+            }, 200
         
-        # 
-        if len(audio_data) > 16:
-            header_hex = audio_data[:16].hex()
-            logger.info(f"  (16): {header_hex}")
-            
-            # 
-            if len(audio_data) > 64:
-                header_64 = audio_data[:64].hex()
-                logger.info(f"  (64): {header_64}")
-        
-        #  WebM 
-        if file_ext == '.webm':
-            # WebM  0x1A 0x45 0xDF 0xA3 EBML 
-            if len(audio_data) > 4:
-                header = audio_data[:4]
-                expected_header = b'\x1a\x45\xdf\xa3'
-                
-                if header != expected_header:
-                    logger.warning(f" WebM ")
-                    logger.warning(f"   : {expected_header.hex()}")
-                    logger.warning(f"   : {header.hex()}")
-                    
-                    #  2KB  WebM EBML 
-                    search_length = min(len(audio_data), 2048)
-                    webm_pos = audio_data[:search_length].find(b'\x1a\x45\xdf\xa3')
-                    
-                    if webm_pos > 0:
-                        logger.info(f"  {webm_pos}  WebM ")
-                        audio_data = audio_data[webm_pos:]
-                        logger.info(f"   : {len(audio_data)} ")
-                    elif webm_pos < 0:
-                        #  WebM 
-                        logger.warning("  WebM EBML ")
-                        logger.warning("    MediaRecorder ")
-                        logger.warning("   ")
-                        
-                        # 
-                        if audio_data[:4] == b'RIFF':
-                            logger.info("    RIFF  WAV ")
-                            file_ext = '.wav'
-                        elif audio_data[:3] == b'ID3' or audio_data[:2] == b'\xff\xfb':
-                            logger.info("    MP3 ")
-                            file_ext = '.mp3'
-                else:
-                    logger.info(f" WebM EBML ")
+        # Sniff the header once, then decode in memory to 16kHz mono float32
+        # (no temp files; unrecognised or headerless WebM input is rejected without trying any decoder)
+        try:
+            audio = decode_audio(audio_data, fmt_hint, sample_rate=pcm_rate)
+        except AudioDecodeError as e:
+            logger.warning(f"Decode failed ({len(audio_data)} bytes, hint {fmt_hint}): {e}")
+            return {
+                'success': False,
+                'error': f'Unable to decode {fmt_hint or "audio"} upload',
+                'detail': str(e)
+            }, 400
         
-        # 
-        with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as temp_file:
-            temp_path = temp_file.name
-            temp_file.write(audio_data)
-            temp_file.flush()  # 
+        # Perform recognition
+        logger.info(f"Starting recognition: {len(audio) / 16000:.2f}s of audio")
         
         try:
-            logger.info(f" : {temp_path} ({len(audio_data)} )")
-            
-            # Convert to WAV if needed
-            final_audio_path = temp_path
-            converted = False
-            
-            if file_ext.lower() != '.wav' and ffmpeg_available:
-                logger.info(f"Converting {file_ext} to WAV format...")
-                
-                # Try 16kHz first (preferred for Paraformer)
-                wav_path_16k = temp_path.replace(file_ext, '_16k.wav')
-                success_16k = convert_audio_to_wav(temp_path, wav_path_16k, sample_rate=16000)
-                
-                if success_16k and os.path.exists(wav_path_16k):
-                    output_size = os.path.getsize(wav_path_16k)
-                    logger.info(f"16kHz conversion output: {output_size} bytes")
-                    
-                    if output_size > 100:
-                        final_audio_path = wav_path_16k
-                        converted = True
-                        logger.info(f"Using 16kHz WAV file")
-                    else:
-                        logger.warning(f"16kHz WAV too small ({output_size} bytes), trying 8kHz...")
-                        # Try 8kHz as fallback
-                        wav_path_8k = temp_path.replace(file_ext, '_8k.wav')
-                        success_8k = convert_audio_to_wav(temp_path, wav_path_8k, sample_rate=8000)
-                        
-                        if success_8k and os.path.exists(wav_path_8k):
-                            output_size_8k = os.path.getsize(wav_path_8k)
-                            if output_size_8k > 100:
-                                final_audio_path = wav_path_8k
-                                converted = True
-                                logger.info(f"Using 8kHz WAV file ({output_size_8k} bytes)")
-                            else:
-                                logger.warning(f"Both conversions failed, trying original file")
-                        else:
-                            logger.warning(f"8kHz conversion also failed, trying original file")
-                else:
-                    logger.warning(f"FFmpeg 16kHz conversion failed, trying 8kHz...")
-                    wav_path_8k = temp_path.replace(file_ext, '_8k.wav')
-                    success_8k = convert_audio_to_wav(temp_path, wav_path_8k, sample_rate=8000)
-                    
-                    if success_8k and os.path.exists(wav_path_8k):
-                        output_size_8k = os.path.getsize(wav_path_8k)
-                        if output_size_8k > 100:
-                            final_audio_path = wav_path_8k
-                            converted = True
-                            logger.info(f"Using 8kHz WAV file ({output_size_8k} bytes)")
-                        else:
-                            logger.warning(f"All conversions failed, trying original file")
-                    else:
-                        logger.warning(f"All conversions failed, trying original file")
-                        
-            elif file_ext.lower() != '.wav' and not ffmpeg_available:
-                logger.warning("ffmpeg not available, trying to use original non-WAV file")
-            
-            # Perform recognition
-            logger.info(f"Starting recognition: {final_audio_path}")
-            logger.info(f"  File exists: {os.path.exists(final_audio_path)}")
-            logger.info(f"  File size: {os.path.getsize(final_audio_path)} bytes")
-            
-            try:
-                result = model.generate(input=final_audio_path)
-                
-                if not result or len(result) == 0:
-                    logger.warning(" ")
-                    return jsonify({
-                        'success': True,
-                        'text': '',
-                        'language': 'zh',
-                        'confidence': 0.0,
-                        'message': ''
-                    })
-                    
-            except Exception as model_error:
-                logger.error(f" : {model_error}")
-                logger.error(f"   : {type(model_error).__name__}")
-                traceback.print_exc()
-                
-                error_msg = str(model_error)
-                error_lower = error_msg.lower()
-                
-                # 
-                if 'format' in error_lower or 'codec' in error_lower or 'decode' in error_lower:
-                    return jsonify({
-                        'success': False,
-                        'error': '',
-                        'detail': error_msg,
-                        'suggestion': ''
-                    }), 500
-                elif 'sample' in error_lower or 'rate' in error_lower:
-                    return jsonify({
-                        'success': False,
-                        'error': '',
-                        'detail': error_msg,
-                        'suggestion': ' 16kHz'
-                    }), 500
-                elif 'channel' in error_lower:
-                    return jsonify({
-                        'success': False,
-                        'error': '',
-                        'detail': error_msg,
-                        'suggestion': ''
-                    }), 500
-                else:
-                    # 
-                    return jsonify({
-                        'success': False,
-                        'error': '',
-                        'detail': error_msg,
-                        'suggestion': ''
-                    }), 500
+            result = model.generate(input=audio, fs=16000)
             
-            # Clean up converted temporary files
-            if converted:
-                # Clean up both 16k and 8k versions if they exist
-                for suffix in ['_16k.wav', '_8k.wav', '.wav']:
-                    temp_wav = temp_path.replace(file_ext, suffix)
-                    if temp_wav != temp_path and os.path.exists(temp_wav):
-                        try:
-                            os.unlink(temp_wav)
-                            logger.info(f"Cleaned up: {temp_wav}")
-                        except:
-                            pass
-                try:
-                    os.unlink(final_audio_path)
-                except:
-                    pass
-            
-            if result and len(result) > 0:
-                text = result[0].get("text", "")
-                logger.info(f" : {text}")
-                
-                return jsonify({
-                    'success': True,
-                    'text': text,
-                    'language': 'zh',
-                    'confidence': 1.0
-                })
-            else:
+            if not result or len(result) == 0:
                 logger.warning(" ")
-                return jsonify({
+                return {
                     'success': True,
                     'text': '',
                     'language': 'zh',
-                    'confidence': 0.0
-                })
-        finally:
+                    'confidence': 0.0,
+                    'message': ''
+                }, 200
+        
+        except Exception as model_error:
+            logger.error(f" : {model_error}")
+            logger.error(f"   : {type(model_error).__name__}")
+            traceback.print_exc()
+            
+            error_msg = str(model_error)
+            error_lower = error_msg.lower()
+            
             # 
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-                
+            if 'format' in error_lower or 'codec' in error_lower or 'decode' in error_lower:
+                return {
+                    'success': False,
+                    'error': '',
+                    'detail': error_msg,
+                    'suggestion': ''
+                }, 500
+            elif 'sample' in error_lower or 'rate' in error_lower:
+                return {
+                    'success': False,
+                    'error': '',
+                    'detail': error_msg,
+                    'suggestion': ' 16kHz'
+                }, 500
+            elif 'channel' in error_lower:
+                return {
+                    'success': False,
+                    'error': '',
+                    'detail': error_msg,
+                    'suggestion': ''
+                }, 500
+            else:
+                # 
+                return {
+                    'success': False,
+                    'error': '',
+                    'detail': error_msg,
+                    'suggestion': ''
+                }, 500
+        
+        if result and len(result) > 0:
+            text = result[0].get("text", "")
+            logger.info(f" : {text}")
+            
+            return {
+                'success': True,
+                'text': text,
+                'language': 'zh',
+                'confidence': 1.0
+            }, 200
+        else:
+            logger.warning(" ")
+            return {
+                'success': True,
+                'text': '',
+                'language': 'zh',
+                'confidence': 0.0
+            }, 200
+        
     except Exception as e:
         logger.error(f" : {e}")
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
 
 @app.route('/transcribe-stream', methods=['POST'])
 def transcribe_stream():
@@ -578,7 +567,10 @@ def transcribe_stream():
         "audio": "base64_encoded_audio_chunk",
         "format": "webm",
         "streamId": "unique-stream-id",
-        "isLast": false
+        "isLast": false,
+        "init": "base64_first_chunk"  (optional, WebM init segment / first chunk of this stream;
+                                        needed with API_WORKERS > 1, where chunks may reach another worker)
+        "model": "paraformer-zh"  (optional, defaults to the current model)
     }
     
     
@@ -588,62 +580,148 @@ def transcribe_stream():
         "isFinal": false
     }
     """
-    model = get_current_model()
-    if model is None:
-        return jsonify({
-            'success': False,
-            'error': 'Model not initialized'
-        }), 503
-    
+    return with_model(transcribe_stream_with_model)
+
+def transcribe_stream_with_model(model):
+    """Handle /transcribe-stream with a model held by the registry"""
+    return transcribe_stream_request(model, request.get_json())
+
+def transcribe_stream_request(model, data):
+    """Framework-independent /transcribe-stream core: returns (payload, status)"""
     try:
-        data = request.get_json()
         stream_id = data.get('streamId', 'unknown')
         is_last = data.get('isLast', False)
         
-        import base64
         audio_data = base64.b64decode(data.get('audio', ''))
-        file_ext = "." + data.get('format', 'webm')
+        fmt_hint = data.get('format', 'webm')
         
         if not audio_data:
-            return jsonify({
+            return {
                 'success': False,
                 'error': 'No audio data'
-            }), 400
-        
-        # 
-        with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as temp_file:
-            temp_path = temp_file.name
-            temp_file.write(audio_data)
+            }, 400
         
+        # Decode in memory and pass the samples straight to the model
+        # WebM fragments without a header are joined to this streamId's init segment
+        # (cached per process, or the 'init' the client sent along)
+        init = base64.b64decode(data['init']) if data.get('init') else None
         try:
-            # 
-            result = model.generate(input=temp_path)
-            
-            text = ""
-            if result and len(result) > 0:
-                text = result[0].get("text", "")
-            
-            logger.info(f"  [{stream_id}] isFinal={is_last}: {text}")
-            
-            return jsonify({
-                'success': True,
-                'text': text,
-                'isFinal': is_last,
-                'streamId': stream_id
-            })
-        finally:
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+            audio = decode_audio(
+                audio_data, fmt_hint, stream_id=stream_id, is_last=is_last,
+                sample_rate=data.get('sampleRate'), init=init
+            )
+        except AudioDecodeError as e:
+            logger.warning(f"  [{stream_id}] decode failed: {e}")
+            return {
+                'success': False,
+                'error': f'Unable to decode {fmt_hint} audio',
+                'detail': str(e)
+            }, 400
+        
+        result = model.generate(input=audio, fs=16000)
+        text = result_text(result)
+        
+        logger.info(f"  [{stream_id}] isFinal={is_last}: {text}")
+        
+        return {
+            'success': True,
+            'text': text,
+            'isFinal': is_last,
+            'streamId': stream_id
+        }, 200
                 
     except Exception as e:
         logger.error(f" : {e}")
         traceback.print_exc()
-        return jsonify({
+        return {
+            'success': False,
+            'error': str(e)
+        }, 500
+
+@app.route('/transcribe-batch', methods=['POST'])
+def transcribe_batch():
+    """
+    Transcribe many clips in one request (batched inference, results in input order)
+    
+    Request:
+    - multipart/form-data: one file part per clip (id = filename, format from the part's Content-Type or extension)
+    - application/json: { "clips": [{ "id": "vm-1", "audio": "base64_data", "format": "wav" }, ...], "model": "paraformer-zh" }
+    - Optional ?model= / X-Model header selects the model for this request
+    
+    Response:
+    {
+        "success": true,
+        "results": [{ "id": "vm-1", "success": true, "text": "...", "duration": 3.2 }, ...],
+        "count": 1, "failed": 0, "batches": 1, "audio_s": 3.2, "elapsed_s": 0.4
+    }
+    """
+    model_name = requested_model_name()
+    rejected = check_model(model_name)
+    if rejected:
+        return json_response(*rejected)
+    
+    try:
+        if request.is_json:
+            clips = clips_from_json(request.get_json(silent=True))
+        else:
+            uploads = list(request.files.items(multi=True))
+            check_clip_count(len(uploads))
+            clips = [
+                clip_from_upload(index, upload.filename, upload.content_type, upload.read())
+                for index, (_, upload) in enumerate(uploads)
+            ]
+    except ValueError as e:
+        return json_response({'success': False, 'error': str(e)}, 400)
+    
+    # Decode before taking the model so the slot is only held for inference
+    decoded = decode_clips(clips)
+    return json_response(*call_with_model(model_name, functools.partial(transcribe_batch_request, decoded=decoded)))
+
+def transcribe_batch_request(model, decoded):
+    """Framework-independent /transcribe-batch core on clips decoded by decode_clips: returns (payload, status)"""
+    try:
+        results, stats = transcribe_decoded(model, decoded)
+    except Exception as e:
+        logger.error(f"Batch transcription failed: {e}")
+        traceback.print_exc()
+        return {
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500
+    return dict({'success': True, 'results': results}, **stats), 200
+
+def serve_preforked(host, port, num_workers, run_server=None):
+    """
+    Load models once in the parent, then fork workers sharing the weights and one listening socket.
+    run_server(listener) serves in each worker; defaults to the threaded werkzeug server.
+    """
+    default_model = current_model_name
+    for model_name in API_PRELOAD_MODELS:
+        if not initialize_model(model_name):
+            print(f"\n Failed to preload {model_name}")
+            sys.exit(1)
+    if not initialize_model(default_model):
+        sys.exit(1)
+    readiness.mark(default_model, READY)
+    
+    # Freeze weights (eval, no grad, shared memory) so workers never copy them
+    for model_name, loaded_model in registry.items():
+        if share_model_memory(loaded_model):
+            logger.info(f"Model '{model_name}' frozen in shared memory")
+    logger.info(f"Parent memory after preload: {memory_usage()}")
+    
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+    
+    def run_werkzeug(listener):
+        from werkzeug.serving import make_server
+        make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+    
+    run_server = run_server or run_werkzeug
+    supervise(lambda: run_server(listener), num_workers)
 
 def main():
     """"""
@@ -654,10 +732,12 @@ def main():
     print(f" : {os.getcwd()}")
     print("="*70)
     
-    # 
-    if not initialize_model():
-        print("\n ")
-        sys.exit(1)
+    preforked = API_WORKERS > 1 and supports_fork()
+    if API_WORKERS > 1 and not preforked:
+        logger.warning("fork() not available on this platform, running a single process")
+    if not preforked:
+        # Bind the port right away; /health and /transcribe return 503 + Retry-After until the model is ready
+        load_default_model_in_background()
     
     print("\n" + "="*70)
     print(" API ")
@@ -666,9 +746,16 @@ def main():
     print("  - GET  /health           : ")
     print("  - POST /transcribe       : ")
     print("  - POST /transcribe-stream: ")
+    print("  - POST /transcribe-batch : batched multi-clip transcription")
     print("\n : http://0.0.0.0:5000")
+    if preforked:
+        print(f" Workers: {API_WORKERS} (preloaded: {', '.join(API_PRELOAD_MODELS)})")
     print("="*70 + "\n")
     
+    if preforked:
+        serve_preforked('0.0.0.0', 5000, API_WORKERS)
+        return
+    
     #  Flask 
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True, use_reloader=False)
 
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paraformer HTTP API 的异步（ASGI）前端
+
+与 paraformer_api_server.py 使用相同的模型配置、注册表与 JSON 协议
+（/transcribe、/transcribe-stream、/transcribe-batch、/health、/models、/switch_model），
+但由 Starlette + uvicorn 在事件循环中处理连接（支持 HTTP keep-alive），
+推理交给有界的 InferenceExecutor 线程池：
+
+- 排队 + 执行中的推理（包括等待模型名额的请求）达到 API_MAX_PENDING 时直接返回
+  429 + Retry-After，不再为每个请求新开线程，突发流量下尾延迟由队列长度决定
+- 准入在事件循环中完成，线程池里的推理从不等待：模型的并发名额在进入线程池之前
+  用 registry.reserve() 占用，已满时请求在事件循环中排队（不占用线程），
+  MODEL_QUEUE_TIMEOUT_S 内仍未占到才返回 429；模型不在内存中时返回 503 + Retry-After
+  并在后台加载。某个模型的突发流量或加载不会占满线程池、拖慢其他模型
+
+环境变量：
+    API_INFERENCE_WORKERS  推理线程数（默认 4）
+    API_MAX_PENDING        同时排队 + 执行中的推理上限，超过返回 429（默认 16）
+    MODEL_QUEUE_TIMEOUT_S  同 model_registry.py：等待模型名额的最长秒数，超时返回 429（默认 30）
+    API_RETRY_AFTER        429 响应的 Retry-After 秒数（默认 1）
+    API_KEEPALIVE_S        空闲 keep-alive 连接保留秒数（默认 75）
+    API_PORT               监听端口（默认 5000）
+    API_WORKERS / API_PRELOAD_MODELS  同 paraformer_api_server.py（预加载后 fork 多进程）
+
+用法：
+    python paraformer_asgi_server.py
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import batch_transcribe
+import paraformer_api_server as api
+from inference_executor import InferenceExecutor
+from worker_pool import supports_fork, worker_state
+
+logger = logging.getLogger(__name__)
+
+API_INFERENCE_WORKERS = int(os.getenv("API_INFERENCE_WORKERS", "4"))
+API_MAX_PENDING = int(os.getenv("API_MAX_PENDING", "16"))
+API_RETRY_AFTER = int(os.getenv("API_RETRY_AFTER", "1"))
+API_KEEPALIVE_S = int(os.getenv("API_KEEPALIVE_S", "75"))
+API_PORT = int(os.getenv("API_PORT", "5000"))
+
+# Inference always runs on threads: the registry and model slots live in this process
+inference = InferenceExecutor(kind='thread', max_workers=API_INFERENCE_WORKERS, max_pending=API_MAX_PENDING)
+frontend_stats = {'requests': 0, 'rejected': 0, 'model_busy': 0, 'queued': 0}
+
+# Backoff while polling for a model slot on the event loop
+RESERVE_POLL_MIN_S = 0.005
+RESERVE_POLL_MAX_S = 0.1
+
+
+def json_response(payload, status=200, headers=None):
+    return JSONResponse(payload, status_code=status, headers=headers)
+
+
+async def read_json(request):
+    """JSON body or None (invalid JSON is treated like a missing body, as in Flask's silent mode)"""
+    if 'json' not in request.headers.get('content-type', ''):
+        return None
+    try:
+        return json.loads(await request.body() or b'null')
+    except ValueError:
+        return None
+
+
+def requested_model_name(request, json_data):
+    """Model for this request: ?model=, X-Model header or JSON "model", else the default model"""
+    model_name = request.query_params.get('model') or request.headers.get('x-model')
+    if not model_name and isinstance(json_data, dict):
+        model_name = json_data.get('model')
+    return model_name or api.current_model_name
+
+
+def saturated():
+    """In-flight inference plus requests queued for a model slot reached API_MAX_PENDING"""
+    return inference.saturated or inference.pending + frontend_stats['queued'] >= inference.max_pending
+
+
+def busy_response(error):
+    return json_response({'success': False, 'error': error}, 429, {'Retry-After': str(API_RETRY_AFTER)})
+
+
+async def reserve(model_name):
+    """
+    Wait on the event loop (never in a thread) for one of the model's slots, up to the
+    registry's queue_timeout (MODEL_QUEUE_TIMEOUT_S). Returns a reservation or None on timeout.
+    """
+    reservation = api.registry.reserve(model_name, count_rejected=False)
+    if reservation is not None:
+        return reservation
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + api.registry.queue_timeout
+    delay = RESERVE_POLL_MIN_S
+    frontend_stats['queued'] += 1
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return api.registry.reserve(model_name)  # last try; counts the rejection
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, RESERVE_POLL_MAX_S)
+            reservation = api.registry.reserve(model_name, count_rejected=False)
+            if reservation is not None:
+                return reservation
+    finally:
+        frontend_stats['queued'] -= 1
+
+
+async def admit(model_name):
+    """
+    Admission on the event loop: (rejection response, None) or (None, reservation).
+    The reservation holds one of the model's slots; run_admitted hands it to the pool.
+    """
+    rejected = api.check_model(model_name)
+    if rejected:
+        return json_response(*rejected), None
+
+    if saturated():
+        frontend_stats['rejected'] += 1
+        return busy_response('Server is busy, retry later'), None
+
+    if model_name not in api.registry:
+        # Non-default model not resident (never loaded or evicted): load it off the request path
+        api.load_model_in_background(model_name)
+        return json_response(*api.model_loading_payload(model_name)), None
+
+    reservation = await reserve(model_name)
+    if reservation is None:
+        frontend_stats['model_busy'] += 1
+        return busy_response(f'Model {model_name} is busy, retry later'), None
+    return None, reservation
+
+
+async def run_admitted(model_name, reservation, handler):
+    """Run handler(model) in the inference pool on the slot reserved by admit()"""
+    try:
+        return json_response(*await inference.run(api.call_with_model, model_name, handler, reservation=reservation))
+    finally:
+        reservation.cancel()  # no-op once call_with_model took the slot over (e.g. request cancelled while queued)
+
+
+async def run_with_model(request, json_data, handler):
+    """Admit the request on the event loop and run handler(model) in the bounded inference pool"""
+    frontend_stats['requests'] += 1
+    model_name = requested_model_name(request, json_data)
+    rejected, reservation = await admit(model_name)
+    if rejected:
+        return rejected
+    return await run_admitted(model_name, reservation, handler)
+
+
+async def transcribe(request):
+    json_data = await read_json(request)
+    body = b'' if json_data is not None else await request.body()
+    handler = functools.partial(
+        api.transcribe_request, content_type=request.headers.get('content-type'), body=body, json_data=json_data
+    )
+    return await run_with_model(request, json_data, handler)
+
+
+async def transcribe_stream(request):
+    json_data = await read_json(request)
+    if not isinstance(json_data, dict):
+        # Reject before admission: no model slot is taken and nothing reaches the inference pool
+        return json_response({
+            'success': False,
+            'error': 'Expected a JSON body'
+        }, 400)
+    return await run_with_model(request, json_data, functools.partial(api.transcribe_stream_request, data=json_data))
+
+
+async def transcribe_batch(request):
+    frontend_stats['requests'] += 1
+    json_data = await read_json(request)
+    try:
+        if json_data is not None:
+            fields = json_data
+            clips = batch_transcribe.clips_from_json(json_data)
+        else:
+            form = await request.form(max_files=batch_transcribe.TRANSCRIBE_BATCH_MAX_CLIPS)
+            fields = {'model': form.get('model')}
+            uploads = [value for _, value in form.multi_items() if not isinstance(value, str)]
+            batch_transcribe.check_clip_count(len(uploads))
+            clips = [
+                batch_transcribe.clip_from_upload(index, upload.filename, upload.content_type, await upload.read())
+                for index, upload in enumerate(uploads)
+            ]
+    except ValueError as e:
+        return json_response({'success': False, 'error': str(e)}, 400)
+
+    model_name = requested_model_name(request, fields)
+    rejected = api.check_model(model_name)
+    if rejected:
+        return json_response(*rejected)
+
+    # Decode on the default executor first; the model slot and the inference pool are only held for inference
+    loop = asyncio.get_running_loop()
+    decoded = await loop.run_in_executor(None, batch_transcribe.decode_clips, clips)
+    rejected, reservation = await admit(model_name)
+    if rejected:
+        return rejected
+    return await run_admitted(model_name, reservation, functools.partial(api.transcribe_batch_request, decoded=decoded))
+
+
+async def health(request):
+    payload, status, headers = api.health_payload()
+    if status == 200:
+        payload['inference'] = dict(frontend_stats, pending=inference.pending, executor=inference.describe())
+    return json_response(payload, status, headers)
+
+
+async def models(request):
+    return json_response(*api.models_payload())
+
+
+async def switch_model(request):
+    # Loading can take a while; keep it off the event loop and out of the inference pool
+    json_data = await read_json(request)
+    loop = asyncio.get_running_loop()
+    return json_response(*await loop.run_in_executor(None, api.switch_model_payload, json_data))
+
+
+class CountRequests:
+    """In-flight request counters in worker_state (shown in /health)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        worker_state['connections'] += 1
+        worker_state['connections_total'] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            worker_state['connections'] -= 1
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/models', models, methods=['GET']),
+        Route('/switch_model', switch_model, methods=['POST']),
+        Route('/transcribe', transcribe, methods=['POST']),
+        Route('/transcribe-stream', transcribe_stream, methods=['POST']),
+        Route('/transcribe-batch', transcribe_batch, methods=['POST']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(CountRequests),
+    ],
+)
+
+
+def uvicorn_config(**kwargs):
+    return uvicorn.Config(
+        app,
+        timeout_keep_alive=API_KEEPALIVE_S,
+        access_log=False,
+        log_level='info',
+        **kwargs
+    )
+
+
+def main():
+    host, port = '0.0.0.0', API_PORT
+    preforked = api.API_WORKERS > 1 and supports_fork()
+    if api.API_WORKERS > 1 and not preforked:
+        logger.warning("fork() not available on this platform, running a single process")
+
+    print("\n" + "="*70)
+    print("  Paraformer ASGI API")
+    print("="*70)
+    print(f" Python: {sys.version.split()[0]}")
+    print(f" Inference: {inference.describe()}, keep-alive {API_KEEPALIVE_S}s")
+    print(f" Listening: http://{host}:{port}")
+    if preforked:
+        print(f" Workers: {api.API_WORKERS} (preloaded: {', '.join(api.API_PRELOAD_MODELS)})")
+    print("="*70 + "\n")
+
+    if preforked:
+        api.serve_preforked(
+            host, port, api.API_WORKERS,
+            run_server=lambda listener: uvicorn.Server(uvicorn_config(fd=listener.fileno())).run()
+        )
+        return
+
+    # Bind first; /health and /transcribe return 503 + Retry-After until the default model is ready
+    api.load_default_model_in_background()
+    uvicorn.Server(uvicorn_config(host=host, port=port)).run()
+
+
+if __name__ == "__main__":
+    main()
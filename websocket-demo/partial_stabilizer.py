@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+中间结果稳定化
+
+把每个会话的中间识别结果分为「已提交的稳定前缀」和「仍可能变化的尾部」，
+文本没有变化时不再发送；增量模式下只发送新提交的字符和当前尾部。
+
+客户端还原方式：
+    committed_text = committed_text[:offset] + committed
+    显示文本 = committed_text + tail
+"""
+
+import os
+from collections import deque
+
+# 连续多少次中间结果都相同的前缀视为稳定
+PARTIAL_STABLE_AFTER = int(os.getenv("PARTIAL_STABLE_AFTER", "2"))
+
+
+class PartialStabilizer:
+    """跟踪一个会话的稳定前缀与不稳定尾部"""
+
+    def __init__(self, stable_after=PARTIAL_STABLE_AFTER):
+        self.stable_after = max(1, stable_after)
+        self.reset()
+
+    def reset(self):
+        self.committed = ""
+        self.last_text = None
+        self._history = deque(maxlen=self.stable_after)
+
+    def update(self, text, stable_prefix=None):
+        """
+        提交一次新的完整假设
+
+        Args:
+            text: 当前完整的中间结果
+            stable_prefix: 调用方已确定不会再变的前缀（如已完成分段的终稿）；
+                为空时取最近 stable_after 次假设的公共前缀
+
+        Returns:
+            文本未变化时返回 None，否则返回增量
+            {'offset', 'committed', 'tail', 'text'}
+        """
+        if text == self.last_text:
+            return None
+        self.last_text = text
+        self._history.append(text)
+
+        if stable_prefix is None:
+            stable_prefix = self.committed
+            if len(self._history) == self._history.maxlen:
+                stable_prefix = os.path.commonprefix(list(self._history))
+            if len(stable_prefix) < len(self.committed):
+                stable_prefix = self.committed
+
+        # 新假设推翻了已提交的内容时，从头重新提交
+        offset = len(self.committed)
+        if not (stable_prefix.startswith(self.committed) and text.startswith(stable_prefix)):
+            offset = 0
+            stable_prefix = os.path.commonprefix([stable_prefix, text])
+
+        delta = {
+            'offset': offset,
+            'committed': stable_prefix[offset:],
+            'tail': text[len(stable_prefix):],
+            'text': text,
+        }
+        self.committed = stable_prefix
+        return delta
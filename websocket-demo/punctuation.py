@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量实时标点
+
+使用 CT-Transformer 实时标点模型，每个会话携带自己的 cache，
+每次只处理新提交的文本，单次标点的开销与会话已运行的时长无关。
+"""
+
+import os
+
+from audio_utils import result_text
+
+# 实时标点模型（带 cache 的 CT-Transformer 变体）
+PUNC_MODEL = os.getenv("PUNC_MODEL", "iic/punc_ct-transformer_zh-cn-common-vad_realtime-vocab272727")
+PUNC_MODEL_REVISION = os.getenv("PUNC_MODEL_REVISION", "v2.0.4")
+
+
+class IncrementalPunctuator:
+    """一个会话的标点状态
+
+    model 为固定的模型；模型在后台加载时传入 provider()，每次调用时取当前模型，
+    模型就绪之前文本原样返回。
+    """
+
+    def __init__(self, model=None, provider=None):
+        self._model = model
+        self.provider = provider
+        self.cache = {}
+
+    @property
+    def model(self):
+        return self.provider() if self.provider is not None else self._model
+
+    def punctuate(self, text):
+        """为新提交的文本加标点，前文上下文由 cache 提供"""
+        model = self.model
+        if not text or model is None:
+            return text
+        result = model.generate(input=text, cache=self.cache)
+        return result_text(result) or text
+
+    def reset(self):
+        self.cache = {}
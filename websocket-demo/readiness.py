@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务就绪状态
+
+服务先绑定端口再在后台加载模型。每个模型加载完成后调用 mark()，
+所有必需模型就绪后服务整体变为 ready；可选模型（如标点）继续在后台加载，
+不阻塞识别。就绪之前到达的会话可以等待一段时间，超时则礼貌地拒绝。
+
+环境变量：
+    READY_WAIT_S       未就绪时新会话最多等待的秒数（默认 30，0 表示立即拒绝）
+    READY_RETRY_AFTER  拒绝时建议客户端重试的秒数（默认 5）
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+READY_WAIT_S = float(os.getenv("READY_WAIT_S", "30"))
+READY_RETRY_AFTER = int(os.getenv("READY_RETRY_AFTER", "5"))
+
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class Readiness:
+    """跟踪各模型的加载状态，线程安全（加载在工作线程中进行）"""
+
+    def __init__(self, required=(), optional=()):
+        self.started = time.time()
+        self.ready_at = None
+        self.error = None
+        self.required = tuple(required)
+        self.components = {name: LOADING for name in tuple(required) + tuple(optional)}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    @property
+    def ready(self):
+        return self._event.is_set()
+
+    @property
+    def state(self):
+        if self.ready:
+            return READY
+        return FAILED if self.error else LOADING
+
+    def mark(self, name, state):
+        """记录一个模型的状态；必需模型全部就绪时整体变为 ready"""
+        with self._lock:
+            self.components[name] = state
+            if state == FAILED and name in self.required:
+                self.error = f"{name} failed to load"
+            if not self.ready and all(self.components.get(n) == READY for n in self.required):
+                self.ready_at = time.time()
+                self._event.set()
+
+    def set_ready(self):
+        """没有需要跟踪的模型（如已在启动前加载完毕）时直接置为 ready"""
+        for name in self.components:
+            self.mark(name, READY)
+        with self._lock:
+            if not self.ready:
+                self.ready_at = time.time()
+                self._event.set()
+
+    def set_failed(self, error):
+        with self._lock:
+            self.error = str(error)
+
+    async def wait(self, timeout=READY_WAIT_S, interval=0.1):
+        """等待就绪，返回是否已就绪（加载失败时立即返回 False）"""
+        deadline = time.monotonic() + timeout
+        while not self.ready and not self.error and time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+        return self.ready
+
+    def status(self):
+        return {
+            'state': self.state,
+            'components': dict(self.components),
+            'error': self.error,
+            'uptime_s': round(time.time() - self.started, 3),
+            'load_s': round(self.ready_at - self.started, 3) if self.ready_at else None,
+            'retry_after': None if self.ready else READY_RETRY_AFTER,
+        }
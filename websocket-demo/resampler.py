@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式多相重采样
+
+浏览器按设备原生采样率（44.1k / 48k 等）采集，模型只接受 16kHz。
+StreamingResampler 用 Kaiser 窗 sinc 低通滤波器做有理数比 L/M 的多相重采样，
+按块输入、按块输出，块边界处的滤波器历史保存在对象里，
+分块处理与整段一次处理的结果一致；每块的计算用 NumPy 向量化完成。
+
+    resampler = StreamingResampler(48000)
+    out = resampler.process(chunk)        # float32 → float32
+    out = resampler.process_pcm16(data)   # 16-bit PCM 字节 → 16-bit PCM 字节
+    tail = resampler.flush()              # 流结束时取出滤波器中剩余的样本
+
+一次性转换整段音频使用 resample(audio, sample_rate)。
+"""
+
+import functools
+import math
+
+import numpy as np
+
+TARGET_RATE = 16000
+
+# 每侧的过零点数（越大过渡带越陡、延迟越长）与截止频率相对奈奎斯特频率的比例
+ZERO_CROSSINGS = 16
+ROLLOFF = 0.945
+KAISER_BETA = 8.6
+
+# 每次向量化计算的最大输出样本数，限制中间矩阵的内存
+BLOCK = 4096
+
+
+@functools.lru_cache(maxsize=32)
+def _polyphase_filter(up, down):
+    """返回 (L 个相位 × K 个抽头的系数矩阵, 以上采样率计的滤波器延迟)"""
+    stretch = max(up, down)
+    half = ZERO_CROSSINGS * int(math.ceil(stretch / ROLLOFF))
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    cutoff = ROLLOFF * 0.5 / stretch  # 相对上采样后的采样率
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), KAISER_BETA) * up
+
+    k = int(math.ceil(len(taps) / up))
+    padded = np.zeros(k * up)
+    padded[:len(taps)] = taps
+    # phases[p, j] = h[p + j * L]
+    phases = padded.reshape(k, up).T.astype(np.float32)
+    return np.ascontiguousarray(phases), half
+
+
+class StreamingResampler:
+    """有状态的流式重采样器，一个音频流一个实例"""
+
+    def __init__(self, in_rate, out_rate=TARGET_RATE):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        g = math.gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        self.passthrough = self.up == self.down
+        if not self.passthrough:
+            self._phases, self._delay = _polyphase_filter(self.up, self.down)
+            self._taps = self._phases.shape[1]
+        self.reset()
+
+    def reset(self):
+        """开始新的流：清空滤波器历史"""
+        self._consumed = 0   # 已输入的样本总数
+        self._produced = 0   # 已输出的样本总数
+        self._odd_byte = b''
+        if not self.passthrough:
+            # 缓冲区第 0 个样本的绝对下标；开头补零代替信号开始之前的历史
+            self._history = np.zeros(self._taps, dtype=np.float32)
+            self._history_start = -self._taps
+
+    def _compute(self, buffer, buffer_start, count):
+        """计算输出 [produced, produced + count)"""
+        out = np.empty(count, dtype=np.float32)
+        offsets = np.arange(self._taps)
+        for block_start in range(0, count, BLOCK):
+            n = np.arange(self._produced + block_start, self._produced + min(count, block_start + BLOCK))
+            t = n * self.down + self._delay  # 上采样时间轴上的位置（含延迟补偿）
+            newest = t // self.up - buffer_start
+            index = newest[:, None] - offsets[None, :]
+            out[block_start:block_start + len(n)] = np.einsum(
+                'ij,ij->i', self._phases[t % self.up], buffer[index]
+            )
+        self._produced += count
+        return out
+
+    def _run(self, samples, final):
+        buffer = np.concatenate((self._history, samples))
+        buffer_start = self._history_start
+        self._consumed += len(samples)
+
+        if final:
+            # 末尾补零，把滤波器中剩余的样本全部输出
+            buffer = np.concatenate((buffer, np.zeros(self._taps, dtype=np.float32)))
+            total = -(-self._consumed * self.up // self.down)
+        else:
+            # 只输出所需输入已经全部到达的样本
+            last = buffer_start + len(buffer) - 1
+            total = max(0, ((last + 1) * self.up - self._delay - 1) // self.down + 1)
+            total = min(total, -(-self._consumed * self.up // self.down))
+        count = max(0, total - self._produced)
+        out = self._compute(buffer, buffer_start, count)
+
+        # 只保留下一个输出还会用到的历史
+        next_t = self._produced * self.down + self._delay
+        keep_from = next_t // self.up - self._taps + 1
+        cut = min(max(0, keep_from - buffer_start), len(buffer))
+        self._history = buffer[cut:]
+        self._history_start = buffer_start + cut
+        return out
+
+    def process(self, samples):
+        """输入一块 float32 样本，返回已经可以确定的输出样本"""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if self.passthrough:
+            return samples
+        return self._run(samples, final=False)
+
+    def flush(self):
+        """流结束：返回剩余的输出样本，之后可以 reset() 复用"""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        out = self._run(np.zeros(0, dtype=np.float32), final=True)
+        self.reset()
+        return out
+
+    def process_pcm16(self, data, final=False):
+        """16-bit PCM 字节进出；跨块的奇数字节留到下一块"""
+        data = self._odd_byte + bytes(data)
+        usable = len(data) // 2 * 2
+        self._odd_byte = data[usable:]
+        if self.passthrough:
+            return data[:usable]
+        samples = np.frombuffer(data, dtype='<i2', count=usable // 2).astype(np.float32) / 32768.0
+        out = self.process(samples)
+        if final:
+            out = np.concatenate((out, self.flush()))
+        return float32_to_pcm16(out)
+
+
+def float32_to_pcm16(audio):
+    """[-1, 1) 的 float32 → 16-bit PCM 字节（截断到量程内）"""
+    return (np.clip(audio, -1.0, 32767 / 32768) * 32768.0).astype('<i2').tobytes()
+
+
+def resample(audio, in_rate, out_rate=TARGET_RATE):
+    """一次性重采样整段音频"""
+    if not in_rate or int(in_rate) == int(out_rate) or not len(audio):
+        return np.asarray(audio, dtype=np.float32)
+    resampler = StreamingResampler(in_rate, out_rate)
+    return np.concatenate((resampler.process(audio), resampler.flush()))
@@ -0,0 +1,38 @@
+@echo off
+chcp 65001 >nul
+title FunASR Inference Daemon
+
+echo ======================================================================
+echo Starting FunASR Inference Daemon...
+echo ======================================================================
+echo.
+echo Address: tcp:127.0.0.1:10097
+echo Clients: set MODEL_BACKEND=remote before starting the other servers
+echo.
+
+:: Get script directory and navigate to it
+set "SCRIPT_DIR=%~dp0"
+cd /d "%SCRIPT_DIR%"
+
+:: Find Python in parent directory's venv
+set "PYTHON_EXE=%SCRIPT_DIR%..\paraformer-asr\venv\Scripts\python.exe"
+
+if not exist "%PYTHON_EXE%" (
+    echo Error: Python not found at %PYTHON_EXE%
+    echo Please ensure virtual environment is created.
+    pause
+    exit /b 1
+)
+
+echo Using Python: %PYTHON_EXE%
+echo Working directory: %CD%
+echo.
+
+if not defined INFERENCE_DAEMON set "INFERENCE_DAEMON=tcp:127.0.0.1:10097"
+"%PYTHON_EXE%" inference_daemon.py
+
+echo.
+echo ======================================================================
+echo Service stopped
+echo ======================================================================
+pause
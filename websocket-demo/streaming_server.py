@@ -6,15 +6,22 @@ Based on reference code with improvements
 """
 
 import asyncio
+import functools
 import websockets
 import logging
 import numpy as np
 import torch
 import json
-import wave
-import tempfile
 import os
-from funasr import AutoModel
+
+from audio_utils import pcm16_to_float32
+from audio_buffer import AudioBuffer
+from resampler import StreamingResampler
+from ingest_queue import IngestQueue, WS_MAX_MESSAGE_BYTES, WS_MAX_QUEUE
+from worker_pool import WSS_WORKERS, run_workers, tracked, worker_state
+from inference_executor import InferenceExecutor
+from batch_scheduler import BatchScheduler
+from model_backends import load_model
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +35,9 @@ asr_model = None
 vad_model = None
 vad_utils = None
 
+# Blocking model calls run here so the event loop only does I/O
+inference = InferenceExecutor()
+
 # VAD configuration
 VAD_CONFIG = {
     'threshold': 0.5,           # Speech probability threshold
@@ -77,26 +87,15 @@ def load_asr_model(model_name='paraformer-zh'):
             # Try local path first
             local_path = '../models/iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'
             if os.path.exists(local_path):
-                asr_model = AutoModel(
-                    model=local_path,
-                    device="cpu",
-                    disable_update=True,
-                )
+                asr_model = load_model(local_path)
             else:
-                asr_model = AutoModel(
-                    model='iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch',
-                    model_revision='master',
-                    device="cpu",
-                    disable_update=True,
+                asr_model = load_model(
+                    'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch',
+                    revision='master',
                 )
         else:
             # Default paraformer-zh
-            asr_model = AutoModel(
-                model='paraformer-zh',
-                model_revision='v2.0.4',
-                device="cpu",
-                disable_update=True,
-            )
+            asr_model = load_model('paraformer-zh', revision='v2.0.4')
         
         logger.info("ASR model loaded successfully")
         return True
@@ -105,59 +104,59 @@ def load_asr_model(model_name='paraformer-zh'):
         return False
 
 
+def vad_probability(frame):
+    """Blocking Silero VAD call on one frame, executed on the inference executor"""
+    audio_float32 = int2float(np.frombuffer(frame, np.int16))
+    with torch.no_grad():
+        return vad_model(
+            torch.from_numpy(audio_float32), 
+            VAD_CONFIG['sample_rate']
+        ).item()
+
+
 async def process_audio_with_vad(audio_data):
     """Process audio chunk with VAD"""
     if not vad_model or len(audio_data) < VAD_CONFIG['frame_size']:
         return None
     
     try:
-        audio_int16 = np.frombuffer(audio_data[:VAD_CONFIG['frame_size']], np.int16)
-        audio_float32 = int2float(audio_int16)
-        
-        with torch.no_grad():
-            speech_prob = vad_model(
-                torch.from_numpy(audio_float32), 
-                VAD_CONFIG['sample_rate']
-            ).item()
-        
-        return speech_prob
+        # Silero keeps its recurrent state between calls, so stay on the thread pool;
+        # copy the frame, the buffer view is only valid until its next write
+        frame = bytes(audio_data[:VAD_CONFIG['frame_size']])
+        return await inference.run_stateful(vad_probability, frame)
     except Exception as e:
         logger.error(f"VAD processing error: {e}")
         return None
 
 
+def run_asr_batch(segments):
+    """Blocking batched ASR call, executed on the inference executor"""
+    results = asr_model.generate(
+        input=[pcm16_to_float32(segment) for segment in segments],
+        fs=VAD_CONFIG['sample_rate'],
+        batch_size=len(segments),
+    )
+    texts = [""] * len(segments)
+    for i, result in enumerate(results or []):
+        texts[i] = result.get('text', '')
+    return texts
+
+
+# Merges recognition requests from all clients into batched forward passes
+asr_scheduler = BatchScheduler(run_asr_batch, inference, name='asr')
+
+
 async def recognize_audio(audio_data):
     """Perform ASR on audio data"""
     if not asr_model or len(audio_data) < 1000:
         return ""
     
     try:
-        # Save to temporary WAV file
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            tmp_path = tmp_file.name
-            
-            # Convert to numpy array
-            audio_array = np.frombuffer(audio_data, dtype=np.int16)
-            
-            # Write WAV file
-            with wave.open(tmp_path, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)
-                wav_file.setframerate(VAD_CONFIG['sample_rate'])
-                wav_file.writeframes(audio_array.tobytes())
-        
-        # Perform recognition
-        result = asr_model.generate(input=tmp_path, batch_size=1)
-        
-        # Clean up
-        os.unlink(tmp_path)
-        
-        if result and len(result) > 0:
-            text = result[0].get('text', '')
+        # Pass the PCM samples straight to the model, batched with other clients
+        text = await asr_scheduler.submit(bytes(audio_data))
+        if text:
             logger.info(f"Recognition result: {text}")
-            return text
-        
-        return ""
+        return text
         
     except Exception as e:
         logger.error(f"Recognition error: {e}")
@@ -174,38 +173,55 @@ async def handle_streaming_client(websocket, path):
     begin_count = 0
     end_count = 0
     
-    # Audio buffers
-    audio_buffer = b''
-    speech_buffer = b''
+    # Audio buffers (preallocated, frames are read as zero-copy views)
+    audio_buffer = AudioBuffer()
+    speech_buffer = AudioBuffer(capacity=VAD_CONFIG['sample_rate'] * 2 * 10)
+    # Client audio at its native rate (config message 'sampleRate') is resampled to 16kHz on arrival
+    resampler = StreamingResampler(VAD_CONFIG['sample_rate'])
+    
+    async def flow_control(action, stats):
+        await websocket.send(json.dumps({'type': 'flow_control', 'action': action, **stats}))
+        logger.warning(f"Flow control {action} (client: {client_id}, queued {stats['queued_bytes']} bytes)")
+    
+    # The reader task only receives; this coroutine processes in order and
+    # the reader stops reading from the socket when the queue is full
+    ingest = IngestQueue(notify=flow_control)
+    reader = asyncio.create_task(ingest.feed_from(websocket))
     
     try:
-        async for message in websocket:
+        while True:
+            message = await ingest.get()
+            if message is None:
+                break
+            
             # Handle binary audio data
-            if isinstance(message, bytes):
-                audio_buffer += message
+            if not isinstance(message, str):
+                audio_buffer.write(resampler.process_pcm16(message))
+                # When backlogged, skip the per-frame VAD status chatter
+                drop_partials = ingest.should_drop_partials()
                 
                 # Process when we have enough data
                 while len(audio_buffer) >= VAD_CONFIG['frame_size']:
-                    frame = audio_buffer[:VAD_CONFIG['frame_size']]
-                    audio_buffer = audio_buffer[VAD_CONFIG['frame_size']:]
+                    frame = audio_buffer.read(VAD_CONFIG['frame_size'])
                     
                     # Perform VAD
                     speech_prob = await process_audio_with_vad(frame)
                     
                     if speech_prob is None:
                         # No VAD available, accumulate and send back empty
-                        speech_buffer += frame
-                        await websocket.send(json.dumps({
-                            'type': 'vad_status',
-                            'probability': 0
-                        }))
+                        speech_buffer.write(frame)
+                        if not drop_partials:
+                            await websocket.send(json.dumps({
+                                'type': 'vad_status',
+                                'probability': 0
+                            }))
                         continue
                     
                     # State machine logic
                     if state == 0:  # Waiting for speech
                         if speech_prob > VAD_CONFIG['threshold']:
                             begin_count += 1
-                            speech_buffer += frame
+                            speech_buffer.write(frame)
                             
                             if begin_count >= VAD_CONFIG['begin_frames']:
                                 # Speech started
@@ -217,10 +233,10 @@ async def handle_streaming_client(websocket, path):
                                 }))
                         else:
                             begin_count = 0
-                            speech_buffer = b''
+                            speech_buffer.clear()
                     
                     elif state == 1:  # In speech
-                        speech_buffer += frame
+                        speech_buffer.write(frame)
                         
                         if speech_prob < VAD_CONFIG['threshold']:
                             end_count += 1
@@ -232,7 +248,7 @@ async def handle_streaming_client(websocket, path):
                                 logger.info(f"Speech ended, recognizing... (client: {client_id})")
                                 
                                 # Perform recognition
-                                text = await recognize_audio(speech_buffer)
+                                text = await recognize_audio(speech_buffer.view())
                                 
                                 # Send result
                                 await websocket.send(json.dumps({
@@ -242,19 +258,20 @@ async def handle_streaming_client(websocket, path):
                                 }))
                                 
                                 # Reset buffer
-                                speech_buffer = b''
+                                speech_buffer.clear()
                         else:
                             end_count = 0
                     
                     # Send VAD status
-                    await websocket.send(json.dumps({
-                        'type': 'vad_status',
-                        'probability': speech_prob,
-                        'state': 'speech' if state == 1 else 'silence'
-                    }))
+                    if not drop_partials:
+                        await websocket.send(json.dumps({
+                            'type': 'vad_status',
+                            'probability': speech_prob,
+                            'state': 'speech' if state == 1 else 'silence'
+                        }))
             
             # Handle JSON control messages
-            elif isinstance(message, str):
+            else:
                 try:
                     data = json.loads(message)
                     msg_type = data.get('type')
@@ -264,14 +281,26 @@ async def handle_streaming_client(websocket, path):
                         state = 0
                         begin_count = 0
                         end_count = 0
-                        audio_buffer = b''
-                        speech_buffer = b''
+                        audio_buffer.clear()
+                        speech_buffer.clear()
+                        resampler.reset()
                         logger.info(f"Client reset: {client_id}")
                         
+                    elif msg_type == 'stats':
+                        # Batch-size / queue-wait histograms and this client's ingest queue
+                        await websocket.send(json.dumps({
+                            'type': 'stats',
+                            'batching': asr_scheduler.stats(),
+                            'ingest': ingest.stats(),
+                            'worker': worker_state
+                        }))
+                        
                     elif msg_type == 'config':
                         # Update configuration
                         if 'threshold' in data:
                             VAD_CONFIG['threshold'] = data['threshold']
+                        if 'sampleRate' in data:
+                            resampler = StreamingResampler(int(data['sampleRate']), VAD_CONFIG['sample_rate'])
                         logger.info(f"Config updated: {client_id}")
                         
                 except json.JSONDecodeError:
@@ -281,9 +310,26 @@ async def handle_streaming_client(websocket, path):
         logger.info(f"Client disconnected: {client_id}")
     except Exception as e:
         logger.error(f"Error handling client {client_id}: {e}")
+    finally:
+        reader.cancel()
+
+
+async def serve(host, port, reuse_port=False):
+    """Run the WebSocket server in the current process"""
+    async with websockets.serve(
+        tracked(handle_streaming_client),
+        host,
+        port,
+        ping_interval=20,
+        ping_timeout=10,
+        max_size=WS_MAX_MESSAGE_BYTES,
+        max_queue=WS_MAX_QUEUE,
+        reuse_port=reuse_port
+    ):
+        await asyncio.Future()  # Run forever
 
 
-async def main():
+def main():
     """Main server function"""
     logger.info("="*70)
     logger.info("Streaming ASR Server Starting...")
@@ -305,22 +351,19 @@ async def main():
     
     logger.info("="*70)
     logger.info(f"Server listening on ws://{host}:{port}")
+    logger.info(f"Inference executor: {inference.describe()}")
+    logger.info(f"ASR batching: up to {asr_scheduler.max_batch_size} requests, "
+                f"max wait {asr_scheduler.max_wait * 1000:.0f}ms")
+    logger.info(f"Workers: {WSS_WORKERS}")
     logger.info("Ready to accept connections")
     logger.info("="*70)
     
-    async with websockets.serve(
-        handle_streaming_client,
-        host,
-        port,
-        ping_interval=20,
-        ping_timeout=10
-    ):
-        await asyncio.Future()  # Run forever
+    run_workers(functools.partial(serve, host, port))
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         logger.info("\nServer stopped by user")
     except Exception as e:
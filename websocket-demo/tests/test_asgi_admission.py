@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASGI 前端准入测试：模型名额已满时请求在事件循环中排队，
+MODEL_QUEUE_TIMEOUT_S 内仍未占到名额才返回 429。
+
+使用假模型，不需要 funasr；需要 starlette 与 httpx，找不到时跳过。
+
+    python -m pytest websocket-demo/tests/test_asgi_admission.py
+"""
+
+import asyncio
+import io
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+import pytest
+
+pytest.importorskip('starlette')
+httpx = pytest.importorskip('httpx')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import paraformer_api_server as api  # noqa: E402
+import paraformer_asgi_server as asgi  # noqa: E402
+from readiness import READY  # noqa: E402
+
+MODEL = 'paraformer-zh'
+DELAY_S = 0.2
+
+
+class FakeModel:
+    def __init__(self):
+        self.delay = DELAY_S
+        self.running = 0
+        self.peak = 0
+
+    def generate(self, input, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.delay)
+            return [{'text': 'ok'}]
+        finally:
+            self.running -= 1
+
+
+def _wav(seconds=0.5, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.sin(np.arange(int(seconds * rate)) / 5) * 3000).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def model():
+    fake = FakeModel()
+    api.registry.loader = lambda name: fake
+    api.initialize_model(MODEL)
+    api.readiness.mark(MODEL, READY)
+    return fake
+
+
+def _burst(count):
+    """同时发出 count 个 /transcribe，返回 [(状态码, 耗时秒)]"""
+    body = _wav()
+
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            async def post():
+                start = time.perf_counter()
+                response = await client.post(f'/transcribe?model={MODEL}', content=body,
+                                             headers={'content-type': 'audio/wav'})
+                return response.status_code, time.perf_counter() - start
+            return await asyncio.gather(*[post() for _ in range(count)])
+
+    return asyncio.run(main())
+
+
+def test_burst_queues_for_model_slots(model):
+    slots = api.registry.concurrency(MODEL)
+    count = slots * 3
+    assert count < asgi.inference.max_pending
+
+    results = _burst(count)
+    assert [status for status, _ in results] == [200] * count
+    # 同时推理的数量不超过模型名额，多出的请求排队而不是被拒绝
+    assert model.peak == slots
+    assert max(elapsed for _, elapsed in results) >= 3 * DELAY_S
+    assert asgi.frontend_stats['queued'] == 0
+    assert asgi.inference.pending == 0
+
+
+def test_queue_timeout_returns_429(model, monkeypatch):
+    slots = api.registry.concurrency(MODEL)
+    monkeypatch.setattr(model, 'delay', 1.0)
+    monkeypatch.setattr(api.registry, 'queue_timeout', 0.2)
+    busy_before = asgi.frontend_stats['model_busy']
+
+    results = _burst(slots * 2)
+    statuses = sorted(status for status, _ in results)
+    assert statuses == [200] * slots + [429] * slots
+    # 超时的请求在 queue_timeout 后返回，而不是等前面的推理完成
+    assert all(elapsed < 0.8 for status, elapsed in results if status == 429)
+    assert asgi.frontend_stats['model_busy'] - busy_before == slots
+    assert asgi.frontend_stats['queued'] == 0
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ffmpeg 转码池测试：预热后 fork 的子进程（API_WORKERS > 1 的预加载路径）
+必须有自己的备用进程与回收线程。
+
+需要 ffmpeg（PATH 中或 FFMPEG_PATH），找不到时跳过。
+
+    python -m pytest websocket-demo/tests/test_ffmpeg_pool.py
+"""
+
+import io
+import os
+import sys
+import time
+import traceback
+import wave
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from audio_decode import FfmpegPool, find_ffmpeg  # noqa: E402
+
+pytestmark = [
+    pytest.mark.skipif(find_ffmpeg() is None, reason="ffmpeg not found"),
+    pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork()"),
+]
+
+IDLE_S = 2.0
+
+
+def _wav(seconds=0.5, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.sin(np.arange(int(seconds * rate)) / 5) * 3000).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def _wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return condition()
+
+
+def _in_child(check):
+    """在 fork 出的子进程中运行 check()，返回子进程的退出码（0 表示通过）"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            check()
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_warm_and_reap():
+    pool = FfmpegPool(max_size=2, spares=1, idle_s=IDLE_S)
+    try:
+        pool.warm()
+        assert pool.stats()['spare'] == 1
+        assert len(pool.decode(_wav())) == 8000
+        assert _wait_for(lambda: pool.stats()['spare'] == 1, 5)
+        assert _wait_for(lambda: pool.reaped >= 1, IDLE_S + 5)
+        assert pool.stats()['spare'] == 0
+    finally:
+        pool.close()
+
+
+def test_forked_worker_reaps_its_own_spares():
+    # 父进程不在测试期间回收，子进程里再缩短空闲时间
+    pool = FfmpegPool(max_size=2, spares=1, idle_s=3600)
+    pool.warm()  # 父进程预热，随后 fork，与 serve_preforked 相同
+    parent_spare = pool._spare[0]
+
+    def check():
+        # 父进程的备用进程与回收线程不属于子进程
+        assert pool.stats()['spare'] == 0
+        assert pool._reaper is None
+        assert pool.spawned == 0
+        pool.idle_s = IDLE_S
+
+        assert len(pool.decode(_wav())) == 8000
+        assert _wait_for(lambda: pool.stats()['spare'] == 1, 5)
+        assert pool._reaper is not None and pool._reaper.is_alive()
+        assert _wait_for(lambda: pool.reaped >= 1, IDLE_S + 5)
+        assert pool.stats()['spare'] == 0
+
+    try:
+        assert _in_child(check) == 0
+        # 父进程的备用进程不受子进程影响
+        assert parent_spare.poll() is None
+        assert pool.stats()['spare'] == 1
+    finally:
+        pool.close()
+
+
+def test_one_refill_per_decode():
+    pool = FfmpegPool(max_size=3, spares=1, idle_s=0)
+    try:
+        pool.warm()
+        for _ in range(5):
+            pool.decode(_wav(0.1))
+            assert _wait_for(lambda: pool.stats()['spare'] == 1 and not pool._warming, 5)
+        stats = pool.stats()
+        assert stats['spare'] == 1
+        # 预热 1 个 + 每次取用后补 1 个，不会多开
+        assert stats['spawned'] == 1 + 5
+    finally:
+        pool.close()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程 worker 池
+
+父进程加载完模型后 fork 出 N 个 worker，模型权重通过写时复制在 worker 之间共享。
+WebSocket 服务的 worker 各自运行事件循环，以 SO_REUSEPORT 绑定同一端口，
+由内核在 worker 之间分配新连接；HTTP 服务的 worker 共用父进程创建的监听套接字。
+父进程只做监督：收集心跳、汇报每个 worker 的健康状态与内存（RSS / PSS）、
+重启退出的 worker。
+
+环境变量：
+    WSS_WORKERS        WebSocket 服务的 worker 进程数（默认 1，即单进程运行）
+    WSS_TORCH_THREADS  每个 worker 的 torch 线程数（默认 CPU 核数 / worker 数）
+"""
+
+import asyncio
+import functools
+import gc
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WSS_WORKERS = int(os.getenv("WSS_WORKERS", "1"))
+WSS_TORCH_THREADS = int(os.getenv("WSS_TORCH_THREADS", "0"))
+
+HEARTBEAT_INTERVAL = 5      # worker 上报心跳的间隔（秒）
+HEALTH_LOG_INTERVAL = 30    # 父进程打印健康汇总的间隔（秒）
+
+# 当前进程的 worker 状态，由 tracked() 维护
+worker_state = {
+    'worker_id': 0,
+    'pid': os.getpid(),
+    'connections': 0,
+    'connections_total': 0,
+}
+
+
+def tracked(handler):
+    """包装 WebSocket 处理函数，统计当前 worker 的连接数"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        worker_state['connections'] += 1
+        worker_state['connections_total'] += 1
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            worker_state['connections'] -= 1
+    return wrapper
+
+
+def supports_reuse_port():
+    return hasattr(socket, 'SO_REUSEPORT') and 'fork' in multiprocessing.get_all_start_methods()
+
+
+def supports_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def set_torch_threads(num_threads):
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def memory_usage(pid='self'):
+    """
+    读取 /proc/<pid>/smaps_rollup，返回以 MB 计的 rss / pss / shared / private
+
+    PSS 把共享页按共享进程数均摊：各 worker 的 PSS 之和远小于 RSS 之和，
+    说明模型权重确实是共享的。不支持的平台返回 None。
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    usage = {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    usage[fields[name]] += int(value.split()[0])  # kB
+    except (OSError, ValueError):
+        return None
+    return {k: round(v / 1024, 1) for k, v in usage.items()}
+
+
+def _heartbeat(health_queue):
+    while True:
+        health_queue.put(dict(worker_state, time=time.time(), memory=memory_usage()))
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def _worker_main(run, worker_id, torch_threads, health_queue):
+    worker_state.update(worker_id=worker_id, pid=os.getpid(), connections=0, connections_total=0)
+    set_torch_threads(torch_threads)
+    logger.info(f"Worker {worker_id} started (pid {os.getpid()}, torch threads {torch_threads})")
+    threading.Thread(target=_heartbeat, args=(health_queue,), name='heartbeat', daemon=True).start()
+    try:
+        run()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(serve, num_workers=WSS_WORKERS, torch_threads=WSS_TORCH_THREADS):
+    """
+    运行 WebSocket 服务
+
+    Args:
+        serve: 协程函数 serve(reuse_port=False)，在当前进程里启动服务并一直运行
+        num_workers: worker 进程数，<= 1 时直接在当前进程运行
+        torch_threads: 每个 worker 的 torch 线程数，0 表示按核数平均分配
+    """
+    if num_workers > 1 and not supports_reuse_port():
+        logger.warning("SO_REUSEPORT / fork not available on this platform, running a single worker")
+        num_workers = 1
+
+    if num_workers <= 1:
+        if torch_threads:
+            set_torch_threads(torch_threads)
+        asyncio.run(serve(reuse_port=False))
+        return
+
+    supervise(lambda: asyncio.run(serve(reuse_port=True)), num_workers, torch_threads)
+
+
+def supervise(run, num_workers, torch_threads=0):
+    """
+    fork 出 num_workers 个 worker 执行 run()，父进程监督并重启退出的 worker
+
+    调用前应已在父进程中加载好模型；fork 前执行 gc.freeze()，
+    避免垃圾回收扫描时改写对象头，把共享页复制到每个 worker。
+    """
+    if not torch_threads:
+        torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    gc.collect()
+    gc.freeze()
+
+    ctx = multiprocessing.get_context('fork')
+    health_queue = ctx.Queue()
+    workers = {}
+    health = {}
+
+    def spawn(worker_id):
+        process = ctx.Process(
+            target=_worker_main,
+            args=(run, worker_id, torch_threads, health_queue),
+            name=f"worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        workers[worker_id] = process
+
+    logger.info(f"Starting {num_workers} workers (torch threads per worker: {torch_threads})")
+    for worker_id in range(num_workers):
+        spawn(worker_id)
+
+    last_log = time.time()
+    try:
+        while True:
+            try:
+                beat = health_queue.get(timeout=1)
+                health[beat['worker_id']] = beat
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            for worker_id, process in list(workers.items()):
+                if not process.is_alive():
+                    logger.error(f"Worker {worker_id} (pid {process.pid}) exited with code "
+                                 f"{process.exitcode}, restarting")
+                    health.pop(worker_id, None)
+                    spawn(worker_id)
+
+            if now - last_log >= HEALTH_LOG_INTERVAL:
+                last_log = now
+                _log_health(workers, health, now)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=5)
+
+
+def _log_health(workers, health, now):
+    total_rss = total_pss = 0
+    for worker_id in sorted(workers):
+        beat = health.get(worker_id)
+        if beat is None:
+            logger.warning(f"Worker {worker_id}: no heartbeat yet")
+            continue
+        age = now - beat['time']
+        status = 'ok' if age < HEARTBEAT_INTERVAL * 3 else 'stale'
+        memory = beat.get('memory')
+        memory_text = ""
+        if memory:
+            total_rss += memory['rss']
+            total_pss += memory['pss']
+            memory_text = (f", RSS {memory['rss']:.0f}MB PSS {memory['pss']:.0f}MB "
+                           f"(shared {memory['shared']:.0f}MB, private {memory['private']:.0f}MB)")
+        logger.info(f"Worker {worker_id} pid {beat['pid']} [{status}] "
+                    f"connections {beat['connections']} "
+                    f"(total {beat['connections_total']}), heartbeat {age:.0f}s ago{memory_text}")
+    if total_rss:
+        parent = memory_usage() or {'pss': 0}
+        logger.info(f"Workers total: RSS {total_rss:.0f}MB, PSS {total_pss:.0f}MB "
+                    f"(+ parent PSS {parent['pss']:.0f}MB); PSS well below RSS means the weights are shared")